@@ -12,10 +12,14 @@ from settings import Settings
 
 AUDIO_SAMPLE_RATE = 44100
 AUDIO_FADE_CUTOFF = .001
+# Sample generation stops once z moves less than this in an iteration (converged to a point)
+AUDIO_CONVERGENCE_DISTANCE = 1E-6
 
 class FracAudioSource:
     # use Julia mode if julia_point is not None
-    def __init__(self, syn: "Synthesizer", fractal: FractalType, point: complex, julia_point: Optional[complex], amp: float):
+    # play=False only creates the source, its samples can be generated with _audioGenerator (benchmarks)
+    def __init__(self, syn: "Synthesizer", fractal: FractalType, point: complex, julia_point: Optional[complex], amp: float,
+                 play: bool = True):
         self.syn = syn
         self.settings = syn.settings
 
@@ -36,6 +40,9 @@ class FracAudioSource:
         self.frame = 0
         self.total_time = 0.
 
+        self.stream = None
+        if not play:
+            return
         self.stream = miniaudio.PlaybackDevice(
             output_format=miniaudio.SampleFormat.FLOAT32,
             nchannels=2,
@@ -57,23 +64,24 @@ class FracAudioSource:
         extras = sample_id_start - self.sample_buffer_first_id
         del self.sample_buffer[:extras]
 
-        max_squared = self.settings.audio_escape_threshold ** 2
-
-        for i in range(sample_id_end - self.sample_id):
-            # time.sleep(.1)
-            # print(self.frac_z)
-            try:
-                new_z = self.fractal.py_func(self.frac_z, self.frac_c)
-            except ArithmeticError as e:
-                logging.warning(f"Audio sample gen failed: {e}")
-                return sample_id_end - self.sample_id
-            if abs(new_z - self.frac_z) < 1E-6 or new_z.real*new_z.real + new_z.imag*new_z.imag > max_squared:
+        missing = sample_id_end - self.sample_id
+        if missing > 0:
+            samples = np.empty(missing, dtype=np.complex128)
+            count, error = self.fractal.orbit_func(
+                self.frac_z, self.frac_c, samples, missing,
+                self.settings.audio_escape_threshold ** 2, AUDIO_CONVERGENCE_DISTANCE ** 2
+            )
+            if error is not None:
+                # The samples before the error are kept
+                logging.warning(f"Audio sample gen failed: {error}")
+            elif count < missing:  # escaped or converged
                 self.iter_stopped = True
-                break
-            self.frac_z = new_z
-            self.sample_sum += self.frac_z
-            self.sample_buffer.append(self.frac_z)
-            self.sample_id += 1
+            if count > 0:
+                samples = samples[:count]
+                self.frac_z = complex(samples[-1])
+                self.sample_sum += complex(samples.sum())
+                self.sample_buffer.extend(samples.tolist())
+                self.sample_id += count
 
         self.sample_buffer_first_id = sample_id_start
 
@@ -0,0 +1,369 @@
+"""
+Benchmarks of the CPU hot paths, to tell whether a change makes things slower.
+
+Every benchmark is timed over several repeats (each one running for at least MIN_REPEAT_TIME), the median and the
+fastest repeat are reported per unit of work (an iteration, an audio block...). Random inputs are seeded, so runs are
+reproducible. Results are written as JSON together with information about the machine they were measured on.
+
+    python benchmark.py run -o before.json
+    python benchmark.py run -o after.json --filter py_func
+    python benchmark.py compare before.json after.json --threshold .1
+"""
+import argparse
+import datetime
+import fnmatch
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Tuple, Dict
+
+import numpy as np
+
+import fractals
+from settings import Settings, AudioInterpolations
+
+MIN_REPEAT_TIME = .2  # seconds
+REPEATS = 5
+SEED = 1234
+# Slower than this (relative to the base) counts as a regression in compare mode
+DEFAULT_THRESHOLD = .1
+
+
+@dataclass
+class Benchmark:
+    name: str
+    unit: str
+    # Prepares the inputs (not timed), returns the function to time and the units of work it does per call
+    setup: Callable[[], Tuple[Callable[[], None], int]]
+
+
+BENCHMARKS: List[Benchmark] = []
+
+
+def benchmark(name: str, unit: str):
+    def decorator(setup: Callable[[], Tuple[Callable[[], None], int]]):
+        BENCHMARKS.append(Benchmark(name, unit, setup))
+        return setup
+    return decorator
+
+
+# ----- Fractal functions -----
+def _pyFuncSetup(fractal: fractals.FractalType):
+    def setup():
+        func, count = fractal.py_func, 10000
+        rng = random.Random(SEED)
+        inputs = [(complex(rng.uniform(-1, 1), rng.uniform(-1, 1)), complex(rng.uniform(-1, 1), rng.uniform(-1, 1)))
+                  for _ in range(count)]
+
+        def run():
+            for z, c in inputs:
+                func(z, c)
+        return run, count
+    return setup
+
+
+def _orbitFuncSetup(fractal: fractals.FractalType):
+    def setup():
+        kernel, count = fractal.orbit_func, 10000
+        out = np.empty(count, dtype=np.complex128)
+        # Douady rabbit, a period 3 orbit (of the Mandelbrot set) that neither escapes nor converges
+        z = c = complex(-.12, .75)
+
+        def run():
+            kernel(z, c, out, count, float("inf"), 0.)
+        return run, count
+    return setup
+
+
+for _fractal in fractals.FRACTALS:
+    benchmark(f"py_func/{_fractal.name}", "iteration")(_pyFuncSetup(_fractal))
+    benchmark(f"orbit_func/{_fractal.name}", "iteration")(_orbitFuncSetup(_fractal))
+
+
+@benchmark("path/_updatePath", "iteration")
+def _updatePathSetup():
+    from gdmath import Vec2
+    from fractal_render import FractalRenderer
+
+    settings = Settings()
+    settings.fractal = fractals.byName("Mandelbrot")
+    # Only the path state is needed, not a GL context
+    renderer = FractalRenderer.__new__(FractalRenderer)
+    renderer._settings = settings
+    renderer.path_buffer = []
+    renderer.frame_time = 0.
+    iterations = 10000
+
+    def run():
+        # Douady rabbit, a period 3 orbit that neither escapes nor converges
+        renderer.startPathVisualization(Vec2(-.12, .75))
+        renderer._updatePath(iterations / settings.path_speed)
+    return run, iterations
+
+
+# ----- Audio -----
+def _audioSetup(interpolation: AudioInterpolations):
+    def setup():
+        from audio import Synthesizer, FracAudioSource
+
+        settings = Settings()
+        settings.interpolation = interpolation
+        synthesizer = Synthesizer(settings)
+        source = FracAudioSource(synthesizer, fractals.byName("Mandelbrot"), complex(-.12, .75), None, 1., play=False)
+        generator = source._audioGenerator()
+        next(generator)
+        block = 1024  # frames
+
+        def run():
+            generator.send(block)
+        return run, 1
+    return setup
+
+
+for _interpolation in AudioInterpolations:
+    benchmark(f"audio/_audioGenerator/{_interpolation.name}", "block of 1024 frames")(_audioSetup(_interpolation))
+
+
+# ----- Rendering -----
+@benchmark("render/reloadColorPalette", "call")
+def _reloadColorPaletteSetup():
+    import moderngl
+    from fractal_render import FractalRenderer
+
+    renderer = FractalRenderer.__new__(FractalRenderer)
+    renderer._ctx = moderngl.create_standalone_context()
+    renderer._settings = Settings()
+    renderer._color_palette_tex = None
+    renderer._color_program = None  # nothing to recolor
+
+    def run():
+        renderer.reloadColorPalette()
+        renderer._ctx.finish()
+    return run, 1
+
+
+@benchmark("render/setFractal", "switch")
+def _setFractalSetup():
+    from headless_render import HeadlessRenderer
+
+    renderer = HeadlessRenderer((64, 64))
+    fractal_types = [fractals.byName("Mandelbrot"), fractals.byName("Burning Ship")]
+    for fractal in fractal_types:  # compiled once, switching back gets them from the program cache
+        renderer.renderer.setFractal(fractal)
+
+    def run():
+        for fractal in fractal_types:
+            renderer.renderer.setFractal(fractal)
+        renderer.ctx.finish()
+    return run, len(fractal_types)
+
+
+# ----- Fractal function compiler -----
+_FRACTAL_FUNCTION_SOURCES = (
+    "return z ** 2 + c",
+    "return z ** 5 - z * c + 0.5",
+    "return (z * z * z) / (1 + z * z) + c * 0.5",
+)
+
+
+@benchmark("compiler/FractalFunction.resolve", "function")
+def _resolveSetup():
+    from fractal.func import FractalFunction
+
+    def run():
+        # A function can only be resolved once
+        for source in _FRACTAL_FUNCTION_SOURCES:
+            FractalFunction(source).resolve()
+    return run, len(_FRACTAL_FUNCTION_SOURCES)
+
+
+@benchmark("compiler/NumPyKernel", "element")
+def _numPyKernelSetup():
+    from fractal.func import FractalFunction
+
+    func = FractalFunction(_FRACTAL_FUNCTION_SOURCES[2])
+    func.resolve(compile_glsl=False)
+    rng = np.random.default_rng(SEED)
+    count = 100000
+    z = rng.uniform(-1, 1, count) + 1j * rng.uniform(-1, 1, count)
+    c = rng.uniform(-1, 1, count) + 1j * rng.uniform(-1, 1, count)
+    out = np.empty_like(z)
+
+    def run():
+        func.callArrays(z, c, out)
+    return run, count
+
+
+@benchmark("compiler/genFractalExpression", "expression")
+def _genFractalExpressionSetup():
+    import random_fractal_expression_generator as generator
+
+    generator.DEBUG_PRINT = False
+    count = 100
+
+    def run():
+        random.seed(SEED)
+        for _ in range(count):
+            generator.genFractalExpression(1, .8)
+    return run, count
+
+
+@benchmark("compiler/generated py_func", "iteration")
+def _generatedPyFuncSetup():
+    import random_fractal_expression_generator as generator
+
+    generator.DEBUG_PRINT = False
+    random.seed(SEED)
+    # Optimized by the compiler (fractal/optimize.py)
+    funcs = [fractals._runtimeFractalType("", "", generator.genFractalExpression(1, .8)[0], "").py_func for _ in range(20)]
+    rng = np.random.default_rng(SEED)
+    points = [(complex(*rng.uniform(-1, 1, 2)), complex(*rng.uniform(-1, 1, 2))) for _ in range(50)]
+
+    def run():
+        for func in funcs:
+            for z, c in points:
+                try:
+                    func(z, c)
+                except ArithmeticError:
+                    pass
+    return run, len(funcs) * len(points)
+
+
+# ----- Runner -----
+def machineInfo() -> dict:
+    info = {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "numpy": np.__version__,
+    }
+    try:
+        info["commit"] = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        info["commit"] = None
+    return info
+
+
+def timeBenchmark(bench: Benchmark, repeats: int = REPEATS) -> dict:
+    run, units = bench.setup()
+    run()  # warm up (caches, lazy imports)
+    # Calls per repeat, so every repeat runs for at least MIN_REPEAT_TIME
+    start = time.perf_counter()
+    run()
+    calls = max(1, int(MIN_REPEAT_TIME / max(time.perf_counter() - start, 1E-9)))
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(calls):
+            run()
+        times.append((time.perf_counter() - start) / (calls * units) * 1E9)
+    return {
+        "unit": bench.unit,
+        "median_ns": statistics.median(times),
+        "min_ns": min(times),
+        "repeats_ns": times,
+    }
+
+
+def runBenchmarks(patterns: List[str] = None, repeats: int = REPEATS, progress: bool = True) -> dict:
+    """Time the benchmarks whose names match any of the patterns (fnmatch, or substrings), all by default."""
+    results, skipped = {}, {}
+    for bench in BENCHMARKS:
+        if patterns and not any(fnmatch.fnmatch(bench.name, p) or p in bench.name for p in patterns):
+            continue
+        try:
+            results[bench.name] = timeBenchmark(bench, repeats)
+        except Exception as e:  # a missing dependency or no GL context
+            skipped[bench.name] = f"{type(e).__name__}: {e}"
+            if progress:
+                print(f"{bench.name:<45} skipped ({skipped[bench.name]})", file=sys.stderr)
+            continue
+        if progress:
+            result = results[bench.name]
+            print(f"{bench.name:<45} {_formatTime(result['median_ns']):>10} per {bench.unit}", file=sys.stderr)
+    return {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "machine": machineInfo(),
+        "settings": {"repeats": repeats, "min_repeat_time": MIN_REPEAT_TIME, "seed": SEED},
+        "results": results,
+        "skipped": skipped,
+    }
+
+
+def compareResults(base: dict, new: dict, threshold: float = DEFAULT_THRESHOLD) -> Tuple[List[str], Dict[str, float]]:
+    """Returns the report lines and the time ratios (new / base) of the benchmarks that are slower than the threshold."""
+    lines, regressions = [], {}
+    setup = lambda results: {k: v for k, v in results["machine"].items() if k != "commit"}
+    if setup(base) != setup(new):
+        lines.append("Warning: the results come from different machines or setups")
+    for name in sorted(set(base["results"]) | set(new["results"])):
+        if name not in base["results"] or name not in new["results"]:
+            lines.append(f"{name:<45} {'only in ' + ('new' if name in new['results'] else 'base'):>32}")
+            continue
+        base_ns, new_ns = base["results"][name]["median_ns"], new["results"][name]["median_ns"]
+        ratio = new_ns / base_ns
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  REGRESSION"
+            regressions[name] = ratio
+        elif ratio < 1 / (1 + threshold):
+            mark = "  faster"
+        lines.append(f"{name:<45} {_formatTime(base_ns):>10} -> {_formatTime(new_ns):>10} {ratio - 1:>+8.1%}{mark}")
+    return lines, regressions
+
+
+def _formatTime(ns: float) -> str:
+    for unit, scale in (("s", 1E9), ("ms", 1E6), ("us", 1E3)):
+        if ns >= scale:
+            return f"{ns / scale:.2f} {unit}"
+    return f"{ns:.1f} ns"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the CPU hot paths (see the module docstring).")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("-o", "--output", help="JSON file for the results")
+    run_parser.add_argument("--filter", nargs="+", help="only the benchmarks matching any of these (glob or substring)")
+    run_parser.add_argument("--repeats", type=int, default=REPEATS)
+    run_parser.add_argument("--list", action="store_true", help="only list the benchmarks")
+    compare_parser = commands.add_parser("compare", help="compare two result files, exits with 1 on regressions")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help=f"relative slowdown that counts as a regression (default: {DEFAULT_THRESHOLD})")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        if args.list:
+            for bench in BENCHMARKS:
+                print(f"{bench.name:<45} per {bench.unit}")
+            return
+        results = runBenchmarks(args.filter, args.repeats)
+        if args.output is not None:
+            with open(args.output, "w") as file:
+                json.dump(results, file, indent=2)
+    else:
+        with open(args.base) as base_file, open(args.new) as new_file:
+            base, new = json.load(base_file), json.load(new_file)
+        lines, regressions = compareResults(base, new, args.threshold)
+        print("\n".join(lines))
+        if regressions:
+            print(f"{len(regressions)} regression(s) past {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
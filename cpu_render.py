@@ -0,0 +1,298 @@
+"""
+Headless (NumPy) escape-time renderer.
+Mirrors fractal() and main() in shaders/main.frag, so images can be rendered without a GL context.
+"""
+from dataclasses import dataclass
+from typing import Callable, Tuple, Optional
+
+import numpy as np
+
+import fractals
+from double_double import ComplexDoubleDouble
+from fractal.func import FractalFunction
+from fractal.transformation import Transformation
+from settings import Settings, Precisions, requiredPrecision
+from utils import color_utils
+
+Kernel = Callable[[np.ndarray, np.ndarray], np.ndarray]
+InteriorFunc = Callable[[np.ndarray], np.ndarray]
+
+# Rectangles smaller than this are iterated entirely instead of being subdivided further
+SUBDIVISION_MIN_SIZE = 6
+
+
+@dataclass
+class EscapeTimeResult:
+    iterations: np.ndarray  # int32, equals max_iterations for pixels that didn't escape
+    z: np.ndarray  # the final z of every pixel (the first z that escaped, or the z after max_iterations), NaN for skipped pixels
+    max_iterations: int
+    skipped_pixels: int = 0  # pixels that were filled in by rectangle subdivision instead of being iterated
+
+    @property
+    def escaped(self) -> np.ndarray:
+        return self.iterations != self.max_iterations
+
+
+def resolveKernel(fractal: fractals.FractalType | FractalFunction | Kernel) -> Kernel:
+    """Get the array version of the fractal function."""
+    if isinstance(fractal, fractals.FractalType):
+        if fractal.np_func is None:
+            raise ValueError(f"Fractal type '{fractal.name}' has no NumPy function")
+        return fractal.np_func
+    if isinstance(fractal, FractalFunction):
+        return fractal.callArrays
+    return fractal
+
+
+def canSubdivide(fractal: fractals.FractalType | FractalFunction | Kernel) -> bool:
+    """Only built-in fractal types are known to be simply connected."""
+    return isinstance(fractal, fractals.FractalType) and fractal.simply_connected
+
+
+def resolveInteriorFunc(fractal: fractals.FractalType | FractalFunction | Kernel) -> Optional[InteriorFunc]:
+    """Get the analytic interior test of the fractal (see FractalType.np_interior_func), None if there is none."""
+    if isinstance(fractal, fractals.FractalType):
+        return fractal.np_interior_func
+    return None
+
+
+def pixelPositions(view: Transformation, size: Tuple[int, int], precision: Precisions = Precisions.Double,
+                   rect: Tuple[int, int, int, int] = None) -> np.ndarray | ComplexDoubleDouble:
+    """
+    Fractal coordinates of the center of every pixel (same as "position" in main.frag), shape is (height, width).
+    Row 0 is the top of the image.
+    In double-double precision, the offsets from the center are computed in double precision and added to it exactly.
+
+    :param rect: only get the pixels in this (x, y, width, height) rectangle of the image
+    """
+    width, height = size
+    x0, y0, rect_width, rect_height = rect if rect is not None else (0, 0, width, height)
+    real_type = np.float64 if precision.uses_doubles else np.float32
+    aspect_ratio = width / height
+    ndr_x = (np.arange(x0, x0 + rect_width, dtype=real_type) + .5) / real_type(width) * 2 - 1
+    ndr_y = -((np.arange(y0, y0 + rect_height, dtype=real_type) + .5) / real_type(height) * 2 - 1)
+    scale = real_type(view.scale)
+    if precision is Precisions.DoubleDouble:
+        offsets = fractals.np_complex(ndr_x[np.newaxis, :] * aspect_ratio * scale, ndr_y[:, np.newaxis] * scale)
+        return offsets + ComplexDoubleDouble.fromDecimal(*view.center)
+    xs = ndr_x * real_type(aspect_ratio) * scale + real_type(view.translation[0])
+    ys = ndr_y * scale + real_type(view.translation[1])
+    return fractals.np_complex(xs[np.newaxis, :], ys[:, np.newaxis])
+
+
+def _keepPrecision(z, c: np.ndarray | ComplexDoubleDouble):
+    """Kernels may change the precision (float32 arrays with python floats...), convert z back to the precision of c."""
+    if isinstance(c, ComplexDoubleDouble):
+        return ComplexDoubleDouble.of(z)
+    return z.astype(c.dtype, copy=False)
+
+
+def escapeTime(kernel: Kernel, c: np.ndarray | ComplexDoubleDouble, iterations: int, escape_threshold: float, z: np.ndarray = None,
+               periodicity_threshold: float = 0., interior_func: InteriorFunc = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Iterate z = kernel(z, c) until |z| > escape_threshold, for every element.
+    Only the elements that haven't escaped yet are iterated.
+    Elements are also dropped (as never escaping) once their orbit is found to be periodic, same as fractal() in main.frag.
+
+    :param c: complex array, or ComplexDoubleDouble to iterate in double-double precision (the final z is complex128 then)
+    :param z: the starting z, c is used if None
+    :param periodicity_threshold: squared distance for the periodicity check (see fractals.periodicityThreshold), 0 to disable it
+    :param interior_func: analytic interior test, elements it is true for aren't iterated at all
+    :returns: iteration counts (int32, the iteration at which z escaped, or the iteration limit) and the final z
+    """
+    shape = c.shape
+    c = c.ravel()
+    z = c.copy() if z is None else np.array(z, dtype=c.dtype).ravel()
+    real_type = np.float32 if c.dtype == np.complex64 else np.float64
+    threshold = real_type(escape_threshold) ** 2
+    periodicity_threshold = real_type(periodicity_threshold)
+
+    iters = np.full(c.size, iterations, dtype=np.int32)
+    z_out = np.empty_like(c)
+    active = np.arange(c.size)
+    if interior_func is not None:
+        interior = interior_func(c)
+        if interior.any():
+            z_out[interior] = z[interior]
+            remaining = ~interior
+            active, z, c = active[remaining], z[remaining], c[remaining]
+
+    # Brent's cycle detection, every element started at the same time, so they share the schedule
+    period_z = z.copy()
+    period_length = 1
+    period_steps = 0
+    with np.errstate(all="ignore"):
+        for it in range(iterations):
+            if active.size == 0:
+                break
+            z = _keepPrecision(kernel(z, c), c)
+            escaped = z.real*z.real + z.imag*z.imag > threshold
+            if periodicity_threshold > 0:
+                delta = z - period_z
+                finished = escaped | (delta.real*delta.real + delta.imag*delta.imag < periodicity_threshold)
+            else:
+                finished = escaped
+            if finished.any():
+                done = active[finished]
+                iters[active[escaped]] = it
+                z_out[done] = z[finished]
+                remaining = ~finished
+                active, z, c, period_z = active[remaining], z[remaining], c[remaining], period_z[remaining]
+
+            period_steps += 1
+            if period_steps == period_length:
+                period_z = z.copy()
+                period_length *= 2
+                period_steps = 0
+    z_out[active] = z
+
+    return iters.reshape(shape), z_out.reshape(shape)
+
+
+def subdivideEscapeTime(kernel: Kernel, c: np.ndarray, iterations: int, escape_threshold: float,
+                        periodicity_threshold: float = 0., interior_func: InteriorFunc = None) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Mariani-Silver subdivision: only the border of a rectangle is iterated, if all of the border pixels got the same
+    iteration count, the inside is filled with it, otherwise the rectangle is split into quarters and checked again.
+    This is only correct for fractals whose sets are simply connected (see FractalType.simply_connected).
+    All rectangles of a subdivision level are iterated together.
+
+    :param c: 2d array of positions
+    :param periodicity_threshold: see escapeTime
+    :param interior_func: see escapeTime
+    :returns: iteration counts, final z (NaN for filled pixels) and the amount of pixels that were filled
+    """
+    height, width = c.shape
+    iters = np.full(c.shape, -1, dtype=np.int32)
+    z = np.full(c.shape, np.nan, dtype=c.dtype)
+    known = np.zeros(c.shape, dtype=bool)
+
+    def iterate(mask: np.ndarray):
+        mask &= ~known
+        ys, xs = np.nonzero(mask)
+        if ys.size == 0:
+            return
+        iters[ys, xs], z[ys, xs] = escapeTime(kernel, c[ys, xs], iterations, escape_threshold, None, periodicity_threshold, interior_func)
+        known[ys, xs] = True
+
+    skipped = 0
+    rects = [(0, 0, width - 1, height - 1)]  # inclusive (x0, y0, x1, y1)
+    small_insides = np.zeros(c.shape, dtype=bool)
+    while rects:
+        # Small rectangles from the last level are iterated together with the borders of this level
+        pending = small_insides
+        for x0, y0, x1, y1 in rects:
+            pending[y0, x0:x1 + 1] = pending[y1, x0:x1 + 1] = True
+            pending[y0:y1 + 1, x0] = pending[y0:y1 + 1, x1] = True
+        iterate(pending)
+
+        small_insides = np.zeros(c.shape, dtype=bool)
+        next_rects = []
+        for x0, y0, x1, y1 in rects:
+            if x1 - x0 < 2 or y1 - y0 < 2:
+                continue  # no inside
+            border = np.concatenate((iters[y0, x0:x1 + 1], iters[y1, x0:x1 + 1], iters[y0:y1 + 1, x0], iters[y0:y1 + 1, x1]))
+            inside = (slice(y0 + 1, y1), slice(x0 + 1, x1))
+            if (border == border[0]).all():
+                fill = ~known[inside]
+                iters[inside][fill] = border[0]
+                known[inside] = True
+                skipped += int(fill.sum())
+            elif x1 - x0 < SUBDIVISION_MIN_SIZE or y1 - y0 < SUBDIVISION_MIN_SIZE:
+                small_insides[inside] = True
+            else:
+                xm = (x0 + x1) // 2
+                ym = (y0 + y1) // 2
+                next_rects += [(x0, y0, xm, ym), (xm, y0, x1, ym), (x0, ym, xm, y1), (xm, ym, x1, y1)]
+        rects = next_rects
+    iterate(small_insides)
+
+    return iters, z, skipped
+
+
+def render(fractal: fractals.FractalType | FractalFunction | Kernel, view: Transformation, size: Tuple[int, int],
+           iterations: int, escape_threshold: float, precision: Precisions = Precisions.Double, subdivide: bool = False,
+           interior_detection: bool = True) -> EscapeTimeResult:
+    """
+    Render the iteration counts of a view, size is (width, height).
+
+    :param precision: Perturbation renders with deep_zoom.render (without subdivision and interior detection)
+    :param subdivide: use rectangle subdivision (subdivideEscapeTime) if the fractal allows it
+    :param interior_detection: stop iterating periodic orbits, and skip points the fractal's interior test is true for
+    """
+    if precision is Precisions.Perturbation:
+        if not getattr(fractal, "perturbation", False):
+            raise ValueError(f"{getattr(fractal, 'name', fractal)} can't be rendered with perturbation")
+        import deep_zoom  # imports this module
+        return deep_zoom.render(view.center, view.scale, size, iterations, escape_threshold)
+    c = pixelPositions(view, size, precision)
+    kernel = resolveKernel(fractal)
+    periodicity_threshold, interior_func = 0., None
+    if interior_detection:
+        periodicity_threshold = fractals.periodicityThreshold(view.scale, size[1])
+        interior_func = resolveInteriorFunc(fractal)
+    if subdivide and canSubdivide(fractal):
+        iters, z, skipped = subdivideEscapeTime(kernel, c, iterations, escape_threshold, periodicity_threshold, interior_func)
+        return EscapeTimeResult(iters, z, iterations, skipped)
+    iters, z = escapeTime(kernel, c, iterations, escape_threshold, None, periodicity_threshold, interior_func)
+    return EscapeTimeResult(iters, z, iterations)
+
+
+def samplePalette(palette: np.ndarray, pos: np.ndarray) -> np.ndarray:
+    """
+    Same as texture(uColorPalette, vec2(pos, .5)).rgb with linear filtering and repeating.
+
+    :param palette: (samples, 4) uint8 palette data (see color_utils.gradientToPalette)
+    :returns: float32 rgb colors, the shape is pos.shape + (3,)
+    """
+    samples = palette.shape[0]
+    x = np.asarray(pos, dtype=np.float32) * np.float32(samples) - np.float32(.5)
+    i0 = np.floor(x)
+    t = (x - i0)[..., np.newaxis]
+    i0 = i0.astype(np.int64) % samples
+    i1 = (i0 + 1) % samples
+    colors = palette[:, :3].astype(np.float32) / np.float32(255)
+    return colors[i0] * (1 - t) + colors[i1] * t
+
+
+def colorize(result: EscapeTimeResult, palette: np.ndarray, color_change_speed: float) -> np.ndarray:
+    """Color the result like fractal() in main.frag (palette for escaped pixels, black for the rest), returns float32 rgb."""
+    palette_pos = result.iterations.astype(np.float32) * np.float32(color_change_speed)
+    colors = samplePalette(palette, palette_pos)
+    colors[~result.escaped] = 0
+    return np.clip(colors, 0, 1)
+
+
+def toRGB8(colors: np.ndarray) -> np.ndarray:
+    return np.round(np.clip(colors, 0, 1) * 255).astype(np.uint8)
+
+
+def settingsPalette(settings: Settings) -> np.ndarray:
+    """The palette texture data of the render settings."""
+    return color_utils.gradientToPalette(settings.color_palette, color_utils.COLOR_PALETTE_SAMPLES, True, settings.color_interpolation)
+
+
+def viewPrecision(settings: Settings, view: Transformation, height: int) -> Precisions:
+    """The precision a view is rendered with: settings.precision, or the one it requires with auto_precision."""
+    if not settings.auto_precision:
+        return settings.precision
+    return requiredPrecision(view.scale, height, max(abs(view.translation[0]), abs(view.translation[1])),
+                             perturbation=settings.fractal.perturbation)
+
+
+def renderImage(settings: Settings, view: Transformation, size: Tuple[int, int]) -> np.ndarray:
+    """Render a view with the render settings, returns a (height, width, 3) uint8 rgb image."""
+    precision = viewPrecision(settings, view, size[1])
+    result = render(settings.fractal, view, size, settings.iterations, settings.render_escape_threshold, precision,
+                    interior_detection=settings.interior_detection)
+    palette = settingsPalette(settings)
+    return toRGB8(colorize(result, palette, settings.color_change_speed))
+
+
+if __name__ == "__main__":
+    import time
+
+    setts = Settings()
+    start = time.perf_counter()
+    image = renderImage(setts, Transformation((-.5, 0), 1.5), (480, 270))
+    print(f"Rendered {image.shape[1]}x{image.shape[0]} in {time.perf_counter() - start:.3f}s")
@@ -0,0 +1,196 @@
+"""
+Perturbation theory deep zoom renderer for the Mandelbrot set (CPU).
+
+A single reference orbit is computed at arbitrary precision (decimal) at the center of the view, every pixel then only
+iterates its difference (delta) to the reference orbit in double precision, which works down to scales of about 1e-300.
+Bilinear approximation (BLA) lets pixels skip many iterations at once while their delta is small,
+and "rebasing" to the start of the reference orbit avoids the glitches of a single reference.
+"""
+import math
+from decimal import Decimal, localcontext
+from typing import Tuple
+
+import numpy as np
+
+import cpu_render
+from fractal.transformation import Transformation
+from settings import Precisions
+
+# Relative error allowed for dropping the non-linear term in a BLA step, the deltas are doubles,
+# so the dropped term has to be below their rounding error (2^-53 relative)
+BLA_EPSILON = np.finfo(np.float64).eps / 2
+
+DecimalLike = Decimal | str | float | int
+
+
+def digitsForScale(scale: float) -> int:
+    """Decimal digits needed for the reference orbit at a scale (with plenty of guard digits)."""
+    return max(20, math.ceil(-math.log10(scale)) + 20)
+
+
+class ReferenceOrbit:
+    """
+    The orbit of z -> z^2 + c starting from z = 0 at the center, computed at arbitrary precision and stored as complex128.
+    z[n] is the n-th iterate, the orbit stops after the first escaping iterate or after max_length iterates.
+    """
+    def __init__(self, center: Tuple[DecimalLike, DecimalLike], max_length: int, escape_threshold: float, digits: int):
+        self.digits = digits
+        self.escape_threshold = escape_threshold
+        threshold = escape_threshold ** 2
+
+        orbit = [0j]
+        with localcontext() as ctx:
+            ctx.prec = digits
+            cr, ci = +Decimal(center[0]), +Decimal(center[1])
+            self.center = (cr, ci)  # rounded to the digits
+            zr = zi = Decimal(0)
+            for _ in range(max_length):
+                zr, zi = zr*zr - zi*zi + cr, 2*zr*zi + ci
+                z = complex(float(zr), float(zi))
+                orbit.append(z)
+                if z.real*z.real + z.imag*z.imag > threshold:
+                    break
+        self.z = np.array(orbit, dtype=np.complex128)
+
+    def __len__(self):
+        return len(self.z)
+
+
+class BLATable:
+    """
+    Bilinear approximations of the reference orbit, level k entry j skips 2^k iterations starting at iterate j * 2^k:
+    if |dz| < radius, then dz after the skip is a * dz + b * dc.
+    All levels are stored in flat arrays, level k starts at offsets[k].
+    """
+    def __init__(self, orbit: ReferenceOrbit, max_dc: float, epsilon: float = BLA_EPSILON):
+        self.steps = len(orbit) - 1  # steps that don't leave the orbit
+        a = 2 * orbit.z[:self.steps]
+        b = np.ones(self.steps, dtype=np.complex128)
+        radius = epsilon * np.abs(a)
+        levels_a, levels_b, levels_radius = [a], [b], [radius]
+
+        # Merge pairs of neighboring entries into the next level
+        while len(a) >= 2:
+            ax, bx, rx = a[0:-1:2], b[0:-1:2], radius[0:-1:2]
+            ay, by, ry = a[1::2], b[1::2], radius[1::2]
+            a = ay * ax
+            b = ay * bx + by
+            with np.errstate(divide="ignore", invalid="ignore"):
+                radius = np.minimum(rx, np.maximum(0, np.nan_to_num((ry - np.abs(bx) * max_dc) / np.abs(ax))))
+            levels_a.append(a)
+            levels_b.append(b)
+            levels_radius.append(radius)
+
+        self.levels = len(levels_a)
+        self.offsets = np.cumsum([0] + [len(r) for r in levels_radius[:-1]])
+        self.a = np.concatenate(levels_a)
+        self.b = np.concatenate(levels_b)
+        self.radius_sqr = np.concatenate(levels_radius) ** 2
+
+
+def _floorLog2(x: np.ndarray) -> np.ndarray:
+    """floor(log2(x)) for positive integers, -1 for the rest."""
+    return np.where(x > 0, np.frexp(np.maximum(x, 1).astype(np.float64))[1] - 1, -1)
+
+
+def perturbationEscapeTime(orbit: ReferenceOrbit, table: BLATable, dc: np.ndarray, iterations: int, escape_threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Iterate every pixel relative to the reference orbit.
+    The results mean the same as cpu_render.escapeTime (main.frag starts at z = c, which is the 1st iterate here).
+
+    :param dc: offsets of the pixels from the reference orbit's center
+    """
+    shape = dc.shape
+    dc = dc.ravel().astype(np.complex128)
+    threshold = escape_threshold ** 2
+    ref = orbit.z
+    ref_end = len(ref) - 1
+    last_n = iterations + 1  # the iterate main.frag stops at
+
+    iters = np.full(dc.size, iterations, dtype=np.int32)
+    z_out = np.empty_like(dc)
+    active = np.arange(dc.size)
+    dz = np.zeros_like(dc)
+    m = np.zeros(dc.size, dtype=np.int64)  # index into the reference orbit
+    n = np.zeros(dc.size, dtype=np.int64)  # iterate of the pixel
+
+    with np.errstate(all="ignore"):
+        while active.size > 0:
+            # Largest usable skip for each pixel, -1 means a normal perturbation step.
+            # A level k skip has to start at a multiple of 2^k, and must not go past the table or the iteration limit.
+            level = np.minimum(_floorLog2(m & -m), _floorLog2(np.minimum(last_n - n, table.steps - m)))
+            level = np.minimum(level, table.levels - 1)
+            dz_abs_sqr = dz.real*dz.real + dz.imag*dz.imag
+            undecided = np.nonzero(level >= 0)[0]
+            while undecided.size > 0:
+                lvl = level[undecided]
+                usable = dz_abs_sqr[undecided] < table.radius_sqr[table.offsets[lvl] + (m[undecided] >> lvl)]
+                failed = undecided[~usable]
+                level[failed] -= 1
+                undecided = failed[level[failed] >= 0]
+
+            skipping = np.nonzero(level >= 0)[0]
+            stepping = np.nonzero(level < 0)[0]
+            if skipping.size > 0:
+                lvl = level[skipping]
+                entry = table.offsets[lvl] + (m[skipping] >> lvl)
+                dz[skipping] = table.a[entry] * dz[skipping] + table.b[entry] * dc[skipping]
+                m[skipping] += 1 << lvl
+                n[skipping] += 1 << lvl
+            if stepping.size > 0:
+                d = dz[stepping]
+                dz[stepping] = (2 * ref[m[stepping]] + d) * d + dc[stepping]
+                m[stepping] += 1
+                n[stepping] += 1
+
+            z = ref[m] + dz
+            z_abs_sqr = z.real*z.real + z.imag*z.imag
+            # main.frag doesn't check its starting point (the 1st iterate)
+            escaped = (z_abs_sqr > threshold) & (n >= 2)
+            finished = escaped | (n >= last_n)
+            if finished.any():
+                iters[active[escaped]] = (n[escaped] - 2).astype(np.int32)
+                z_out[active[finished]] = z[finished]
+                remaining = ~finished
+                active, dz, dc, m, n, z, z_abs_sqr = (arr[remaining] for arr in (active, dz, dc, m, n, z, z_abs_sqr))
+
+            # Rebase: continue from the start of the reference orbit when the pixel gets closer to 0 than to the
+            # reference (the delta would lose precision), or when the reference orbit ends
+            rebase = (z_abs_sqr < dz.real*dz.real + dz.imag*dz.imag) | (m >= ref_end)
+            if rebase.any():
+                dz[rebase] = z[rebase]
+                m[rebase] = 0
+
+    return iters.reshape(shape), z_out.reshape(shape)
+
+
+def render(center: Tuple[DecimalLike, DecimalLike], scale: float, size: Tuple[int, int],
+           iterations: int, escape_threshold: float) -> cpu_render.EscapeTimeResult:
+    """
+    Render a Mandelbrot view, the center is given at arbitrary precision (use strings or Decimals for deep views).
+
+    :param scale: same as Transformation.scale (half the height of the view)
+    """
+    width, height = size
+    orbit = ReferenceOrbit(center, iterations + 1, escape_threshold, digitsForScale(scale))
+    max_dc = scale * math.hypot(width / height, 1)
+    table = BLATable(orbit, max_dc)
+    dc = cpu_render.pixelPositions(Transformation((0, 0), scale), size, Precisions.Double)
+    iters, z = perturbationEscapeTime(orbit, table, dc, iterations, escape_threshold)
+    return cpu_render.EscapeTimeResult(iters, z, iterations)
+
+
+if __name__ == "__main__":
+    import time
+    from settings import Settings
+
+    setts = Settings()
+    start = time.perf_counter()
+    result = render(
+        ("-1.7499972370010620259949538951389839052803662416127079716877622617303935",
+         "0.0000000000000000000000000000000000000000000000000000000000000000000000"),
+        1E-60, (480, 270), 4096, setts.render_escape_threshold
+    )
+    palette = cpu_render.settingsPalette(setts)
+    image = cpu_render.toRGB8(cpu_render.colorize(result, palette, setts.color_change_speed))
+    print(f"Rendered {image.shape[1]}x{image.shape[0]} at 1E-60 in {time.perf_counter() - start:.3f}s")
@@ -0,0 +1,359 @@
+"""
+Double-double arithmetic on NumPy arrays: every real is the unevaluated sum of two float64 (hi + lo, |lo| <= ulp(hi) / 2),
+which gives about 106 bits (32 decimal digits) of precision.
+
+DoubleDouble and ComplexDoubleDouble support the operators and NumPy functions the np_func of the fractal types use,
+so the same functions run in double-double precision (see np_complex in fractal/func.py).
+Transcendental functions (sin, exp, ...) are only computed in double precision, like in main.frag.
+The GLSL version of this is in main.frag (USE_DOUBLE_DOUBLE).
+"""
+import operator
+from decimal import Decimal, localcontext
+from typing import Tuple
+
+import numpy as np
+
+# Splits a double into two halves of 26 bits (Dekker), NumPy has no fused multiply-add
+_SPLITTER = 134217729.  # 2^27 + 1
+
+# Functions that are computed on hi only (in double precision)
+_APPROXIMATED_UFUNCS = {np.sin, np.cos, np.tan, np.sinh, np.cosh, np.exp, np.log, np.sqrt}
+# Binary ufuncs (from NumPy arrays on the left, like ndarray + DoubleDouble) go to the operators
+_BINARY_UFUNCS = {
+    np.add: operator.add, np.subtract: operator.sub, np.multiply: operator.mul, np.true_divide: operator.truediv,
+    np.power: operator.pow, np.less: operator.lt, np.less_equal: operator.le, np.greater: operator.gt,
+    np.greater_equal: operator.ge,
+}
+
+
+def twoSum(a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """a + b = s + e exactly."""
+    s = a + b
+    v = s - a
+    e = (a - (s - v)) + (b - v)
+    return s, e
+
+
+def quickTwoSum(a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Same as twoSum, if |a| >= |b|."""
+    s = a + b
+    e = b - (s - a)
+    return s, e
+
+
+def _split(a: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    t = _SPLITTER * a
+    hi = t - (t - a)
+    return hi, a - hi
+
+
+def twoProd(a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """a * b = p + e exactly."""
+    p = a * b
+    a_hi, a_lo = _split(a)
+    b_hi, b_lo = _split(b)
+    e = ((a_hi * b_hi - p) + a_hi * b_lo + a_lo * b_hi) + a_lo * b_lo
+    return p, e
+
+
+def splitDecimal(value) -> Tuple[float, float]:
+    """The double-double (hi, lo) closest to a decimal (or anything Decimal accepts)."""
+    with localcontext() as ctx:
+        ctx.prec = 60
+        value = Decimal(value)
+        hi = float(value)
+        return hi, float(value - Decimal(hi))
+
+
+def _asDoubleDouble(value):
+    if isinstance(value, (DoubleDouble, ComplexDoubleDouble)):
+        return value
+    value = np.asarray(value)
+    return ComplexDoubleDouble.of(value) if np.iscomplexobj(value) else DoubleDouble(value)
+
+
+def _arrayUfunc(self, ufunc, method, *inputs, **kwargs):
+    if method != "__call__" or kwargs:
+        return NotImplemented
+    if len(inputs) == 2 and ufunc in _BINARY_UFUNCS:
+        return _BINARY_UFUNCS[ufunc](*map(_asDoubleDouble, inputs))
+    if len(inputs) != 1:
+        return NotImplemented
+    if ufunc is np.negative:
+        return -self
+    if ufunc is np.absolute and isinstance(self, DoubleDouble):
+        return abs(self)
+    if ufunc in _APPROXIMATED_UFUNCS:
+        return _asDoubleDouble(ufunc(self.hi if isinstance(self, DoubleDouble) else self.toComplex()))
+    return NotImplemented
+
+
+class DoubleDouble:
+    def __init__(self, hi, lo=None):
+        self.hi = np.asarray(hi, dtype=np.float64)
+        self.lo = np.zeros_like(self.hi) if lo is None else np.asarray(lo, dtype=np.float64)
+
+    @staticmethod
+    def of(value) -> "DoubleDouble":
+        return value if isinstance(value, DoubleDouble) else DoubleDouble(value)
+
+    # ----- Arithmetic -----
+    def __add__(self, other):
+        if isinstance(other, ComplexDoubleDouble):
+            return NotImplemented
+        other = DoubleDouble.of(other)
+        s, e = twoSum(self.hi, other.hi)
+        t, f = twoSum(self.lo, other.lo)
+        s, e = quickTwoSum(s, e + t)
+        return DoubleDouble(*quickTwoSum(s, e + f))
+
+    __radd__ = __add__
+
+    def __neg__(self):
+        return DoubleDouble(-self.hi, -self.lo)
+
+    def __sub__(self, other):
+        if isinstance(other, ComplexDoubleDouble):
+            return NotImplemented
+        return self + -DoubleDouble.of(other)
+
+    def __rsub__(self, other):
+        return DoubleDouble.of(other) - self
+
+    def __mul__(self, other):
+        if isinstance(other, ComplexDoubleDouble):
+            return NotImplemented
+        other = DoubleDouble.of(other)
+        p, e = twoProd(self.hi, other.hi)
+        e += self.hi * other.lo + self.lo * other.hi
+        return DoubleDouble(*quickTwoSum(p, e))
+
+    __rmul__ = __mul__
+
+    def square(self) -> "DoubleDouble":
+        p, e = twoProd(self.hi, self.hi)
+        e += 2 * self.hi * self.lo
+        return DoubleDouble(*quickTwoSum(p, e))
+
+    def __truediv__(self, other):
+        if isinstance(other, ComplexDoubleDouble):
+            return NotImplemented
+        other = DoubleDouble.of(other)
+        # Long division, every step gets about 53 more bits
+        q1 = self.hi / other.hi
+        r = self - other * q1
+        q2 = r.hi / other.hi
+        r = r - other * q2
+        q3 = r.hi / other.hi
+        return DoubleDouble(*quickTwoSum(q1, q2)) + q3
+
+    def __rtruediv__(self, other):
+        return DoubleDouble.of(other) / self
+
+    def __pow__(self, power):
+        if isinstance(power, int) and power >= 1:
+            result = self
+            for _ in range(power - 1):
+                result = result * self
+            return result
+        return DoubleDouble(self.hi ** DoubleDouble.of(power).hi)
+
+    def __rpow__(self, base):
+        return DoubleDouble(np.power(base, self.hi))
+
+    def __abs__(self):
+        negative = self.hi < 0
+        return DoubleDouble(np.where(negative, -self.hi, self.hi), np.where(negative, -self.lo, self.lo))
+
+    # ----- Comparisons (exact) -----
+    def _compare(self, other) -> np.ndarray:
+        diff = self - other
+        return np.where(diff.hi != 0, diff.hi, diff.lo)
+
+    def __lt__(self, other): return self._compare(other) < 0
+    def __le__(self, other): return self._compare(other) <= 0
+    def __gt__(self, other): return self._compare(other) > 0
+    def __ge__(self, other): return self._compare(other) >= 0
+
+    # ----- NumPy -----
+    __array_ufunc__ = _arrayUfunc
+
+    def __array__(self, dtype=None, copy=None):
+        return (self.hi + self.lo).astype(dtype or np.float64)
+
+    def __getitem__(self, item):
+        return DoubleDouble(self.hi[item], self.lo[item])
+
+    def __setitem__(self, key, value):
+        value = DoubleDouble.of(value)
+        self.hi[key] = value.hi
+        self.lo[key] = value.lo
+
+    @property
+    def dtype(self):
+        """The dtype of the values as a NumPy array (see __array__)."""
+        return np.dtype(np.float64)
+
+    @property
+    def shape(self):
+        return self.hi.shape
+
+    @property
+    def size(self):
+        return self.hi.size
+
+    def ravel(self):
+        return DoubleDouble(self.hi.ravel(), self.lo.ravel())
+
+    def reshape(self, *shape):
+        return DoubleDouble(self.hi.reshape(*shape), self.lo.reshape(*shape))
+
+    def copy(self):
+        return DoubleDouble(self.hi.copy(), self.lo.copy())
+
+    def toFloat(self) -> np.ndarray:
+        return self.hi + self.lo
+
+
+class ComplexDoubleDouble:
+    def __init__(self, real: DoubleDouble, imag: DoubleDouble):
+        self.real = DoubleDouble.of(real)
+        self.imag = DoubleDouble.of(imag)
+
+    @staticmethod
+    def of(value) -> "ComplexDoubleDouble":
+        if isinstance(value, ComplexDoubleDouble):
+            return value
+        if isinstance(value, DoubleDouble):
+            return ComplexDoubleDouble(value, DoubleDouble(np.zeros_like(value.hi)))
+        value = np.asarray(value)
+        return ComplexDoubleDouble(DoubleDouble(value.real), DoubleDouble(value.imag if np.iscomplexobj(value) else np.zeros(value.shape)))
+
+    @staticmethod
+    def fromDecimal(real, imag) -> "ComplexDoubleDouble":
+        return ComplexDoubleDouble(DoubleDouble(*splitDecimal(real)), DoubleDouble(*splitDecimal(imag)))
+
+    # ----- Arithmetic -----
+    def __add__(self, other):
+        other = ComplexDoubleDouble.of(other)
+        return ComplexDoubleDouble(self.real + other.real, self.imag + other.imag)
+
+    __radd__ = __add__
+
+    def __neg__(self):
+        return ComplexDoubleDouble(-self.real, -self.imag)
+
+    def __sub__(self, other):
+        return self + -ComplexDoubleDouble.of(other)
+
+    def __rsub__(self, other):
+        return ComplexDoubleDouble.of(other) - self
+
+    def __mul__(self, other):
+        if isinstance(other, DoubleDouble) or not isinstance(other, ComplexDoubleDouble) and np.isrealobj(other):
+            return ComplexDoubleDouble(self.real * other, self.imag * other)
+        other = ComplexDoubleDouble.of(other)
+        if other is self:
+            return self.square()
+        return ComplexDoubleDouble(
+            self.real * other.real - self.imag * other.imag,
+            self.real * other.imag + self.imag * other.real
+        )
+
+    __rmul__ = __mul__
+
+    def square(self) -> "ComplexDoubleDouble":
+        xy = self.real * self.imag
+        return ComplexDoubleDouble(self.real.square() - self.imag.square(), xy + xy)
+
+    def __truediv__(self, other):
+        if isinstance(other, DoubleDouble) or not isinstance(other, ComplexDoubleDouble) and np.isrealobj(other):
+            return ComplexDoubleDouble(self.real / other, self.imag / other)
+        other = ComplexDoubleDouble.of(other)
+        denom = 1 / (other.real.square() + other.imag.square())
+        return ComplexDoubleDouble(
+            (self.real * other.real + self.imag * other.imag) * denom,
+            (self.imag * other.real - self.real * other.imag) * denom
+        )
+
+    def __rtruediv__(self, other):
+        return ComplexDoubleDouble.of(other) / self
+
+    def __pow__(self, power):
+        if isinstance(power, int) and power >= 1:
+            result = self
+            for _ in range(power - 1):
+                result = result * self
+            return result
+        return ComplexDoubleDouble.of(np.power(self.toComplex(), np.asarray(power)))
+
+    def __rpow__(self, base):
+        return ComplexDoubleDouble.of(np.power(base, self.toComplex()))
+
+    # ----- NumPy -----
+    __array_ufunc__ = _arrayUfunc
+
+    def __array__(self, dtype=None, copy=None):
+        return self.toComplex().astype(dtype or np.complex128)
+
+    def __getitem__(self, item):
+        return ComplexDoubleDouble(self.real[item], self.imag[item])
+
+    def __setitem__(self, key, value):
+        value = ComplexDoubleDouble.of(value)
+        self.real[key] = value.real
+        self.imag[key] = value.imag
+
+    @property
+    def dtype(self):
+        """The dtype of the values as a NumPy array (see __array__)."""
+        return np.dtype(np.complex128)
+
+    @property
+    def shape(self):
+        return self.real.shape
+
+    @property
+    def size(self):
+        return self.real.size
+
+    def ravel(self):
+        return ComplexDoubleDouble(self.real.ravel(), self.imag.ravel())
+
+    def reshape(self, *shape):
+        return ComplexDoubleDouble(self.real.reshape(*shape), self.imag.reshape(*shape))
+
+    def copy(self):
+        return ComplexDoubleDouble(self.real.copy(), self.imag.copy())
+
+    def toComplex(self) -> np.ndarray:
+        result = np.empty(self.shape, dtype=np.complex128)
+        result.real = self.real.toFloat()
+        result.imag = self.imag.toFloat()
+        return result
+
+
+if __name__ == "__main__":
+    # Cost of double-double against double for every fractal type (NumPy), run with "python double_double.py"
+    import time
+
+    import cpu_render
+    import fractals
+    from fractal.transformation import Transformation
+    from settings import Precisions
+
+    size, steps = (320, 180), 64
+    view = Transformation((-.5, 0.), 1.5)
+    print(f"{'Fractal':<16} {'double':>10} {'double-double':>14} {'ratio':>6}  (ns per pixel and iteration)")
+    for fractal in fractals.FRACTALS:
+        times = []
+        for precision in (Precisions.Double, Precisions.DoubleDouble):
+            c = cpu_render.pixelPositions(view, size, precision)
+            z = c.copy()
+            start = time.perf_counter()
+            with np.errstate(all="ignore"):
+                # A fixed amount of steps for every pixel, escaping doesn't stop anything
+                for _ in range(steps):
+                    z = fractal.np_func(z, c)
+            times.append((time.perf_counter() - start) / (steps * c.size) * 1E9)
+        print(f"{fractal.name:<16} {times[0]:>10.2f} {times[1]:>14.2f} {times[1] / times[0]:>6.1f}")
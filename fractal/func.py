@@ -1,14 +1,21 @@
 import ast
-from typing import Type, Tuple, Optional, List, Dict, Sequence
+from typing import Type, Tuple, Optional, List, Dict, Sequence, NamedTuple, Callable
 import warnings
 
 import math
 import cmath
 
+import numpy as np
+
+from double_double import DoubleDouble, ComplexDoubleDouble
+from .optimize import optimizeStatements
+from .orbit import OrbitKernel, UnsupportedOrbitExpression, generateOrbitKernel, stepOrbitKernel
+
 
 GLSL_FRACTAL_FUNC_NAME = "fractal_func"
 GLSL_NAME_FORMAT = "_fractal_uniform_%s"
 PY_FRACTAL_FUNC_NAME = "_generated_fractal_function"
+NP_FRACTAL_KERNEL_NAME = "_generated_fractal_kernel"
 
 class CompilationException:
     def __init__(self, reason: str, is_warning: bool, node: ast.AST = None, err: SyntaxError = None):
@@ -57,6 +64,320 @@ class Uniform:
         if old_val != val:
             self.__fractal.updateUniforms()
 
+# Array versions of the functions in the namespace of the python function: (ufunc name, if it takes complex numbers)
+_NP_FUNCTIONS = {
+    "sin": ("sin", False),
+    "cos": ("cos", False),
+    "tan": ("tan", False),
+    "sinh": ("sinh", False),
+    "cosh": ("cosh", False),
+    "exp": ("exp", False),
+    "log": ("log", False),
+    "cx_sin": ("sin", True),
+    "cx_cos": ("cos", True),
+    "cx_tan": ("tan", True),
+    "cx_exp": ("exp", True),
+    "cx_log": ("log", True),
+}
+_NP_BINARY_UFUNCS = {ast.Add: "add", ast.Sub: "subtract", ast.Mult: "multiply", ast.Div: "true_divide", ast.Mod: "remainder", ast.Pow: "power"}
+_PY_BINARY_OPERATORS = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/", ast.Mod: "%", ast.Pow: "**"}
+# Functions of main.frag for the ones in the namespace of the python function: (GLSL name, argument types, result type)
+_GLSL_FUNCTIONS = {
+    "complex": ("cx", (float, float), complex),
+    "dot": ("cx_dot", (complex, complex), float),
+    "cir_dot": ("cx_cir_dot", (complex, complex), complex),
+    "abs": ("f_abs", (float,), float),
+    "sin": ("sinF", (float,), float),
+    "cos": ("cosF", (float,), float),
+    "tan": ("tanF", (float,), float),
+    "sinh": ("sinhF", (float,), float),
+    "cosh": ("coshF", (float,), float),
+    "exp": ("expF", (float,), float),
+    "cx_sin": ("cx_sin", (complex,), complex),
+    "cx_cos": ("cx_cos", (complex,), complex),
+    "cx_exp": ("cx_exp", (complex,), complex),
+}
+_GLSL_TYPES = {int: "int", float: "FLOAT", complex: "VEC2", bool: "bool"}
+
+def cir_dot(a: complex, b: complex) -> complex:
+    return complex(a.real*b.real, a.imag*b.imag)
+
+def dot(a: complex, b: complex) -> float:
+    return a.real*b.real + a.imag*b.imag
+
+def np_complex(re, im) -> np.ndarray:
+    """
+    The array version of complex(re, im), the precision follows the inputs
+    (complex64 for float32 inputs, ComplexDoubleDouble if either is a DoubleDouble).
+    """
+    if isinstance(re, DoubleDouble) or isinstance(im, DoubleDouble):
+        return ComplexDoubleDouble(re, im)
+    re, im = np.broadcast_arrays(re, im)
+    result = np.empty(re.shape, dtype=np.result_type(re, im, np.complex64))
+    result.real = re
+    result.imag = im
+    return result
+
+def np_cir_dot(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np_complex(a.real*b.real, a.imag*b.imag)
+
+def np_dot(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return a.real*b.real + a.imag*b.imag
+
+class _NumPyValue(NamedTuple):
+    expr: str  # a python expression, or the name of a temporary array
+    typ: Type[_VarTypes]
+    array: bool  # scalars (constants and uniforms) are computed with python operators
+    temp: Optional[int] = None  # index of the temporary array holding the value
+
+class _NumPyKernelGenerator:
+    """
+    Turns the statements of a fractal function into ufunc calls that write into temporary arrays (out=),
+    a temporary is reused as soon as the value in it was used, so most operations are in-place.
+    Every ufunc only computes the elements of the _where mask, the result goes into _out.
+    """
+    def __init__(self, variables: List[Tuple[str, Type[_VarTypes]] | Uniform]):
+        self.variables = variables
+        self.lines: List[str] = []
+        self.temp_types: List[Type[_VarTypes]] = []
+        self._free_temps: List[int] = []
+        self._bindings: Dict[str, _NumPyValue] = {}  # assigned variables
+
+    def _allocTemp(self, typ: Type[_VarTypes]) -> int:
+        for i in self._free_temps:
+            if self.temp_types[i] is typ:
+                self._free_temps.remove(i)
+                return i
+        self.temp_types.append(typ)
+        return len(self.temp_types) - 1
+
+    def _release(self, *values: _NumPyValue):
+        for value in values:
+            if value.temp is not None and value.temp not in self._free_temps:
+                self._free_temps.append(value.temp)
+
+    def _ufunc(self, ufunc: str, operands: Sequence[_NumPyValue], typ: Type[_VarTypes], out: Optional[str]) -> _NumPyValue:
+        """Emit a ufunc call, its result goes to out if given, otherwise to a temporary (one of the operands' if possible)."""
+        self._release(*operands)
+        temp = None
+        if out is None:
+            temp = self._allocTemp(typ)
+            out = f"_t{temp}"
+        self.lines.append(f"np.{ufunc}({','.join(o.expr for o in operands)},out={out},where=_where)")
+        return _NumPyValue(out, typ, True, temp)
+
+    # noinspection PyUnresolvedReferences
+    def expression(self, node: ast.AST, out: str = None) -> _NumPyValue:
+        """
+        :param out: array the value should be written to, it only is if the returned value's expr is out
+        """
+        match type(node):
+            case ast.Constant:
+                if type(node.value) not in (int, float, bool):
+                    raise CompilationError(f"Unsupported constant type '{type(node.value)}'", node)
+                return _NumPyValue(repr(node.value), type(node.value), False)
+            case ast.Name:
+                if node.id in self._bindings:
+                    return self._bindings[node.id]
+                typ = FractalFunction._getVarType(node.id, self.variables)
+                if typ is not None:
+                    return _NumPyValue(node.id, typ, node.id in ("z", "c"))
+                if node.id in ("pi", "e"):
+                    return _NumPyValue(node.id, float, False)
+                raise CompilationError(f"Variable '{node.id}' is not defined", node)
+            case ast.Attribute if node.attr in ("real", "imag"):
+                value = self.expression(node.value)
+                if value.typ is complex:
+                    # A view, it keeps the temporary of the complex value until it's used
+                    return _NumPyValue(f"{value.expr}.{node.attr}", float, value.array, value.temp)
+                if not issubclass(value.typ, _NumberAnyType):
+                    raise CompilationError(f"'{value.typ.__name__}' has no attribute '{node.attr}'", node)
+                return value if node.attr == "real" else _NumPyValue("0.0", float, False)
+            case ast.UnaryOp:
+                operand = self.expression(node.operand)
+                match type(node.op):
+                    case ast.UAdd | ast.USub as op_type:
+                        if not issubclass(operand.typ, _NumberAnyType):
+                            raise CompilationError(f"Unary operation not supported for '{operand.typ.__name__}'", node)
+                        if op_type is ast.UAdd:
+                            return operand
+                        if not operand.array:
+                            return _NumPyValue(f"(-{operand.expr})", operand.typ, False)
+                        return self._ufunc("negative", (operand,), operand.typ, out)
+                    case ast.Not:
+                        if operand.typ is not bool:
+                            raise CompilationError(f"Not operation not supported for '{operand.typ.__name__}'", node)
+                        if not operand.array:
+                            return _NumPyValue(f"(not {operand.expr})", bool, False)
+                        return self._ufunc("logical_not", (operand,), bool, out)
+                raise CompilationError(f"Unsupported unary operation '{type(node.op).__name__}'", node)
+            case ast.BinOp:
+                op_type = type(node.op)
+                if op_type not in _NP_BINARY_UFUNCS:
+                    raise CompilationError(f"Unsupported binary operation '{op_type.__name__}'", node)
+                left, right = self.expression(node.left), self.expression(node.right)
+                if not (issubclass(left.typ, _NumberAnyType) and issubclass(right.typ, _NumberAnyType)):
+                    raise CompilationError(f"Binary operations only support numeric types, got '{left.typ.__name__}' and '{right.typ.__name__}'", node)
+                if op_type is ast.Mod and complex in (left.typ, right.typ):
+                    raise CompilationError("Modulo is not supported for complex numbers", node)
+                # Same as python's types
+                typ = int
+                if complex in (left.typ, right.typ):
+                    typ = complex
+                elif float in (left.typ, right.typ) or op_type is ast.Div:
+                    typ = float
+                if not (left.array or right.array):
+                    return _NumPyValue(f"({left.expr}{_PY_BINARY_OPERATORS[op_type]}{right.expr})", typ, False)
+                if op_type is ast.Pow and right.expr in ("2", "3"):
+                    if right.expr == "3":
+                        # left is read again, so the square can't go into its temporary
+                        temp = self._allocTemp(typ)
+                        self.lines.append(f"np.multiply({left.expr},{left.expr},out=_t{temp},where=_where)")
+                        return self._ufunc("multiply", (_NumPyValue(f"_t{temp}", typ, True, temp), left), typ, out)
+                    return self._ufunc("multiply", (left, left), typ, out)
+                return self._ufunc(_NP_BINARY_UFUNCS[op_type], (left, right), typ, out)
+            case ast.Call if type(node.func) is ast.Name and node.func.id in ("complex", "dot", "cir_dot", "abs"):
+                return self._call(node, out)
+            case ast.Call:
+                if type(node.func) is not ast.Name or node.func.id not in _NP_FUNCTIONS or node.keywords or len(node.args) != 1:
+                    raise CompilationError("Unsupported function call", node)
+                ufunc, takes_complex = _NP_FUNCTIONS[node.func.id]
+                arg = self.expression(node.args[0])
+                if not issubclass(arg.typ, _NumberAnyType) or (arg.typ is complex and not takes_complex):
+                    raise CompilationError(f"'{node.func.id}' doesn't take '{arg.typ.__name__}', use 'cx_{node.func.id}' for complex numbers", node)
+                typ = complex if takes_complex else float
+                if not arg.array:
+                    return _NumPyValue(f"{node.func.id}({arg.expr})", typ, False)
+                return self._ufunc(ufunc, (arg,), typ, out)
+            case ast.BoolOp:
+                values = [self.expression(v) for v in node.values]
+                if any(v.typ is not bool for v in values):
+                    raise CompilationError("Boolean operation only supports booleans.", node)
+                if not any(v.array for v in values):
+                    infix = " or " if type(node.op) is ast.Or else " and "
+                    return _NumPyValue(f"({infix.join(v.expr for v in values)})", bool, False)
+                ufunc = "logical_or" if type(node.op) is ast.Or else "logical_and"
+                result = values[0]
+                for value in values[1:]:
+                    result = self._ufunc(ufunc, (result, value), bool, None)
+                return result
+            case ast.IfExp:
+                test, body, orelse = self.expression(node.test), self.expression(node.body), self.expression(node.orelse)
+                if test.typ is not bool:
+                    raise CompilationError(f"Test expression must evaluate to a boolean, got {test.typ.__name__}.", node)
+                if body.typ is not orelse.typ:
+                    raise CompilationError(f"Branches of if expression must evaluate to the same type, got {body.typ.__name__} and {orelse.typ.__name__}.", node)
+                if not (test.array or body.array or orelse.array):
+                    return _NumPyValue(f"({body.expr} if {test.expr} else {orelse.expr})", body.typ, False)
+                # Both branches were computed, take the body's elements where the test is true
+                temp = self._allocTemp(body.typ)
+                self.lines.append(f"np.copyto(_t{temp},{orelse.expr},where=_where)")
+                self.lines.append(f"np.copyto(_t{temp},{body.expr},where={test.expr})")
+                self._release(test, body, orelse)
+                return _NumPyValue(f"_t{temp}", body.typ, True, temp)
+        raise CompilationError(f"Unsupported operation {type(node).__name__}.", node)
+
+    def _call(self, node: ast.Call, out: Optional[str]) -> _NumPyValue:
+        """complex(), dot(), cir_dot() and abs(), they work on the real and imaginary parts."""
+        name = node.func.id
+        if node.keywords or len(node.args) != (1 if name == "abs" else 2):
+            raise CompilationError(f"Wrong arguments for '{name}'", node)
+        args = [self.expression(arg) for arg in node.args]
+        expected = float if name == "complex" else complex
+        for arg in args:
+            if not issubclass(arg.typ, _NumberAnyType) or (arg.typ is complex and expected is float and name != "abs"):
+                raise CompilationError(f"'{name}' doesn't take '{arg.typ.__name__}'", node)
+        typ = {"complex": complex, "dot": float, "cir_dot": complex, "abs": float if args[0].typ is complex else args[0].typ}[name]
+        if not any(arg.array for arg in args):
+            return _NumPyValue(f"{name}({','.join(arg.expr for arg in args)})", typ, False)
+        if name == "abs":
+            return self._ufunc("absolute", args, typ, out)
+        parts = lambda value, attr: _NumPyValue(f"{value.expr}.{attr}", float, value.array) if value.typ is complex else \
+            (value if attr == "real" else _NumPyValue("0.0", float, False))
+        if name == "dot":
+            a, b = args
+            products = [self._ufunc("multiply", (parts(a, attr), parts(b, attr)), float, None) for attr in ("real", "imag")]
+            self._release(a, b)
+            return self._ufunc("add", products, float, out)
+        # The parts are written separately, so the result can't be in a temporary (or out) that is read
+        temp = self._allocTemp(complex)
+        if name == "complex":
+            for value, attr in zip(args, ("real", "imag")):
+                self.lines.append(f"np.copyto(_t{temp}.{attr},{value.expr},where=_where)")
+        else:
+            a, b = args
+            for attr in ("real", "imag"):
+                self.lines.append(f"np.multiply({parts(a, attr).expr},{parts(b, attr).expr},out=_t{temp}.{attr},where=_where)")
+        self._release(*args)
+        return _NumPyValue(f"_t{temp}", complex, True, temp)
+
+    def statements(self, statements: Sequence[ast.stmt]):
+        for stmt in statements:
+            match type(stmt):
+                case ast.Assign if len(stmt.targets) == 1 and type(stmt.targets[0]) is ast.Name:
+                    name = stmt.targets[0].id
+                    value = self.expression(stmt.value)
+                    if not value.array:
+                        self.lines.append(f"{name}={value.expr}")
+                        self._bindings[name] = _NumPyValue(name, value.typ, False)
+                    else:
+                        # The temporary holding it is never released
+                        self._bindings[name] = value._replace(temp=None)
+                    continue
+                case ast.Return:
+                    value = self.expression(stmt.value, out="_out")
+                    if value.expr != "_out":
+                        self.lines.append(f"np.copyto(_out,{value.expr},where=_where)")
+                    self.lines.append("return _out")
+                    return  # the rest is unreachable
+                case ast.Expr | ast.Pass:
+                    continue  # expressions have no side effects
+            raise CompilationError(f"Unsupported operation {type(stmt).__name__}.", stmt)
+        raise CompilationError("The fractal function doesn't return a value")
+
+class NumPyKernel:
+    """
+    Array version of a fractal function, generated from its AST (see FractalFunction.np_func).
+    Temporary arrays are kept between calls (one per intermediate value, reused when the size allows),
+    so a kernel is not thread safe.
+    Masked ufuncs are several times slower than unmasked ones, when most elements are finished, iterating only the
+    unfinished ones (like cpu_render.escapeTime does) is faster than a mask.
+    """
+    def __init__(self, kernel: Callable, temp_types: Sequence[Type[_VarTypes]], expression_func: Callable, source: str):
+        self._kernel = kernel
+        self._temp_types = tuple(temp_types)
+        self._temps: List[Optional[np.ndarray]] = [None] * len(temp_types)
+        # The same function with array operators, for other array types (ComplexDoubleDouble)
+        self._expression_func = expression_func
+        self.source = source
+
+    def _temp(self, i: int, shape: Tuple[int, ...], complex_dtype: np.dtype) -> np.ndarray:
+        typ = self._temp_types[i]
+        dtype = complex_dtype if typ is complex else np.bool_ if typ is bool else np.empty(0, complex_dtype).real.dtype
+        size = math.prod(shape)
+        temp = self._temps[i]
+        if temp is None or temp.dtype != dtype or temp.size < size:
+            temp = self._temps[i] = np.empty(size, dtype)
+        return temp[:size].reshape(shape)
+
+    def __call__(self, z, c, out: np.ndarray = None, where: np.ndarray | bool = True, **uniforms):
+        """
+        :param out: array for the result (may be z for an in-place update), a new one by default
+        :param where: mask of the elements to compute (the unfinished ones), the others keep their value in out
+            (or the value of z if out is None)
+        """
+        if not isinstance(z, np.ndarray) or not isinstance(c, (np.ndarray, complex, float, int)):
+            if out is not None or where is not True:
+                raise ValueError("out and where are only supported for NumPy arrays")
+            return self._expression_func(z, c, **uniforms)
+        complex_dtype = np.result_type(z.dtype, getattr(c, "dtype", np.complex64), np.complex64)
+        shape = np.broadcast_shapes(z.shape, np.shape(c), np.shape(where))
+        if out is None:
+            out = np.empty(shape, complex_dtype) if where is True else np.array(np.broadcast_to(z, shape), complex_dtype)
+        temps = [self._temp(i, shape, complex_dtype) for i in range(len(self._temp_types))]
+        with np.errstate(all="ignore"):
+            return self._kernel(z, c, out, where, *temps, **uniforms)
+
 class FractalFunction:
     def __init__(self, source: str):
         self._source = source
@@ -65,6 +386,8 @@ class FractalFunction:
         self._uniform_dict = None
         self._glsl_func_body: Optional[Sequence[str]] = None
         self.func = None
+        self.np_func: Optional[NumPyKernel] = None
+        self.orbit_func: Optional[OrbitKernel] = None
         # Indicates weather a resolve attempt was made (only one attempt should be made for each Fractal object!)
         self._attempted_resolve = False
         self._resolved = False
@@ -74,9 +397,9 @@ class FractalFunction:
         if tp is float:
             return expr
         if tp is int:
-            return f"FLOAT({expr})"
+            return f"F({expr})"
         if tp is complex:
-            return f"({expr}).x"
+            return f"cx_re({expr})"
         return None
     @staticmethod
     def _glslAsComplex(expr: str, tp: Type):
@@ -84,7 +407,7 @@ class FractalFunction:
             return expr
         if tp is float or tp is int:
             expr = FractalFunction._glslAsFloat(expr, tp)
-            return f"VEC2({expr},0.)"
+            return f"cx_real({expr})"
         return None
 
     @staticmethod
@@ -105,8 +428,11 @@ class FractalFunction:
         match type(node):
             case ast.Constant:
                 val_type = type(node.value)
-                if val_type is int or val_type is float:
-                    return repr(node.value), val_type
+                if val_type is int:
+                    # Parenthesized, so a negative number after an operator isn't '--'
+                    return (repr(node.value) if node.value >= 0 else f"({node.value!r})"), int
+                elif val_type is float:
+                    return f"F({node.value!r})", float
                 elif val_type is bool:
                     return ("true" if node.value else "false"), bool
                 else:
@@ -116,10 +442,36 @@ class FractalFunction:
                     raise CompilationError("We should not reach here! STH WENT WRONG", node)
                 typ = FractalFunction._getVarType(node.id, variables)
                 if typ is None:
+                    if node.id in ("pi", "e"):
+                        return f"F({getattr(math, node.id)!r})", float
                     raise CompilationError(f"Variable '{node.id}' is not defined", node)
                 return node.id, typ
+            case ast.Attribute if node.attr in ("real", "imag"):
+                value, value_type = FractalFunction._astToGLSL(node.value, variables)
+                if value_type is complex:
+                    return f"cx_{node.attr[:2]}({value})", float
+                if value_type is float or value_type is int:
+                    return (FractalFunction._glslAsFloat(value, value_type) if node.attr == "real" else "F(0.)"), float
+                raise CompilationError(f"'{value_type.__name__}' has no attribute '{node.attr}'", node)
             case ast.Assign:
-                ...
+                if len(node.targets) != 1 or type(node.targets[0]) is not ast.Name:
+                    raise CompilationError("Only assignments to a single variable are supported", node)
+                name = node.targets[0].id
+                value, value_type = FractalFunction._astToGLSL(node.value, variables)
+                typ = FractalFunction._getVarType(name, variables)
+                if typ is None:
+                    # Declared by its first assignment, variables is the scope of the function
+                    variables.append((name, value_type))
+                    return f"{_GLSL_TYPES[value_type]} {name}={value};", None
+                if any(type(var) is Uniform and var.name == name for var in variables):
+                    raise CompilationError(f"Uniform '{name}' can't be assigned", node)
+                if typ is complex:
+                    value = FractalFunction._glslAsComplex(value, value_type)
+                elif typ is float and value_type is int:
+                    value = FractalFunction._glslAsFloat(value, value_type)
+                elif typ is not value_type:
+                    raise CompilationError(f"Variable '{name}' is '{typ.__name__}', it can't be assigned '{value_type.__name__}'", node)
+                return f"{name}={value};", None
             case ast.AnnAssign:
                 ...
             case ast.AugAssign:
@@ -148,6 +500,10 @@ class FractalFunction:
                 match type(node.op):
                     case ast.Add | ast.Sub | ast.Mult | ast.Div as op_type:
                         output_type = int
+                        if op_type is ast.Mult and (left_type is complex) != (right_type is complex):
+                            # A complex number times a real one, without making the real one complex
+                            cx, real, real_type = (left, right, right_type) if left_type is complex else (right, left, left_type)
+                            return f"cx_scale({cx},{FractalFunction._glslAsFloat(real, real_type)})", complex
                         if left_type is complex or right_type is complex:
                             left = FractalFunction._glslAsComplex(left, left_type)
                             right = FractalFunction._glslAsComplex(right, right_type)
@@ -156,15 +512,13 @@ class FractalFunction:
                             left = FractalFunction._glslAsFloat(left, left_type)
                             right = FractalFunction._glslAsFloat(right, right_type)
                             output_type = float
-                        match op_type:
-                            case ast.Add:
-                                return f"({left}+{right})", output_type
-                            case ast.Sub:
-                                return f"({left}-{right})", output_type
-                            case ast.Mult:
-                                return (f"cx_mul({left},{right})" if output_type is complex else f"({left}*{right})"), output_type
-                            case ast.Div:
-                                return (f"cx_div({left},{right})" if output_type is complex else f"({left}/{right})"), output_type
+                        if output_type is int:
+                            symbol = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/"}[op_type]
+                            return f"({left}{symbol}{right})", int
+                        # The f_* and cx_* functions of main.frag work in every precision (double-double too)
+                        func = {ast.Add: "add", ast.Sub: "sub", ast.Mult: "mul", ast.Div: "div"}[op_type]
+                        prefix = "cx_" if output_type is complex else "f_"
+                        return f"{prefix}{func}({left},{right})", output_type
                     case ast.Pow:
                         if left_type is complex or right_type is complex:
                             if right == "2":
@@ -175,18 +529,34 @@ class FractalFunction:
                             right = FractalFunction._glslAsComplex(right, right_type)
                             return f"cx_pow({left},{right})", complex
                         left = FractalFunction._glslAsFloat(left, left_type)
+                        # f_pow is only single precision
+                        if right == "2":
+                            return f"f_sqr({left})", float
+                        if right == "3":
+                            return f"f_mul(f_sqr({left}),{left})", float
                         right = FractalFunction._glslAsFloat(right, right_type)
-                        return f"pow({left},{right})", float
+                        return f"f_pow({left},{right})", float
                     case ast.Mod:
                         if left_type is int and right_type is int:
                             return f"({left}%{right})", int
                         elif left_type is float and (right_type is float or right_type is int):
                             right = FractalFunction._glslAsFloat(right, right_type)
-                            return f"mod({left},{right})", float
+                            return f"f_mod({left},{right})", float
                         raise CompilationError(f"Modulo is not supported between '{left_type.__name__}' and '{right_type.__name__}'", node)
                 raise CompilationError(f"Unsupported binary operation '{type(node.op).__name__}'", node)
             case ast.Call:
-                pass  # TODO
+                if type(node.func) is not ast.Name or node.func.id not in _GLSL_FUNCTIONS or node.keywords:
+                    raise CompilationError("Unsupported function call", node)
+                func, arg_types, result_type = _GLSL_FUNCTIONS[node.func.id]
+                if len(node.args) != len(arg_types):
+                    raise CompilationError(f"'{node.func.id}' takes {len(arg_types)} arguments, got {len(node.args)}", node)
+                args = []
+                for arg_ast, arg_type in zip(node.args, arg_types):
+                    arg, typ = FractalFunction._astToGLSL(arg_ast, variables)
+                    if not issubclass(typ, _NumberAnyType) or (typ is complex and arg_type is float):
+                        raise CompilationError(f"'{node.func.id}' doesn't take '{typ.__name__}'", node)
+                    args.append(FractalFunction._glslAsComplex(arg, typ) if arg_type is complex else FractalFunction._glslAsFloat(arg, typ))
+                return f"{func}({','.join(args)})", result_type
             case ast.BoolOp:
                 infix = "||" if type(node.op) is ast.Or else "&&"
                 exps = []
@@ -206,7 +576,10 @@ class FractalFunction:
                     raise CompilationError(f"Branches of if expression must evaluate to the same type, got {body_type.__name__} and {els_type.__name__}.", node)
                 return f"({test}?{body}:{els})", body_type
             case ast.Return:
-                return f"return {FractalFunction._astToGLSL(node.value, variables)[0]};", None
+                value, value_type = FractalFunction._astToGLSL(node.value, variables)
+                if not issubclass(value_type, _NumberAnyType):
+                    raise CompilationError(f"The fractal function must return a number, got '{value_type.__name__}'", node)
+                return f"return {FractalFunction._glslAsComplex(value, value_type)};", None
             case ast.Expr:
                 warnings.warn(CompilationWarning("Result unused.", node))
                 return FractalFunction._astToGLSL(node.value, variables)
@@ -226,9 +599,13 @@ class FractalFunction:
         return {
             "pi": math.pi,
             "e": math.e,
+            "dot": dot,
+            "cir_dot": cir_dot,
             "sin": math.sin,
             "cos": math.cos,
             "tan": math.tan,
+            "sinh": math.sinh,
+            "cosh": math.cosh,
             "exp": math.exp,
             "log": math.log,
             "cx_sin": cmath.sin,
@@ -238,12 +615,66 @@ class FractalFunction:
             "cx_log": cmath.log,
         }
 
-    def resolve(self, compile_glsl=True):
+    @staticmethod
+    def _generateNameSpaceForNumPy():
+        return {
+            "pi": math.pi,
+            "e": math.e,
+            "complex": np_complex,
+            "dot": np_dot,
+            "cir_dot": np_cir_dot,
+            "sin": np.sin,
+            "cos": np.cos,
+            "tan": np.tan,
+            "sinh": np.sinh,
+            "cosh": np.cosh,
+            "exp": np.exp,
+            "log": np.log,
+            "cx_sin": np.sin,
+            "cx_cos": np.cos,
+            "cx_tan": np.tan,
+            "cx_exp": np.exp,
+            "cx_log": np.log,
+        }
+
+    def _generateNumPyKernel(self, statements: Sequence[ast.stmt], py_code_obj) -> NumPyKernel:
+        generator = _NumPyKernelGenerator([("z", complex), ("c", complex), *self.uniforms])
+        generator.statements(statements)
+        args = ["z", "c", "_out", "_where", *[f"_t{i}" for i in range(len(generator.temp_types))]]
+        if self.uniforms:
+            args += ["*", *[u.name for u in self.uniforms]]
+        source = f"def {NP_FRACTAL_KERNEL_NAME}({','.join(args)}):\n" + "".join(f"    {line}\n" for line in generator.lines)
+
+        # Scalars are computed with the functions of the python function
+        namespace = FractalFunction._generateNameSpaceForExec()
+        namespace["np"] = np
+        expression_namespace = FractalFunction._generateNameSpaceForNumPy()
+        try:
+            exec(compile(source, filename="<Fractal Function Kernel>", mode="exec", optimize=2), namespace)
+            exec(py_code_obj, expression_namespace)
+        except Exception as err:
+            raise CompilationError(f"Error occurred when generating NumPy kernel: '{err}'") from None
+        return NumPyKernel(namespace[NP_FRACTAL_KERNEL_NAME], generator.temp_types, expression_namespace[PY_FRACTAL_FUNC_NAME], source)
+
+    def _generateOrbitKernel(self, statements: Sequence[ast.stmt]) -> OrbitKernel:
+        """Lowered to float arithmetic if possible, otherwise the python function is called every iteration."""
+        value = next((stmt.value for stmt in statements if type(stmt) is ast.Return), None)
+        assignments = [(stmt.targets[0].id, stmt.value) for stmt in statements if type(stmt) is ast.Assign]
+        variables = {"z": True, "c": True, **{u.name: u.typ is complex for u in self.uniforms}}
+        try:
+            if value is not None and len(assignments) == len(statements) - 1:
+                return generateOrbitKernel(value, variables, assignments)[0]
+        except UnsupportedOrbitExpression:
+            pass
+        return stepOrbitKernel(self.func)
+
+    def resolve(self, compile_glsl=True, compile_numpy=True):
         """
-        Generate the GLSL function, Python function and uniforms for this fractal.
+        Generate the GLSL function, Python function, NumPy kernel and uniforms for this fractal.
         This method should only be called once for every Fractal object.
 
         :param compile_glsl if we should generate GLSL source or not (since we don't need that for audio)
+        :param compile_numpy if we should generate the NumPy kernel or not (for the CPU renderer)
         """
         if self._resolved:
             return
@@ -266,13 +697,16 @@ class FractalFunction:
         self.uniforms = tuple(self.uniforms)
         self.updateUniforms()
 
+        # Every backend gets the optimized statements
+        statements = optimizeStatements(statements_without_uniform, {"z": complex, "c": complex, **{u.name: u.typ for u in self.uniforms}})
+
         if compile_glsl:
             self._glsl_func_body = []
             variables = [("z", complex), ("c", complex), *self.uniforms]
-            for stmt in statements_without_uniform:
+            for stmt in statements:
                 # noinspection PyTypeChecker
                 self._glsl_func_body.append(FractalFunction._astToGLSL(stmt, variables)[0])
-        self._glsl_func_body = tuple(self._glsl_func_body)
+            self._glsl_func_body = tuple(self._glsl_func_body)
 
         py_func_ast = ast.Module()
         func_def = ast.FunctionDef()
@@ -283,7 +717,7 @@ class FractalFunction:
             ast.arg(arg="c"),
             *[ast.arg(arg=u.name) for u in self.uniforms]
         ]
-        func_def.body = statements_without_uniform
+        func_def.body = statements or [ast.Pass()]
         py_func_ast.body = [func_def]
 
         func_def.args.posonlyargs = []
@@ -309,6 +743,10 @@ class FractalFunction:
         except Exception as err:
             raise CompilationError(f"Error occurred when generating python function: '{err}'") from None
 
+        if compile_numpy:
+            self.np_func = self._generateNumPyKernel(statements, code_obj)
+        self.orbit_func = self._generateOrbitKernel(statements)
+
         self._resolved = True
 
     def updateUniforms(self):
@@ -325,18 +763,32 @@ class FractalFunction:
         assert self.func is not None
         return self.func(z, c, **self._uniform_dict)
 
-    def getGLSLFunc(self, pretty=False):
+    def orbit(self, z: complex, c: complex, out: np.ndarray, count: int, escape_sq: float,
+              converge_sq: float) -> Tuple[int, Optional[ArithmeticError]]:
+        """The function iterated up to count times, see fractal.orbit.OrbitKernel."""
+        assert self.orbit_func is not None
+        return self.orbit_func(z, c, out, count, escape_sq, converge_sq, **self._uniform_dict)
+
+    def callArrays(self, z: np.ndarray, c: np.ndarray, out: np.ndarray = None, where: np.ndarray | bool = True) -> np.ndarray:
+        """The function on whole arrays, see NumPyKernel.__call__."""
+        assert self.np_func is not None
+        return self.np_func(z, c, out, where, **self._uniform_dict)
+
+    def getGLSLFunc(self, pretty=False, name: str = None):
         """
+        :param name: of the GLSL function, the one main.frag calls by default
         :return: the entire GLSL function source code of this fractal (including function definition).
         """
         assert self._resolved
         assert self._glsl_func_body is not None
+        if name is None:
+            name = GLSL_NAME_FORMAT % GLSL_FRACTAL_FUNC_NAME
         if not pretty:
-            return f"VEC2 {GLSL_NAME_FORMAT % GLSL_FRACTAL_FUNC_NAME}(VEC2 z,VEC2 c){{{''.join(self._glsl_func_body)}}}"
+            return f"VEC2 {name}(VEC2 z,VEC2 c){{{''.join(self._glsl_func_body)}}}"
         else:
             # TODO: actual prettying
             body = ["\t"+s+"\n" for s in self._glsl_func_body]
-            return f"VEC2 {GLSL_NAME_FORMAT % GLSL_FRACTAL_FUNC_NAME}(VEC2 z, VEC2 c) {{\n{''.join(body)}}}"
+            return f"VEC2 {name}(VEC2 z, VEC2 c) {{\n{''.join(body)}}}"
 
     def getGLSLUniforms(self) -> Dict[str, _NumberAnyType]:
         """
@@ -359,6 +811,7 @@ return z ** 2 + c
     """)
     frac.resolve()
     print(frac.getGLSLFunc(True))
+    print(frac.np_func.source)
     print(frac(5, 1))
 
     exit()
@@ -0,0 +1,368 @@
+"""
+Optimizing pass on the AST of fractal functions, it runs before code generation (GLSL, python, NumPy and orbit kernels):
+constant folding and propagation, algebraic simplification (x*1, x+0...), binary exponentiation of integer powers,
+common subexpression elimination (into _cse assignments) and dead code removal.
+Only transformations that keep the value (and its type) are made, x*0 isn't 0 for infinite x for example.
+"""
+import ast
+import cmath
+import math
+from typing import Dict, List, Optional, Sequence, Type
+
+CSE_NAME_FORMAT = "_cse%d"
+# Functions that can be folded when their arguments are constants, and their result types (None: same as the argument)
+PURE_FUNCTIONS = {
+    "sin": (math.sin, float),
+    "cos": (math.cos, float),
+    "tan": (math.tan, float),
+    "sinh": (math.sinh, float),
+    "cosh": (math.cosh, float),
+    "exp": (math.exp, float),
+    "log": (math.log, float),
+    "abs": (abs, None),
+    "cx_sin": (cmath.sin, complex),
+    "cx_cos": (cmath.cos, complex),
+    "cx_tan": (cmath.tan, complex),
+    "cx_exp": (cmath.exp, complex),
+    "cx_log": (cmath.log, complex),
+    "dot": (None, float),
+    "cir_dot": (None, complex),
+    "complex": (None, complex),
+}
+CONSTANTS = {"pi": math.pi, "e": math.e}
+# Powers up to this are folded when both sides are constants (bigger ones may take long or produce huge integers)
+MAX_FOLDED_EXPONENT = 64
+
+
+def _promote(*types: Optional[Type]) -> Optional[Type]:
+    """Result type of arithmetic between these types, None if unknown."""
+    if None in types:
+        return None
+    for typ in (complex, float, int):
+        if typ in types:
+            return typ
+    return None
+
+
+class _Optimizer(ast.NodeTransformer):
+    def __init__(self, types: Dict[str, Type]):
+        """:param types: of the variables"""
+        self.types = dict(types)
+        self.constants: Dict[str, ast.Constant] = {}  # variables assigned a constant, they are replaced by it
+
+    def typeOf(self, node: ast.AST) -> Optional[Type]:
+        match type(node):
+            case ast.Constant:
+                return type(node.value)
+            case ast.Name:
+                if node.id in self.types:
+                    return self.types[node.id]
+                return float if node.id in CONSTANTS else None
+            case ast.Attribute:
+                return float if node.attr in ("real", "imag") else None
+            case ast.UnaryOp:
+                return bool if type(node.op) is ast.Not else self.typeOf(node.operand)
+            case ast.BinOp:
+                typ = _promote(self.typeOf(node.left), self.typeOf(node.right))
+                return float if typ is int and type(node.op) is ast.Div else typ
+            case ast.BoolOp | ast.Compare:
+                return bool
+            case ast.IfExp:
+                body, orelse = self.typeOf(node.body), self.typeOf(node.orelse)
+                return body if body is orelse else None
+            case ast.Call if type(node.func) is ast.Name and node.func.id in PURE_FUNCTIONS and node.func.id not in self.types:
+                result = PURE_FUNCTIONS[node.func.id][1]
+                if result is None and node.args:
+                    arg = self.typeOf(node.args[0])
+                    return float if arg is complex else arg
+                return result
+        return None
+
+    def _isConstant(self, node: ast.AST) -> bool:
+        return type(node) is ast.Constant and type(node.value) in (int, float, complex, bool)
+
+    def _constant(self, value, like: ast.AST) -> Optional[ast.Constant]:
+        """A folded value, None if it shouldn't be folded (complex results can't be written in GLSL, non finite ones at all)."""
+        if type(value) not in (int, float, bool) or (type(value) is float and not math.isfinite(value)):
+            return None
+        if type(value) is int and abs(value) > 2 ** 63:
+            return None
+        return ast.copy_location(ast.Constant(value), like)
+
+    def _fold(self, func, *args, like: ast.AST) -> Optional[ast.Constant]:
+        try:
+            return self._constant(func(*args), like)
+        except (ArithmeticError, ValueError, TypeError):
+            return None
+
+    def _isValue(self, node: ast.AST, value) -> bool:
+        return self._isConstant(node) and type(node.value) is not bool and node.value == value
+
+    def _keepsType(self, node: ast.AST, constant: ast.AST, op: Type[ast.operator]) -> bool:
+        """If node op constant has the type of node, so the operation can be dropped."""
+        typ = self.typeOf(node)
+        result = _promote(typ, self.typeOf(constant))
+        if result is int and op is ast.Div:
+            result = float
+        return typ is not None and typ is not bool and result is typ
+
+    def _neg(self, node: ast.AST, like: ast.AST) -> ast.AST:
+        if type(node) is ast.UnaryOp and type(node.op) is ast.USub:
+            return node.operand
+        if self._isConstant(node) and type(node.value) is not bool:
+            return ast.copy_location(ast.Constant(-node.value), like)
+        return ast.copy_location(ast.UnaryOp(ast.USub(), node), like)
+
+    def _power(self, base: ast.AST, exponent: int, like: ast.AST) -> ast.AST:
+        """base ** exponent by squaring, squares and cubes stay powers (cx_sqr and cx_cube in GLSL)."""
+        if exponent <= 3:
+            return ast.copy_location(ast.BinOp(base, ast.Pow(), ast.Constant(exponent)), like)
+        if exponent % 2 == 0:
+            half = self._power(base, exponent // 2, like)
+            return ast.copy_location(ast.BinOp(half, ast.Pow(), ast.Constant(2)), like)
+        return ast.copy_location(ast.BinOp(self._power(base, exponent - 1, like), ast.Mult(), base), like)
+
+    # ----- Visitors -----
+    def visit_Name(self, node: ast.Name) -> ast.AST:
+        if type(node.ctx) is ast.Load and node.id in self.constants:
+            return ast.copy_location(ast.Constant(self.constants[node.id].value), node)
+        return node
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> ast.AST:
+        self.generic_visit(node)
+        operand = node.operand
+        match type(node.op):
+            case ast.UAdd if self.typeOf(operand) in (int, float, complex):
+                return operand
+            case ast.USub:
+                if type(operand) is ast.UnaryOp and type(operand.op) is ast.USub:
+                    return operand.operand
+                if self._isConstant(operand) and type(operand.value) is not bool:
+                    return self._fold(lambda v: -v, operand.value, like=node) or node
+            case ast.Not:
+                if self._isConstant(operand) and type(operand.value) is bool:
+                    return self._constant(not operand.value, node)
+                if type(operand) is ast.UnaryOp and type(operand.op) is ast.Not:
+                    return operand.operand
+        return node
+
+    def visit_BinOp(self, node: ast.BinOp) -> ast.AST:
+        self.generic_visit(node)
+        left, right, op = node.left, node.right, type(node.op)
+        numeric = lambda n: self._isConstant(n) and type(n.value) is not bool
+        if numeric(left) and numeric(right):
+            if op is ast.Pow and (type(right.value) is not int or abs(right.value) > MAX_FOLDED_EXPONENT):
+                return node
+            operators = {ast.Add: lambda a, b: a + b, ast.Sub: lambda a, b: a - b, ast.Mult: lambda a, b: a * b,
+                         ast.Div: lambda a, b: a / b, ast.Mod: lambda a, b: a % b, ast.Pow: lambda a, b: a ** b}
+            if op in operators:
+                return self._fold(operators[op], left.value, right.value, like=node) or node
+            return node
+
+        match op:
+            case ast.Add:
+                if self._isValue(right, 0) and self._keepsType(left, right, op):
+                    return left
+                if self._isValue(left, 0) and self._keepsType(right, left, op):
+                    return right
+                if type(right) is ast.UnaryOp and type(right.op) is ast.USub:  # x + -y
+                    return ast.copy_location(ast.BinOp(left, ast.Sub(), right.operand), node)
+            case ast.Sub:
+                if self._isValue(right, 0) and self._keepsType(left, right, op):
+                    return left
+                if self._isValue(left, 0) and self._keepsType(right, left, op):
+                    return self._neg(right, node)
+                if type(right) is ast.UnaryOp and type(right.op) is ast.USub:  # x - -y
+                    return ast.copy_location(ast.BinOp(left, ast.Add(), right.operand), node)
+            case ast.Mult:
+                for a, b in ((left, right), (right, left)):
+                    if self._isValue(b, 1) and self._keepsType(a, b, op):
+                        return a
+                    if self._isValue(b, -1) and self._keepsType(a, b, op):
+                        return self._neg(a, node)
+            case ast.Div:
+                if self._isValue(right, 1) and self._keepsType(left, right, op):
+                    return left
+            case ast.Pow:
+                return self._optimizePow(node)
+        return node
+
+    def _optimizePow(self, node: ast.BinOp) -> ast.AST:
+        base, exponent, typ = node.left, node.right, self.typeOf(node.left)
+        # e ** x is exp(x)
+        if type(base) is ast.Name and base.id == "e" and "e" not in self.types:
+            arg_type = self.typeOf(exponent)
+            if arg_type in (int, float):
+                return ast.copy_location(ast.Call(ast.Name("exp", ast.Load()), [exponent], []), node)
+            if arg_type is complex:
+                return ast.copy_location(ast.Call(ast.Name("cx_exp", ast.Load()), [exponent], []), node)
+        if not self._isConstant(exponent) or typ not in (float, complex):
+            return node
+        value = exponent.value
+        # Integer valued float exponents give the same result (the base isn't an int)
+        if type(value) is float and value.is_integer() and abs(value) <= 2 ** 31:
+            value = int(value)
+        if type(value) is not int:
+            return node
+        if value == 1:
+            return base
+        if value == 0:
+            return node if typ is complex else ast.copy_location(ast.Constant(1.), node)
+        if value < 0:
+            return ast.copy_location(ast.BinOp(ast.Constant(1.), ast.Div(), self._power(base, -value, node)), node)
+        return self._power(base, value, node)
+
+    def visit_BoolOp(self, node: ast.BoolOp) -> ast.AST:
+        self.generic_visit(node)
+        is_and = type(node.op) is ast.And
+        values = []
+        for value in node.values:
+            if self._isConstant(value) and type(value.value) is bool:
+                if value.value != is_and:  # False in and, True in or decides it
+                    return self._constant(value.value, node)
+                continue  # True in and, False in or doesn't change it
+            values.append(value)
+        if not values:
+            return self._constant(is_and, node)
+        if len(values) == 1:
+            return values[0]
+        node.values = values
+        return node
+
+    def visit_IfExp(self, node: ast.IfExp) -> ast.AST:
+        self.generic_visit(node)
+        if self._isConstant(node.test) and type(node.test.value) is bool:
+            return node.body if node.test.value else node.orelse
+        return node
+
+    def visit_Call(self, node: ast.Call) -> ast.AST:
+        self.generic_visit(node)
+        if type(node.func) is not ast.Name or node.func.id in self.types or node.keywords:
+            return node
+        func = PURE_FUNCTIONS.get(node.func.id, (None, None))[0]
+        if func is not None and all(self._isConstant(a) and type(a.value) is not bool for a in node.args):
+            return self._fold(func, *(a.value for a in node.args), like=node) or node
+        return node
+
+
+def _size(node: ast.AST) -> int:
+    return sum(1 for _ in ast.walk(node))
+
+
+def _isLeaf(node: ast.AST) -> bool:
+    """Too cheap to be worth a variable."""
+    if type(node) is ast.Attribute or type(node) is ast.UnaryOp:
+        return _isLeaf(node.value if type(node) is ast.Attribute else node.operand)
+    return type(node) in (ast.Constant, ast.Name)
+
+
+def _unconditionalNodes(node: ast.AST):
+    """Like ast.walk, but without the parts of IfExps and BoolOps that may not be evaluated (hoisting them could raise)."""
+    yield node
+    match type(node):
+        case ast.IfExp:
+            children = [node.test]
+        case ast.BoolOp:
+            children = node.values[:1]
+        case _:
+            children = ast.iter_child_nodes(node)
+    for child in children:
+        yield from _unconditionalNodes(child)
+
+
+class _Replacer(ast.NodeTransformer):
+    def __init__(self, key: str, name: str):
+        self.key = key
+        self.name = name
+
+    def visit(self, node: ast.AST) -> ast.AST:
+        if isinstance(node, ast.expr) and ast.dump(node) == self.key:
+            return ast.copy_location(ast.Name(self.name, ast.Load()), node)
+        return super().visit(node)
+
+
+def _subexpressionCounts(nodes: Sequence[ast.AST]) -> Dict[str, List[ast.expr]]:
+    occurrences: Dict[str, List[ast.expr]] = {}
+    for root in nodes:
+        for node in _unconditionalNodes(root):
+            if isinstance(node, ast.expr) and not _isLeaf(node):
+                occurrences.setdefault(ast.dump(node), []).append(node)
+    return occurrences
+
+
+def eliminateCommonSubexpressions(value: ast.expr, first_index: int = 0) -> List[ast.stmt]:
+    """
+    Computes every subexpression of value that occurs more than once only once, in an assignment to a _cse name.
+    :returns: the assignments (in the order they must run) and at the end an Expr with what is left of value
+    """
+    assignments: List[ast.Assign] = []
+    result = ast.Expr(value)
+    index = first_index
+    while True:
+        occurrences = _subexpressionCounts([result] + [a.value for a in assignments])
+        repeated = [(key, nodes[0]) for key, nodes in occurrences.items() if len(nodes) > 1]
+        if not repeated:
+            break
+        # The biggest first, the ones inside of it may only occur in it
+        key, node = max(repeated, key=lambda item: _size(item[1]))
+        name = CSE_NAME_FORMAT % index
+        index += 1
+        replacer = _Replacer(key, name)
+        result = replacer.visit(result)
+        for assignment in assignments:
+            assignment.value = replacer.visit(assignment.value)
+        # Smaller subexpressions are hoisted later and are computed before the bigger ones that contain them
+        assignments.insert(0, ast.copy_location(ast.Assign([ast.Name(name, ast.Store())], node), node))
+    return [*assignments, result]
+
+
+def _loadedNames(nodes: Sequence[ast.AST]) -> set:
+    return {n.id for root in nodes for n in ast.walk(root) if type(n) is ast.Name and type(n.ctx) is ast.Load}
+
+
+def optimizeStatements(statements: Sequence[ast.stmt], types: Dict[str, Type]) -> List[ast.stmt]:
+    """
+    Optimize the body of a fractal function, the statements are changed in place.
+    :param types: of the arguments (z, c and the uniforms)
+    """
+    optimizer = _Optimizer(types)
+    result: List[ast.stmt] = []
+    cse_index = 0
+    for stmt in statements:
+        match type(stmt):
+            case ast.Expr | ast.Pass:
+                continue  # expressions have no side effects
+            case ast.Assign if len(stmt.targets) == 1 and type(stmt.targets[0]) is ast.Name:
+                name = stmt.targets[0].id
+                stmt.value = optimizer.visit(stmt.value)
+                # The type of a reassigned variable may change
+                optimizer.types[name] = optimizer.typeOf(stmt.value)
+                if optimizer._isConstant(stmt.value):
+                    optimizer.constants[name] = stmt.value
+                else:
+                    optimizer.constants.pop(name, None)
+                result.append(stmt)
+                continue
+            case ast.Return if stmt.value is not None:
+                *assignments, value = eliminateCommonSubexpressions(optimizer.visit(stmt.value), cse_index)
+                cse_index += len(assignments)
+                stmt.value = value.value
+                result += assignments
+                result.append(stmt)
+                break  # the rest is unreachable
+        # Statements the pass doesn't know may assign anything
+        optimizer.constants.clear()
+        result.append(stmt)
+    # Remove assignments whose values are never used, backwards through the statements
+    live = set()
+    kept = []
+    for stmt in reversed(result):
+        if type(stmt) is ast.Assign and len(stmt.targets) == 1 and type(stmt.targets[0]) is ast.Name:
+            if stmt.targets[0].id not in live:
+                continue
+            live.discard(stmt.targets[0].id)
+            live |= _loadedNames([stmt.value])
+        else:
+            live |= {n.id for n in ast.walk(stmt) if type(n) is ast.Name}
+        kept.append(stmt)
+    return kept[::-1]
@@ -0,0 +1,266 @@
+"""
+Orbit kernels: a fractal function iterated up to N times in a single call, for the path visualization and the audio.
+The complex arithmetic of the function is lowered to float arithmetic on the real and imaginary parts, so no complex
+objects or function calls are made per iteration, except for functions that have no float version (cmath).
+"""
+import ast
+import cmath
+import math
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+# (z, c, out, count, escape_sq, converge_sq) -> (iterations, error)
+# Iterates z = f(z, c) up to count times, every z goes into out (a contiguous complex128 array of at least count elements).
+# Stops before storing a z that escaped (|z|^2 > escape_sq) or barely moved (|z - last z|^2 < converge_sq),
+# so fewer than count iterations means the orbit ended. An ArithmeticError of the function stops it too, it's returned
+# with the iterations done before it (they are in out), error is None otherwise.
+OrbitKernel = Callable[[complex, complex, np.ndarray, int, float, float], Tuple[int, Optional[ArithmeticError]]]
+
+ORBIT_KERNEL_NAME = "_generated_orbit_kernel"
+_CONSTANTS = {"pi": math.pi, "e": math.e}
+# Real functions of math, the cx_ ones (cmath) and real ones called with complex numbers are computed on complex objects
+_REAL_FUNCTIONS = ("sin", "cos", "tan", "sinh", "cosh", "exp", "log", "sqrt")
+_COMPLEX_FUNCTIONS = {f"cx_{name}": name for name in _REAL_FUNCTIONS}
+
+
+class UnsupportedOrbitExpression(Exception):
+    """The expression can't be lowered to float arithmetic (the orbit kernel falls back to calling the function)."""
+
+
+class _Value(NamedTuple):
+    re: str  # a local variable or a literal
+    im: Optional[str]  # None for real values
+    varies: bool  # depends on z, so it's computed in the loop, otherwise once before it
+
+
+class _ComplexLowering:
+    """Lowers a complex expression into assignments to float locals, every subexpression is computed once."""
+    def __init__(self, variables: Dict[str, bool]):
+        """:param variables: names of the inputs, and if they are complex"""
+        self.variables = variables
+        self.setup: List[str] = []  # statements that don't depend on z
+        self.loop: List[str] = []
+        self._values: Dict[str, _Value] = {}  # of the subexpressions computed so far, by their ast.dump
+        self._bindings: Dict[str, _Value] = {}  # assigned variables
+        self._locals = 0
+
+    def _emit(self, varies: bool, re: str, im: Optional[str] = None) -> _Value:
+        name = f"_v{self._locals}"
+        self._locals += 1
+        lines = self.loop if varies else self.setup
+        lines.append(f"{name}r = {re}")
+        if im is not None:
+            lines.append(f"{name}i = {im}")
+        return _Value(f"{name}r", None if im is None else f"{name}i", varies)
+
+    def _box(self, value: _Value) -> str:
+        return f"complex({value.re}, {value.im or '0.0'})"
+
+    def _complexCall(self, func: str, *args: _Value) -> _Value:
+        """Computed on complex objects, for the operations without a float version."""
+        varies = any(a.varies for a in args)
+        boxed = self._emit(varies, f"{func}({', '.join(self._box(a) for a in args)})")
+        return self._emit(varies, f"{boxed.re}.real", f"{boxed.re}.imag")
+
+    def _mul(self, a: _Value, b: _Value) -> _Value:
+        varies = a.varies or b.varies
+        if a.im is None and b.im is None:
+            return self._emit(varies, f"{a.re} * {b.re}")
+        if a.im is None or b.im is None:
+            real, cx = (a, b) if a.im is None else (b, a)
+            return self._emit(varies, f"{real.re} * {cx.re}", f"{real.re} * {cx.im}")
+        if a == b:
+            return self._emit(varies, f"{a.re} * {a.re} - {a.im} * {a.im}", f"2.0 * {a.re} * {a.im}")
+        return self._emit(varies, f"{a.re} * {b.re} - {a.im} * {b.im}", f"{a.re} * {b.im} + {a.im} * {b.re}")
+
+    def _pow(self, base: _Value, exponent: int) -> _Value:
+        """Exponentiation by squaring."""
+        if exponent == 0:
+            return _Value("1.0", None, False)
+        result = None
+        while True:
+            if exponent & 1:
+                result = base if result is None else self._mul(result, base)
+            exponent >>= 1
+            if exponent == 0:
+                return result
+            base = self._mul(base, base)
+
+    def assign(self, name: str, node: ast.AST):
+        value = self.expression(node)
+        if name in self._bindings or name in self.variables:
+            self._values.clear()  # subexpressions with the name have another value now
+        self._bindings[name] = value
+
+    def expression(self, node: ast.AST) -> _Value:
+        key = ast.dump(node)
+        if key not in self._values:
+            self._values[key] = self._lower(node)
+        return self._values[key]
+
+    # noinspection PyUnresolvedReferences
+    def _lower(self, node: ast.AST) -> _Value:
+        match type(node):
+            case ast.Constant:
+                if type(node.value) in (int, float):
+                    return _Value(repr(float(node.value)), None, False)
+                if type(node.value) is complex:
+                    return _Value(repr(node.value.real), repr(node.value.imag), False)
+            case ast.Name:
+                if node.id in self._bindings:
+                    return self._bindings[node.id]
+                if node.id in self.variables:
+                    if node.id == "z":
+                        return _Value("zr", "zi", True)
+                    if not self.variables[node.id]:
+                        return _Value(node.id, None, False)
+                    # Split once before the loop
+                    return self._emit(False, f"{node.id}.real", f"{node.id}.imag")
+                if node.id in _CONSTANTS:
+                    return _Value(repr(_CONSTANTS[node.id]), None, False)
+            case ast.Attribute if node.attr in ("real", "imag"):
+                value = self.expression(node.value)
+                if node.attr == "real":
+                    return _Value(value.re, None, value.varies)
+                return _Value(value.im or "0.0", None, value.varies)
+            case ast.UnaryOp if type(node.op) in (ast.UAdd, ast.USub):
+                value = self.expression(node.operand)
+                if type(node.op) is ast.UAdd:
+                    return value
+                return self._emit(value.varies, f"-{value.re}", None if value.im is None else f"-{value.im}")
+            case ast.BinOp:
+                a = self.expression(node.left)
+                if type(node.op) is ast.Pow and type(node.right) is ast.Constant and type(node.right.value) is int \
+                        and 0 <= node.right.value <= 64:
+                    return self._pow(a, node.right.value)
+                b = self.expression(node.right)
+                varies = a.varies or b.varies
+                match type(node.op):
+                    case ast.Add | ast.Sub as op_type:
+                        sign = " + " if op_type is ast.Add else " - "
+                        if a.im is None and b.im is None:
+                            return self._emit(varies, f"{a.re}{sign}{b.re}")
+                        im = a.im if b.im is None else (f"-{b.im}" if a.im is None and sign == " - " else
+                                                        b.im if a.im is None else f"{a.im}{sign}{b.im}")
+                        return self._emit(varies, f"{a.re}{sign}{b.re}", im)
+                    case ast.Mult:
+                        return self._mul(a, b)
+                    case ast.Div:
+                        if b.im is None:
+                            return self._emit(varies, f"{a.re} / {b.re}", None if a.im is None else f"{a.im} / {b.re}")
+                        norm = self._emit(b.varies, f"{b.re} * {b.re} + {b.im} * {b.im}")
+                        if a.im is None:
+                            return self._emit(varies, f"{a.re} * {b.re} / {norm.re}", f"-{a.re} * {b.im} / {norm.re}")
+                        return self._emit(varies, f"({a.re} * {b.re} + {a.im} * {b.im}) / {norm.re}",
+                                          f"({a.im} * {b.re} - {a.re} * {b.im}) / {norm.re}")
+                    case ast.Pow:
+                        # Negative bases give complex results with non integer exponents
+                        return self._complexCall("pow", a, b)
+                    case ast.Mod if a.im is None and b.im is None:
+                        return self._emit(varies, f"{a.re} % {b.re}")
+            case ast.Call if type(node.func) is ast.Name and not node.keywords:
+                name, args = node.func.id, [self.expression(arg) for arg in node.args]
+                varies = any(a.varies for a in args)
+                match name, len(args):
+                    case "complex", 2 if args[0].im is None and args[1].im is None:
+                        return _Value(args[0].re, args[1].re, varies)
+                    case "abs", 1:
+                        if args[0].im is None:
+                            return self._emit(varies, f"abs({args[0].re})")
+                        return self._emit(varies, f"math.hypot({args[0].re}, {args[0].im})")
+                    case "dot", 2:
+                        a, b = args
+                        return self._emit(varies, f"{a.re} * {b.re} + {a.im or '0.0'} * {b.im or '0.0'}")
+                    case "cir_dot", 2:
+                        a, b = args
+                        return self._emit(varies, f"{a.re} * {b.re}", f"{a.im or '0.0'} * {b.im or '0.0'}")
+                    case _, 1 if name in _REAL_FUNCTIONS and args[0].im is None:
+                        return self._emit(varies, f"math.{name}({args[0].re})")
+                    case _, 1 if name in _REAL_FUNCTIONS or name in _COMPLEX_FUNCTIONS:
+                        return self._complexCall(f"cmath.{_COMPLEX_FUNCTIONS.get(name, name)}", args[0])
+        raise UnsupportedOrbitExpression(ast.unparse(node))
+
+
+def generateOrbitKernel(expression: ast.expr, variables: Dict[str, bool],
+                        assignments: Sequence[Tuple[str, ast.expr]] = ()) -> Tuple[OrbitKernel, str]:
+    """
+    :param expression: the fractal function, an expression of z, c and the other variables
+    :param variables: names of the inputs (z and c included), and if they are complex, the ones other than z and c
+        are keyword only arguments of the kernel
+    :param assignments: (name, value) of the variables assigned before the expression, in order
+    :returns: the kernel and its source
+    """
+    lowering = _ComplexLowering(variables)
+    for name, value in assignments:
+        lowering.assign(name, value)
+    value = lowering.expression(expression)
+    extra_args = [name for name in variables if name not in ("z", "c")]
+    args = "z, c, out, count, escape_sq, converge_sq" + (f", *, {', '.join(extra_args)}" if extra_args else "")
+    body = "\n".join(f"            {line}" for line in lowering.loop)
+    setup = "\n".join(f"        {line}" for line in lowering.setup)
+    source = f"""def {ORBIT_KERNEL_NAME}({args}):
+    zr = z.real
+    zi = z.imag
+    # Appending floats to a list and copying them all at once is much faster than setting array elements
+    parts = []
+    append = parts.append
+    n = 0
+    error = None
+    try:
+{setup}
+        while n < count:
+{body}
+            nr = {value.re}
+            ni = {value.im or '0.0'}
+            dr = nr - zr
+            di = ni - zi
+            if dr * dr + di * di < converge_sq or nr * nr + ni * ni > escape_sq:
+                break
+            zr = nr
+            zi = ni
+            append(zr)
+            append(zi)
+            n += 1
+    except ArithmeticError as err:
+        error = err
+    out.view(np.float64)[:2 * n] = parts
+    return n, error
+"""
+    namespace = {"math": math, "cmath": cmath, "np": np}
+    exec(compile(source, filename="<Orbit Kernel>", mode="exec"), namespace)
+    return namespace[ORBIT_KERNEL_NAME], source
+
+
+def stepOrbitKernel(step: Callable[[complex, complex], complex]) -> OrbitKernel:
+    """The orbit kernel of a function that can't be lowered, it is called once per iteration."""
+    def kernel(z: complex, c: complex, out: np.ndarray, count: int, escape_sq: float, converge_sq: float,
+               **kwargs) -> Tuple[int, Optional[ArithmeticError]]:
+        n = 0
+        while n < count:
+            try:
+                new_z = step(z, c, **kwargs)
+            except ArithmeticError as err:
+                return n, err
+            delta = new_z - z
+            if delta.real * delta.real + delta.imag * delta.imag < converge_sq or \
+                    new_z.real * new_z.real + new_z.imag * new_z.imag > escape_sq:
+                break
+            z = new_z
+            out[n] = z
+            n += 1
+        return n, None
+    return kernel
+
+
+def orbitKernel(expression: Optional[str], step: Callable[[complex, complex], complex]) -> OrbitKernel:
+    """
+    The orbit kernel of a python expression of z and c, with the names of fractals.py (complex, dot, sin...),
+    step is called instead if the expression is None or can't be lowered.
+    """
+    if expression is None:
+        return stepOrbitKernel(step)
+    try:
+        return generateOrbitKernel(ast.parse(expression, mode="eval").body, {"z": True, "c": True})[0]
+    except UnsupportedOrbitExpression:
+        return stepOrbitKernel(step)
@@ -1,16 +1,64 @@
-from pygame import Vector2
+import math
+from decimal import Decimal, localcontext
+from typing import Optional, Tuple
+
+from gdmath import Vec2
+
+DecimalLike = Decimal | str | float | int
+# Significant digits of the center beyond the ones needed to resolve the view
+GUARD_DIGITS = 20
+
+
+def toDecimal(value: DecimalLike) -> Decimal:
+    """Floats are converted from their shortest repr, which is how they were written in a JSON file or typed in."""
+    return Decimal(repr(value)) if isinstance(value, float) else Decimal(value)
 
 
 class Transformation:
-    def __init__(self, translation: Vector2 = None, scale: float = None):
-        self.translation = translation or Vector2()
-        self.scale = scale or 1
+    """
+    The center of a view (translation) and half of its height (scale), in fractal coordinates.
+    The center is kept as decimals and the scale as its log10, so views of any depth are stored exactly.
+    A view made from a scale keeps that float too, 10 ** log10(scale) is often an ulp off.
+    """
+    def __init__(self, translation: Tuple[DecimalLike, DecimalLike] = None, scale: float = None, log_scale: float = None):
+        translation = (0, 0) if translation is None else translation
+        self.center: Tuple[Decimal, Decimal] = (toDecimal(translation[0]), toDecimal(translation[1]))
+        self._scale: Optional[float] = float(scale) if scale and log_scale is None else None
+        self.log_scale: float = math.log10(scale or 1) if log_scale is None else log_scale
+
+    @property
+    def scale(self) -> float:
+        """0 for views deeper than doubles go, use log_scale for those."""
+        return self._scale if self._scale is not None else 10 ** self.log_scale
+
+    @property
+    def translation(self) -> Vec2:
+        """The center in double precision."""
+        return Vec2(float(self.center[0]), float(self.center[1]))
+
+    @property
+    def digits(self) -> int:
+        """Significant digits of the center that resolve the view."""
+        magnitude = max(c.adjusted() + 1 for c in self.center)
+        return max(magnitude, 1) + max(math.ceil(-self.log_scale), 0) + GUARD_DIGITS
+
+    def offsetCenter(self, offset: Tuple[float, float]) -> Tuple[Decimal, Decimal]:
+        """The center moved by an offset, exactly."""
+        with localcontext() as ctx:
+            ctx.prec = self.digits
+            return self.center[0] + Decimal(offset[0]), self.center[1] + Decimal(offset[1])
+
+    def offsetTo(self, other: "Transformation") -> Tuple[float, float]:
+        """The offset from this center to the other's, in double precision (it is exact relative to the offset)."""
+        with localcontext() as ctx:
+            ctx.prec = max(self.digits, other.digits)
+            return float(other.center[0] - self.center[0]), float(other.center[1] - self.center[1])
 
-    def transform(self, ndr: Vector2, aspect_ratio: float):
+    def transform(self, ndr: Vec2, aspect_ratio: float):
         """ Transform NDR to fractal coordinates. """
-        return Vector2(ndr.x * aspect_ratio, ndr.y) * self.scale + self.translation
+        return Vec2(ndr.x * aspect_ratio, ndr.y) * self.scale + self.translation
 
-    def inverseTransform(self, pos: Vector2, aspect_ratio: float):
+    def inverseTransform(self, pos: Vec2, aspect_ratio: float):
         """ Transform fractal coordinates to NDR. """
         ndr = (pos - self.translation) / self.scale
         ndr.x /= aspect_ratio
@@ -18,11 +66,17 @@ class Transformation:
         return ndr
 
     def dumpJson(self) -> dict:
-        return {
-            "translation": (*self.translation,),
-            "scale": self.scale
-        }
+        """Loads back exactly, the scale is written as it was given (scale or log_scale)."""
+        dat = {"translation": (str(self.center[0]), str(self.center[1]))}
+        if self._scale is not None:
+            dat["scale"] = self._scale
+        else:
+            dat["log_scale"] = self.log_scale
+        return dat
 
     @classmethod
     def loadJson(cls, dat: dict):
-        return cls(Vector2(*dat["translation"]), dat["scale"])
+        """The translation may be strings or numbers, and the scale either log_scale or scale."""
+        if "log_scale" in dat:
+            return cls(dat["translation"], log_scale=dat["log_scale"])
+        return cls(dat["translation"], dat["scale"])
@@ -1,36 +1,194 @@
+import hashlib
 import logging
 import math
-from math import floor
 import random
-from typing import Tuple
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from decimal import Decimal, localcontext
+from typing import Tuple, Optional, List, Dict, TYPE_CHECKING
 import numpy as np
 import moderngl as gl
-from moderngl_window.context.base import BaseWindow
 from gdmath import Vec2
-from pyrr import Matrix44
 
+import deep_zoom
 import fractals
-from settings import Settings
+from double_double import splitDecimal
+from fractal.transformation import Transformation
+from profiler import FrameProfiler, GPU_PHASE
+from settings import Settings, Precisions, requiredPrecision
+from shader_modules import ShaderModules
 from utils import color_utils
 from utils.assets import assets_path
-from utils import coordinate_axis
 
-COLOR_PALETTE_SAMPLES = 1024
+if TYPE_CHECKING:
+    # The renderer also runs without a window (headless_render.py), which shouldn't need the GUI libraries
+    from moderngl_window.context.base import BaseWindow
+
+# Fraction of the reprojected pixels that get computed again every frame while the camera moves
+REPROJECTION_REFINE_FRACTION = .25
+# While the camera moves, the resolution is lowered until frames fit the frame time budget (Settings.frame_time_budget)
+DYNAMIC_RESOLUTION_MIN_SCALE = .25
+# Iterations every pixel may run per GPU submission, heavy frames are spread over several submissions (and frames)
+ITERATIONS_PER_SUBMISSION = 4096
+# While the camera stands still, submissions are rendered in tiles of this size, as many per frame as fit the budget
+RENDER_TILE_SIZE = 128
+
+# Iteration states of pixels, same as in main.frag
+STATE_ESCAPED = 0
+STATE_RUNNING = 1  # reached the iteration limit
+
+# Automatic iteration limit (Settings.auto_iterations): the iteration state of every finished image is sampled on
+# this grid, and the limit is doubled while more than this fraction of the samples are undecided (reached the limit)
+STATISTICS_GRID = (128, 72)
+AUTO_ITERATIONS_UNDECIDED = .002
+# A doubling that decides less than this fraction of the undecided samples (and less than the doubling before) is
+# undone, the rest is likely interior that isn't detected
+AUTO_ITERATIONS_MIN_PROGRESS = .1
+AUTO_ITERATIONS_RANGE = (64, 2 ** 17)
+
+# Automatic precision switches to a cheaper precision only once pixels are this many times larger than it needs,
+# so it doesn't switch back and forth around the limit
+PRECISION_HYSTERESIS = 4
+# The camera translation is an offset from a decimal origin, which moves to the view once the offset is this many
+# view scales long, so the offset never needs more than double precision
+ORIGIN_REBASE_DISTANCE = 2 ** 10
+ORIGIN_DIGITS = 60
+# Path generation stops once z moves less than this in an iteration (converged to a point)
+PATH_CONVERGENCE_DISTANCE = 1E-7
+# Perturbation (Precisions.Perturbation): the reference orbit is computed again once the view is this many view scales
+# away from its center, the offsets of the pixels from it keep more than enough precision until then
+REFERENCE_MAX_OFFSET = 2 ** 16
+# Digits of the reference orbit beyond the ones the view needs, so it lasts for zooming in by about as many decades
+REFERENCE_EXTRA_DIGITS = 8
+# Texels per row of the reference orbit texture, same as in main.frag
+REFERENCE_ORBIT_WIDTH = 1024
+# Compiled main programs kept for switching back to a fractal or precision, at least two precision ladders (6),
+# the programs in use and the ones replacing them
+PROGRAM_CACHE_SIZE = 12
+
+Rect = Tuple[int, int, int, int]  # x, y, width, height (bottom-up, like gl_FragCoord)
 
 class FractalRenderingMetaData:
     def __init__(self):
         ...
 
+class _FrameTarget:
+    """
+    A rendered frame: iteration state (for coloring, reprojection and continuing), the colors made from it by the
+    coloring pass and the camera it was rendered with. See the outputs of main.frag for the contents of the textures.
+    """
+    def __init__(self, ctx: gl.Context, size: Tuple[int, int], low_state: bool = False):
+        """:param low_state: has the z_low textures, for double-double precision and perturbation"""
+        self.size = tuple(size)
+        self.low_state = low_state
+        self.color = ctx.texture(size, components=4)
+        self.anti_aliased = ctx.texture(size, components=4)
+        self.data = ctx.texture(size, components=4, dtype="f4")
+        self.z = ctx.texture(size, components=4, dtype="u4")
+        self.samples = ctx.texture(size, components=4, dtype="f4")
+        self.sample_z = ctx.texture(size, components=4, dtype="u4")
+        # lo parts of z and sample_z in double-double precision, their reference orbit index in perturbation
+        self.z_low = ctx.texture(size, components=4, dtype="u4") if low_state else None
+        self.sample_z_low = ctx.texture(size, components=4, dtype="u4") if low_state else None
+        for tex in self._textures:
+            tex.filter = (gl.NEAREST, gl.NEAREST)
+        self.fbo = ctx.framebuffer(color_attachments=self._textures[1:])  # main.frag's outputs
+        self.color_fbo = ctx.framebuffer(self.color)  # coloring pass output, copied to the screen
+        self.scale = None
+        self.translation = None
+        self.aspect_ratio = None  # of the window, not of the frame (frames can have a lower resolution)
+        self.valid = False  # the iteration data can be reused
+
+    @property
+    def _textures(self):
+        textures = [self.color, self.anti_aliased, self.data, self.z, self.samples, self.sample_z]
+        return textures + [self.z_low, self.sample_z_low] if self.low_state else textures
+
+    def bindStateTextures(self, program: gl.Program, first_location: int):
+        uniforms = ("uCache", "uCacheZ", "uCacheSamples", "uCacheSampleZ", "uCacheZLow", "uCacheSampleZLow")
+        textures = self._textures[2:]
+        if not self.low_state:
+            # There are no lo parts, but the samplers still need integer textures
+            textures += [self.z, self.sample_z]
+        for i, (tex, uniform) in enumerate(zip(textures, uniforms)):
+            tex.use(first_location + i)
+            if program.get(uniform, None) is not None:
+                program[uniform] = first_location + i
+
+    def release(self):
+        self.fbo.release()
+        self.color_fbo.release()
+        for tex in self._textures:
+            tex.release()
+
+class ProgramCache:
+    """
+    Compiled programs by (fractal shader function, precision, hash of the sources), the least recently used ones are
+    released once there are more than capacity. Programs in use must be among the capacity most recently requested ones.
+    Nothing is kept on disk: moderngl can't create programs from driver program binaries, the drivers' own shader disk
+    caches (Mesa, NVIDIA) speed up compiling the same sources after a restart instead.
+    """
+    def __init__(self, ctx: gl.Context, capacity: int = PROGRAM_CACHE_SIZE):
+        self._ctx = ctx
+        self.capacity = capacity
+        self._programs: OrderedDict[Tuple[str, str, str], gl.Program] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def program(self, fractal: str, precision: Precisions, vertex_shader: str, fragment_shader: str) -> gl.Program:
+        source_hash = hashlib.sha1(f"{vertex_shader}\0{fragment_shader}".encode()).hexdigest()
+        key = (fractal, precision.name, source_hash)
+        program = self._programs.get(key)
+        if program is not None:
+            self._programs.move_to_end(key)
+            self.hits += 1
+            return program
+        self.misses += 1
+        program = self._ctx.program(vertex_shader=vertex_shader, fragment_shader=fragment_shader)
+        self._programs[key] = program
+        while len(self._programs) > self.capacity:
+            self._programs.popitem(last=False)[1].release()
+        return program
+
+    def __len__(self) -> int:
+        return len(self._programs)
+
+    def release(self):
+        for program in self._programs.values():
+            program.release()
+        self._programs.clear()
+
+@dataclass
+class _RenderPass:
+    """An image that takes one or more submissions to render (see ITERATIONS_PER_SUBMISSION)."""
+    anti_aliasing: bool  # jittered samples that are mixed into the last image, otherwise the pixel centers
+    submissions: int  # needed to finish every pixel
+    hash_seed: int
+    old_frame_mix: float = 0
+    swizzle: float = 0
+    submitted: int = 0
+    tiles: Optional[List[Rect]] = None  # not rendered yet in the current submission, None if it hasn't started
+
+    @property
+    def done(self) -> bool:
+        return self.submitted >= self.submissions
+
 class FractalRenderer:
     # noinspection PyTypeChecker
-    def __init__(self, ctx: gl.Context, wnd: BaseWindow, settings: Settings):
+    def __init__(self, ctx: gl.Context, wnd: "BaseWindow", settings: Settings, profiler: FrameProfiler = None,
+                 screen: gl.Framebuffer = None):
+        """:param screen: the framebuffer the image is shown on, the window's by default (offscreen rendering)"""
         self._ctx = ctx
         self._window = wnd
+        self._screen_fbo = screen
         self._settings = settings
+        self.profiler = profiler if profiler is not None else FrameProfiler()
         self.frame_time = 0
 
         # ----- Camera -----
         self.scale = 100
+        self.origin = (Decimal(0), Decimal(0))  # translation and target_translation are relative to this
         self.translation = Vec2(0, 0)
         self.target_scale = 1.5
         self.target_translation = Vec2(0, 0)
@@ -45,15 +203,45 @@ class FractalRenderer:
         self._main_vao: gl.VertexArray = None
         self._vsh_source = None
         self._fsh_source = None
+        self._shader_modules: ShaderModules = None  # of shaders/fractals.glsl, linked into the main fragment shader
         self._main_program: gl.Program = None
-        self._last_frame: gl.Texture = None
-        self._last_frame_fbo: gl.Framebuffer = None
+        # Compiled variants of the main program, for the precision in use and the ones next to it (automatic precision)
+        self._main_programs: Dict[Precisions, Tuple[gl.Program, gl.VertexArray]] = {}
+        self.program_cache = ProgramCache(ctx)  # owns the main programs
+        self.precision = settings.precision  # the precision in use
+        self._last_frame: _FrameTarget = None  # the frame on screen
+        self._next_frame: _FrameTarget = None  # the one that is rendered to next
+        self._resized = False
+        self._upscale_program: gl.Program = None
+        self._upscale_vao: gl.VertexArray = None
+        self._upscale_sampler = self._ctx.sampler(filter=(gl.LINEAR, gl.LINEAR), repeat_x=False, repeat_y=False)
+        self._color_program: gl.Program = None
+        self._color_vao: gl.VertexArray = None
+        self._anti_aliased_valid = False  # the last frame's anti-aliased image has the current colors
+        self._reference_orbit: Optional[deep_zoom.ReferenceOrbit] = None  # of the view's center, in perturbation
+        self._reference_orbit_tex: gl.Texture = None
         self.onResize(self._window.size)
         self.static_frames = 1
         self.rendered = True
         self.should_apply_aa = True
+        self.render_time = 0  # of the last frame in nanoseconds, measured on the GPU
+        self._frame_time_query = self._ctx.query(time=True)
+        self._rendered_moving = False  # the last frame was rendered with the dynamic resolution scale
+        self.render_scale = 1.  # resolution scale of the frame on screen
+        self._pass: Optional[_RenderPass] = None
+        self._center_complete = False  # every pixel center has been iterated to the limit, anti-aliasing can start
+        self._moving_render_scale = 1.  # resolution scale for frames while the camera moves, adapted to render_time
+        self._tile_pixel_budget = RENDER_TILE_SIZE ** 2  # pixels of tiles rendered per frame, adapted to render_time
+        self._tile_pixels = 0  # pixels of tiles rendered in the last frame
         self._color_palette_tex: gl.Texture = None
         self.reloadColorPalette()
+        self._statistics_program: gl.Program = None
+        self._statistics_vao: gl.VertexArray = None
+        self._statistics_fbo = self._ctx.framebuffer(self._ctx.texture(STATISTICS_GRID, components=2, dtype="f4"))
+        self.undecided_fraction = 0.  # of the pixels in the last finished image, see AUTO_ITERATIONS_UNDECIDED
+        self._iterations_raised_from: Optional[float] = None  # undecided fraction before the last automatic doubling
+        self._iterations_decided = 0.  # fraction of the pixels the last automatic doubling decided
+        self._iterations_stalled = False  # doubling the limit didn't help in this view
 
         # ----- Path rendering -----
         self._path_program: gl.Program = None
@@ -66,33 +254,40 @@ class FractalRenderer:
 
         self.reloadShaders(reload_source=True)
 
-    def _preProcessMainFragmentShader(self, source: str):
-        source = source.replace("PY_FRACTAL_FUNC", self._settings.fractal.shader_func)
-        source = source.replace("PY_PRECISION_DEFINE", "define" if self._settings.double_precision else "undef")
-        source = source.replace(
-            "PY_INSERT_RANDOMLY_GENERATED_FUNCTIONS;",
-            "".join(f.glsl_source for f in fractals.FRACTALS if f.glsl_source is not None)
-        )
+    def _preProcessMainFragmentShader(self, source: str, precision: Precisions, modules: ShaderModules):
+        fractal = self._settings.fractal
+        if fractal.glsl_source is not None:
+            # Only the selected generated fractal is linked, so the source doesn't grow with the number of them
+            modules = modules.copy()
+            modules.add(fractal.shader_func, fractal.glsl_source)
+        interior_func = (fractal.shader_interior_func if self._settings.interior_detection else None) or "no_interior"
+        if precision is Precisions.Perturbation:
+            interior_func = "no_interior"  # pixels only know their offset from the reference orbit's c
+        source = source.replace("PY_LINKED_MODULES;", modules.link([fractal.shader_func, interior_func]))
+        source = source.replace("PY_FRACTAL_FUNC", fractal.shader_func)
+        source = source.replace("PY_INTERIOR_FUNC", interior_func)
+        source = source.replace("PY_PRECISION_DEFINE", "define" if precision.uses_doubles else "undef")
+        source = source.replace("PY_DOUBLE_DOUBLE_DEFINE", "define" if precision is Precisions.DoubleDouble else "undef")
+        source = source.replace("PY_PERTURBATION_DEFINE", "define" if precision is Precisions.Perturbation else "undef")
         return source
 
     def reloadShaders(self, reload_source: bool):
-        v_source, f_source = self._vsh_source, self._fsh_source
+        v_source, f_source, modules = self._vsh_source, self._fsh_source, self._shader_modules
         if reload_source:
-            with open(assets_path("shaders/main.vert")) as vsh_file, open(assets_path("shaders/main.frag")) as fsh_file:
+            with open(assets_path("shaders/main.vert")) as vsh_file, open(assets_path("shaders/main.frag")) as fsh_file, open(
+                    assets_path("shaders/fractals.glsl")) as modules_file:
                 v_source, f_source = vsh_file.read(), fsh_file.read()
-        org_v_source, org_f_source = v_source, f_source
-        f_source = self._preProcessMainFragmentShader(f_source)
-        new_program = self._ctx.program(vertex_shader=v_source, fragment_shader=f_source)
-
-        new_render_obj = self._ctx.vertex_array(new_program, [(self._screen_quad_vbo, "2f 2f", "vert", "texCoord")])
-        if self._main_vao is not None:
-            self._main_program.release()
-            self._main_vao.release()
-        self._main_program = new_program
-        self._main_vao = new_render_obj
-
-        self._vsh_source, self._fsh_source = org_v_source, org_f_source
-
+                modules = ShaderModules()
+                modules.load(modules_file.read())
+        self.precision = self._requiredPrecision()
+        self._updateMainPrograms(v_source, f_source, modules)
+
+        if self._next_frame.low_state != self._low_state_frames:
+            # Double-double precision and perturbation have more state textures, the state is recomputed anyway
+            for frame in (self._last_frame, self._next_frame):
+                frame.release()
+            self._last_frame = _FrameTarget(self._ctx, self._last_frame.size, self._low_state_frames)
+            self._next_frame = _FrameTarget(self._ctx, self._next_frame.size, self._low_state_frames)
         self.reRender()
 
         if reload_source:
@@ -103,25 +298,139 @@ class FractalRenderer:
                     self._path_program.release()
                 self._path_program = new_path_program
 
-    def reloadColorPalette(self):
-        data = np.full(shape=COLOR_PALETTE_SAMPLES*4, fill_value=255, dtype=np.uint8)
-        gradient = self._settings.color_palette
-        for i in range(COLOR_PALETTE_SAMPLES):
-            color = color_utils.getColorInGradient(gradient, i / COLOR_PALETTE_SAMPLES, True)
-            data[i*4+0] = min(max(floor(color[0]*255), 0), 255)
-            data[i*4+1] = min(max(floor(color[1]*255), 0), 255)
-            data[i*4+2] = min(max(floor(color[2]*255), 0), 255)
-
-        if self._color_palette_tex is not None:
-            self._color_palette_tex.release()
-        self._color_palette_tex = self._ctx.texture((COLOR_PALETTE_SAMPLES, 1), components=4, dtype="nu1", data=data)
-        self._color_palette_tex.filter = (gl.LINEAR, gl.NEAREST)
-        self._color_palette_tex.repeat_x = True
+            with open(assets_path("shaders/upscale.frag")) as upscale_fsh:
+                new_upscale_program = self._ctx.program(vertex_shader=v_source, fragment_shader=upscale_fsh.read())
+                if self._upscale_program is not None:
+                    self._upscale_program.release()
+                    self._upscale_vao.release()
+                self._upscale_program = new_upscale_program
+                self._upscale_vao = self._ctx.vertex_array(new_upscale_program, [(self._screen_quad_vbo, "2f 2f", "vert", "texCoord")])
+
+            with open(assets_path("shaders/color.frag")) as color_fsh:
+                new_color_program = self._ctx.program(vertex_shader=v_source, fragment_shader=color_fsh.read())
+                if self._color_program is not None:
+                    self._color_program.release()
+                    self._color_vao.release()
+                self._color_program = new_color_program
+                self._color_vao = self._ctx.vertex_array(new_color_program, [(self._screen_quad_vbo, "2f 8x", "vert")])
+
+            with open(assets_path("shaders/statistics.frag")) as statistics_fsh:
+                new_statistics_program = self._ctx.program(vertex_shader=v_source, fragment_shader=statistics_fsh.read())
+                if self._statistics_program is not None:
+                    self._statistics_program.release()
+                    self._statistics_vao.release()
+                self._statistics_program = new_statistics_program
+                self._statistics_vao = self._ctx.vertex_array(new_statistics_program, [(self._screen_quad_vbo, "2f 8x", "vert")])
+
+    def _mainProgram(self, precision: Precisions, v_source: str, f_source: str, modules: ShaderModules) -> gl.Program:
+        """From the cache, compiled if it isn't in it."""
+        return self.program_cache.program(
+            self._settings.fractal.shader_func, precision, v_source,
+            self._preProcessMainFragmentShader(f_source, precision, modules)
+        )
 
+    def _precisionLadder(self, precision: Precisions) -> List[Precisions]:
+        """The precisions to keep main programs for: the one in use, and with automatic precision the ones next to it."""
+        if not self._settings.auto_precision:
+            return [precision]
+        ladder = self._precisions
+        i = ladder.index(precision)
+        return ladder[max(i - 1, 0):i + 2]
+
+    def _updateMainPrograms(self, v_source: str = None, f_source: str = None, modules: ShaderModules = None):
+        """
+        Get the programs of the precision ladder (for the current fractal, sources and modules, the last ones by default), the
+        ones in use are kept if the sources didn't change. Every program is requested, so they are the most recently
+        used ones in the cache.
+        """
+        v_source = v_source if v_source is not None else self._vsh_source
+        f_source = f_source if f_source is not None else self._fsh_source
+        modules = modules if modules is not None else self._shader_modules
+        # Compiled before anything is changed, the old programs stay in use if compiling fails
+        programs = {p: self._mainProgram(p, v_source, f_source, modules) for p in self._precisionLadder(self.precision)}
+        old_programs, self._main_programs = self._main_programs, {}
+        for precision, program in programs.items():
+            old_program, vao = old_programs.pop(precision, (None, None))
+            if program is not old_program:
+                if vao is not None:
+                    vao.release()
+                vao = self._ctx.vertex_array(program, [(self._screen_quad_vbo, "2f 2f", "vert", "texCoord")])
+            self._main_programs[precision] = program, vao
+        for _, vao in old_programs.values():
+            vao.release()
+        self._main_program, self._main_vao = self._main_programs[self.precision]
+        self._vsh_source, self._fsh_source, self._shader_modules = v_source, f_source, modules
+
+    @property
+    def _precisions(self) -> List[Precisions]:
+        """The precisions the current fractal can be rendered with."""
+        return list(Precisions) if self._settings.fractal.perturbation else list(Precisions)[:-1]
+
+    @property
+    def min_scale(self) -> float:
+        """The deepest view scale the precision setting allows, views are kept above it."""
+        top_precision = self._precisions[-1] if self._settings.auto_precision else self._requiredPrecision()
+        return top_precision.min_scale
+
+    def _requiredPrecision(self) -> Precisions:
+        """The precision to render the current view with (see settings.requiredPrecision)."""
+        if not self._settings.auto_precision:
+            return min(self._settings.precision, self._precisions[-1], key=lambda p: p.value[0])
+        # Zooming in switches early, so no frame is rendered with too little precision
+        scale = min(self.scale, self.target_scale)
+        position = max(abs(float(v)) for v in self.absoluteTranslation() + self.absoluteTranslation(self.target_translation))
+        perturbation = self._settings.fractal.perturbation
+        precision = requiredPrecision(scale, self._window.height, position, perturbation=perturbation)
+        if precision.value[0] < self.precision.value[0]:
+            # Only drop to a cheaper precision once it is clearly enough
+            precision = requiredPrecision(scale, self._window.height, position, PRECISION_HYSTERESIS, perturbation)
+            if precision.value[0] > self.precision.value[0]:
+                precision = self.precision
+        return precision
+
+    def _switchPrecision(self, precision: Precisions):
+        # The program for the new precision is usually compiled already, the one after it is compiled now,
+        # long before the view gets there (this frame starts over anyway, the state of another precision can't be continued)
+        self.precision = precision
+        self._updateMainPrograms()
         self.reRender()
 
-    def reRender(self):
+    def reloadColorPalette(self):
+        data = color_utils.gradientToPalette(
+            self._settings.color_palette, color_utils.COLOR_PALETTE_SAMPLES, True, self._settings.color_interpolation
+        )
+
+        if self._color_palette_tex is None:
+            self._color_palette_tex = self._ctx.texture((color_utils.COLOR_PALETTE_SAMPLES, 1), components=4, dtype="nu1")
+            self._color_palette_tex.filter = (gl.LINEAR, gl.NEAREST)
+            self._color_palette_tex.repeat_x = True
+        self._color_palette_tex.write(data)
+
+        self.recolor()
+
+    def recolor(self):
+        """Color the image again from its iteration state (the palette or the color speed changed)."""
+        # A partially rendered frame has the old colors, and anti-aliasing has to start over
+        self._anti_aliased_valid = False
+        self._pass = None
+        self.static_frames = 1
+        if self._color_program is not None:
+            self._colorFrame(self._last_frame)
+
+    def reRender(self, keep_iterations: bool = False):
+        """
+        Render the image again.
+
+        :param keep_iterations: the change doesn't affect the iteration state that was already computed (colors,
+            the iteration limit or anti-aliasing), it is reused and continued
+        """
         self.static_frames = 1
+        self._pass = None
+        self._center_complete = False
+        if not keep_iterations:
+            self._resetIterationLimitState()
+            if self._last_frame is not None:
+                self._last_frame.valid = False
 
     def setFractal(self, fractal: fractals.FractalType):
         self._settings.fractal = fractal
@@ -131,8 +440,42 @@ class FractalRenderer:
     def toNDR(self, pixel_pos: Tuple[float, float]):
         return Vec2(pixel_pos[0] / self._window.width, -pixel_pos[1] / self._window.height) * 2 - Vec2(1, -1)
 
+    @property
+    def _screen(self) -> gl.Framebuffer:
+        return self._screen_fbo if self._screen_fbo is not None else self._ctx.screen
+
+    @property
+    def _low_state_frames(self) -> bool:
+        """
+        Frames have the state textures of double-double precision and perturbation (automatic precision may switch to
+        them any time)
+        """
+        return self._settings.auto_precision or self._settings.precision in (Precisions.DoubleDouble, Precisions.Perturbation)
+
+    @property
+    def _origin_digits(self) -> int:
+        """Digits of the origin, enough for the view and the one zoomed to."""
+        return max(ORIGIN_DIGITS, deep_zoom.digitsForScale(min(self.scale, self.target_scale)))
+
+    def absoluteTranslation(self, translation: Vec2 = None) -> Tuple[Decimal, Decimal]:
+        """A translation (the current one by default) in fractal coordinates, at the precision of the origin."""
+        translation = self.translation if translation is None else translation
+        with localcontext() as ctx:
+            ctx.prec = self._origin_digits
+            return self.origin[0] + Decimal(translation.x), self.origin[1] + Decimal(translation.y)
+
+    def _rebaseOrigin(self, shift: Vec2):
+        """Move the origin by shift, without moving the camera."""
+        self.origin = self.absoluteTranslation(shift)
+        self.translation -= shift
+        self.target_translation -= shift
+        for frame in (self._last_frame, self._next_frame):
+            if frame.translation is not None:
+                frame.translation = frame.translation - shift
+
     def transform(self, ndr: Vec2):
-        return Vec2(ndr.x * self._window.aspect_ratio, ndr.y) * self.scale + self.translation
+        x, y = self.absoluteTranslation(Vec2(ndr.x * self._window.aspect_ratio, ndr.y) * self.scale + self.translation)
+        return Vec2(float(x), float(y))
 
     def scroll(self, delta: float, ndr: Vec2):
         ndr = Vec2(-ndr.x * self._window.aspect_ratio, -ndr.y)
@@ -144,90 +487,384 @@ class FractalRenderer:
     def drag(self, rel: Tuple[float, float]):
         self.target_translation += Vec2(-rel[0], rel[1]) / self._window.height * 2 * self.scale
 
+    @property
+    def view(self) -> Transformation:
+        """The current camera, exactly."""
+        return Transformation(self.absoluteTranslation(), self.scale)
+
+    def setView(self, view: Transformation):
+        """Jump to a view, the origin moves to its center so the GPU only gets small offsets from it."""
+        with localcontext() as ctx:
+            ctx.prec = max(ORIGIN_DIGITS, view.digits)
+            self.origin = (+view.center[0], +view.center[1])
+        self.translation, self.target_translation = Vec2(0, 0), Vec2(0, 0)
+        # Deeper views are clamped right away, moving towards a view that can't be reached would never finish
+        self.scale = self.target_scale = max(view.scale, self.min_scale)
+        self.reRender()
+
     def resetTransformation(self):
-        self.target_translation = Vec2(0)
+        self.target_translation = -Vec2(float(self.origin[0]), float(self.origin[1]))
         self.target_scale = 1.5
 
     def _updateTransformation(self, dt: float):
         spd = 10
         dt = min(dt, 1/(spd+.1))
 
-        self.target_scale = max(self.target_scale, 1E-16 if self._settings.double_precision else 1E-7)
+        self.target_scale = max(self.target_scale, self.min_scale)
 
-        if (self.target_translation - self.translation).length_sqr < (self.scale / self._window.width * 2)**2:
+        # Compared in view scales, squared lengths of deep views are below the smallest double
+        if ((self.target_translation - self.translation) / self.scale).length_sqr < (2 / self._window.width)**2:
             self.translation = +self.target_translation
         if abs(self.target_scale - self.scale) < self.target_scale * (2 / self._window.width):
             self.scale = self.target_scale
 
         self.scale += (self.target_scale - self.scale) * dt * 10
         self.translation += (self.target_translation - self.translation) * dt * 10
+        if (self.translation / self.scale).length_sqr > ORIGIN_REBASE_DISTANCE ** 2:
+            self._rebaseOrigin(+self.translation)
 
     def onResize(self, size: Tuple[int, int]):
-        if self._last_frame is not None:
-            self._last_frame.release()
-            self._last_frame_fbo.release()
-        self._last_frame = self._ctx.texture(size, components=4)
-        self._last_frame.filter = (gl.NEAREST, gl.NEAREST)
-        self._last_frame_fbo = self._ctx.framebuffer(
-            self._last_frame,
-            self._ctx.depth_renderbuffer(size))
-
-        self.reRender()
+        # The last frame is kept at its old size, so the next frame can still reproject from it
+        if self._next_frame is not None:
+            self._next_frame.release()
+        self._next_frame = _FrameTarget(self._ctx, size, self._low_state_frames)
+        if self._last_frame is None:
+            self._last_frame = _FrameTarget(self._ctx, size, self._low_state_frames)
 
-    def _applyCameraUniforms(self, program: gl.Program):
+        self.static_frames = 1
+        # Reprojecting is only possible if there is something to reproject
+        self._resized = self._last_frame.valid
+
+    def _applyCameraUniforms(self, program: gl.Program, translation: Vec2 = None, precision: Precisions = None):
+        """
+        :param precision: of the program, uTranslation is a double-double dvec4 (x.hi, x.lo, y.hi, y.lo) in
+            double-double precision, and the offset from the reference orbit's c in perturbation, see main.frag
+        """
+        x, y = self.absoluteTranslation(translation)
         program["uScale"] = self.scale
-        program["uTranslation"] = self.translation
-
-    def _renderFractalImage(self):
-        if self.scale == self.target_scale and self.translation == self.target_translation:
-            self.static_frames += 1
-            if self._settings.static_frame_mix == 0:
-                old_frame_mix = 0
-            else:
-                old_frame_mix = (1 - (1 / (self.static_frames * self._settings.static_frame_mix)))
+        if precision is Precisions.DoubleDouble:
+            program["uTranslation"] = splitDecimal(x) + splitDecimal(y)
+        elif precision is Precisions.Perturbation:
+            with localcontext() as ctx:
+                ctx.prec = self._origin_digits
+                cx, cy = self._reference_orbit.center
+                program["uTranslation"] = (float(x - cx), float(y - cy))
         else:
+            program["uTranslation"] = (float(x), float(y))
+
+    def _nextPass(self) -> Optional[_RenderPass]:
+        hash_seed = random.randint(-(2 ** 31), (2 ** 31) - 1)
+        if not self._center_complete:
             self.static_frames = 1
-            old_frame_mix = 0
-        ulp_mul = 1 if self._settings.double_precision else (2 ** 27)
-        ulp = max(math.ulp(self.translation.x), math.ulp(self.translation.y)) * ulp_mul
-        self.should_apply_aa = (self._settings.static_frame_mix != 0) and self.scale / self._window.aspect_ratio > ulp * self._window.width
-        if not self.should_apply_aa:
-            old_frame_mix = 0
+            return _RenderPass(False, math.ceil(self._settings.iterations / ITERATIONS_PER_SUBMISSION), hash_seed)
 
+        self.static_frames += 1
+        if not self.should_apply_aa:
+            return None
+        old_frame_mix = (1 - (1 / (self.static_frames * self._settings.static_frame_mix)))
         if old_frame_mix > .95:
-            self._ctx.copy_framebuffer(src=self._last_frame_fbo, dst=self._ctx.screen)
+            return None
+        submissions = math.ceil((self._settings.iterations + 1) * self._settings.render_samples / ITERATIONS_PER_SUBMISSION)
+        return _RenderPass(True, submissions, hash_seed, old_frame_mix, self.scale / self._window.height)
+
+    def _renderFractalImage(self):
+        # Frames while resizing are treated like moving ones (the last frame can be reprojected)
+        moving = self.scale != self.target_scale or self.translation != self.target_translation or self._resized
+        self._resized = False
+        if moving:
+            self._pass = None
+            self._center_complete = False
+            self._resetIterationLimitState()
+        precision = self._requiredPrecision()
+        if precision is not self.precision:
+            self._switchPrecision(precision)
+        if self.precision is Precisions.Perturbation:
+            self._updateReferenceOrbit()
+        x, y = self.absoluteTranslation()
+        ulp = self.precision.ulp(max(abs(float(x)), abs(float(y))))
+        self.should_apply_aa = (self._settings.static_frame_mix != 0) and self.scale / self._window.aspect_ratio > ulp * self._window.width
+
+        if self._pass is None or self._pass.done:
+            self._pass = self._nextPass()
+        render_pass = self._pass
+        self._rendered_moving = render_pass is not None and moving and self._settings.dynamic_resolution
+        if render_pass is None:
+            self._presentFrame()
             self.rendered = False
             return
         self.rendered = True
 
-        self._last_frame.use(0)
-        self._main_program["uLastFrame"] = 0
-        self._main_program["uOldFramesMixFactor"] = old_frame_mix
-        self._main_program["uHashSeed"] = random.randint(-(2 ** 31), (2 ** 31) - 1)
+        if render_pass.tiles is None:
+            self.render_scale = self._moving_render_scale if self._rendered_moving else 1.
+            size = self._renderSize()
+            if self._next_frame.size != size:
+                self._next_frame.release()
+                self._next_frame = _FrameTarget(self._ctx, size, self._low_state_frames)
+            # Moving frames are rendered at once, the camera is different in the next frame anyway
+            render_pass.tiles = [(0, 0) + size] if moving else self._beginTiledSubmission()
+
+        self._last_frame.anti_aliased.use(0)
+        self._main_program["uLastAntiAliased"] = 0
+        self._main_program["uUseAntiAliased"] = self._anti_aliased_valid
+        self._main_program["uOldFramesMixFactor"] = render_pass.old_frame_mix
+        self._main_program["uSwizzleMultiplier"] = render_pass.swizzle
+        # Anti-aliasing samples must keep their positions until they are done, reprojection picks new blocks every time
+        self._main_program["uHashSeed"] = render_pass.hash_seed if render_pass.anti_aliasing else random.randint(-(2 ** 31), (2 ** 31) - 1)
         # self.main_program["uTime"] = frame_time
+        self._main_program["uAntiAliasingPass"] = render_pass.anti_aliasing
+        self._main_program["uContinuePass"] = render_pass.submitted > 0
+        self._main_program["uPassIters"] = ITERATIONS_PER_SUBMISSION
 
-        self._applyCameraUniforms(self._main_program)
+        reproject = self._last_frame.valid and not render_pass.anti_aliasing
+        translation = self._snapTranslation() if reproject and moving else +self.translation
+        self._applyReprojectionUniforms(reproject, translation, REPROJECTION_REFINE_FRACTION if moving else 1)
+        self._last_frame.bindStateTextures(self._main_program, 2)
+
+        self._applyCameraUniforms(self._main_program, translation, self.precision)
         try:
             self._main_program["uAspectRatio"] = self._window.aspect_ratio
         except KeyError as e:
             print("uAspectRatio doesn't exist in main program???")
 
-        swizzle = self.scale / self._window.height
-        if not self.should_apply_aa:
-            swizzle = 0
-        self._main_program["uSwizzleMultiplier"] = swizzle if self.static_frames > 1 else 0
-
         self._color_palette_tex.use(1)
         self._main_program["uColorPalette"] = 1
         self._main_program["uColorChangeSpeed"] = self._settings.color_change_speed
         self._main_program["uSamples"] = self._settings.render_samples
         self._main_program["uIters"] = self._settings.iterations
         self._main_program["uEscapeThreshold"] = self._settings.render_escape_threshold ** 2
+        if self.precision is Precisions.Perturbation:
+            self._reference_orbit_tex.use(8)
+            self._main_program["uReferenceOrbit"] = 8
+            self._main_program["uReferenceLength"] = len(self._reference_orbit)
+        else:
+            self._main_program["uPeriodicityThreshold"] = fractals.periodicityThreshold(self.scale, self._next_frame.size[1]) if self._settings.interior_detection else 0
+
+        self._next_frame.fbo.use()
+        budget = math.inf if moving else self._tile_pixel_budget
+        self._tile_pixels = 0
+        rendered_tiles = []
+        while render_pass.tiles and self._tile_pixels < budget:
+            tile = render_pass.tiles.pop(0)
+            self._next_frame.fbo.scissor = tile
+            # noinspection PyTypeChecker
+            self._main_vao.render(mode=gl.TRIANGLE_STRIP)
+            rendered_tiles.append(tile)
+            self._tile_pixels += tile[2] * tile[3]
+        self._next_frame.fbo.scissor = None
+        if render_pass.anti_aliasing:
+            # Pixels without finished samples are marked in the anti-aliased image from now on
+            self._anti_aliased_valid = True
+        self._colorFrame(self._next_frame, rendered_tiles)
+        if moving:
+            self._tile_pixels = 0
+        if render_pass.tiles:
+            # Partially refined, the rest of the tiles still show the last frame
+            self._presentFrame(self._next_frame)
+            return
+
+        render_pass.tiles = None
+        render_pass.submitted += 1
+        center_completed = render_pass.done and not moving and not self._center_complete
+        if render_pass.done and not moving:
+            self._center_complete = True
+        self._next_frame.scale = self.scale
+        self._next_frame.translation = translation
+        self._next_frame.aspect_ratio = self._window.aspect_ratio
+        self._next_frame.valid = True
+        self._last_frame, self._next_frame = self._next_frame, self._last_frame
+
+        self._presentFrame()
+        if center_completed and self._settings.auto_iterations:
+            self._adaptIterationLimit()
+
+    def _updateReferenceOrbit(self):
+        """
+        Compute the reference orbit at the view's center if there is none yet, or if the view is too far from it or
+        too deep for its digits. The iteration state of the last frame is relative to the old one, it starts over.
+        The orbit isn't extended when the iteration limit is raised, pixels rebase to its start once they reach its end.
+        """
+        orbit = self._reference_orbit
+        scale = min(self.scale, self.target_scale)
+        x, y = self.absoluteTranslation()
+        if orbit is not None and orbit.escape_threshold == self._settings.render_escape_threshold \
+                and orbit.digits >= deep_zoom.digitsForScale(scale):
+            with localcontext() as ctx:
+                ctx.prec = self._origin_digits
+                if abs(x - orbit.center[0]) + abs(y - orbit.center[1]) < Decimal(self.scale * REFERENCE_MAX_OFFSET):
+                    return
+
+        orbit = deep_zoom.ReferenceOrbit(
+            (x, y), self._settings.iterations + 1, self._settings.render_escape_threshold,
+            deep_zoom.digitsForScale(scale) + REFERENCE_EXTRA_DIGITS
+        )
+        rows = math.ceil(len(orbit) / REFERENCE_ORBIT_WIDTH)
+        data = np.zeros(rows * REFERENCE_ORBIT_WIDTH, dtype=np.complex128)
+        data[:len(orbit)] = orbit.z
+        if self._reference_orbit_tex is not None:
+            self._reference_orbit_tex.release()
+        # Every texel is a complex128 as 4 uints, unpacked with packDouble2x32
+        self._reference_orbit_tex = self._ctx.texture((REFERENCE_ORBIT_WIDTH, rows), components=4, data=data, dtype="u4")
+        self._reference_orbit_tex.filter = (gl.NEAREST, gl.NEAREST)
+        self._reference_orbit = orbit
+        self.reRender()
 
+    def _renderSize(self) -> Tuple[int, int]:
+        width, height = self._window.size
+        return max(1, round(width * self.render_scale)), max(1, round(height * self.render_scale))
+
+    def _adaptRenderScale(self, frame_time: float):
+        # The cost is about proportional to the pixel count
+        change = math.sqrt(self._settings.frame_time_budget / 1000 / max(frame_time, 1E-6))
+        render_scale = self._moving_render_scale * min(max(change, .5), 1.25)
+        self._moving_render_scale = min(max(render_scale, DYNAMIC_RESOLUTION_MIN_SCALE), 1.)
+
+    def _adaptTileBudget(self, frame_time: float):
+        change = self._settings.frame_time_budget / 1000 / max(frame_time, 1E-6)
+        # A frame that ran out of tiles before using up the budget says nothing about how many more would have fit
+        if change < 1 or self._tile_pixels >= self._tile_pixel_budget:
+            budget = self._tile_pixel_budget * min(max(change, .5), 2)
+            self._tile_pixel_budget = min(max(budget, RENDER_TILE_SIZE ** 2), 2 ** 26)
+
+    def _sampleIterationStates(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Iteration counts and states of the last frame on the STATISTICS_GRID."""
+        self._statistics_fbo.use()
+        self._last_frame.data.use(0)
+        self._statistics_program["uData"] = 0
+        self._statistics_program["uGridSize"] = STATISTICS_GRID
         # noinspection PyTypeChecker
-        self._main_vao.render(mode=gl.TRIANGLE_STRIP)
+        self._statistics_vao.render(mode=gl.TRIANGLE_STRIP)
+        samples = np.frombuffer(self._statistics_fbo.read(components=2, dtype="f4"), dtype=np.float32).reshape(-1, 2)
+        self._screen.use()
+        return samples[:, 0].astype(np.int64), samples[:, 1].astype(np.int32)
+
+    def _resetIterationLimitState(self):
+        """The view changed, what was learned about its iteration limit doesn't apply anymore."""
+        self._iterations_raised_from = None
+        self._iterations_decided = 0.
+        self._iterations_stalled = False
+
+    def _adaptIterationLimit(self):
+        """
+        Double the iteration limit while too many pixels of the finished image are undecided, or lower it as far as
+        that keeps them few. The iteration state is kept either way, raising only continues the undecided pixels.
+        """
+        its, states = self._sampleIterationStates()
+        escaped_its = np.sort(its[states == STATE_ESCAPED])
+        running = np.count_nonzero(states == STATE_RUNNING)
+
+        def undecided(limit: int) -> float:
+            # Escaping at or after the limit counts as not escaping
+            return (running + escaped_its.size - np.searchsorted(escaped_its, limit)) / its.size
+
+        limit = self._settings.iterations
+        min_limit, max_limit = AUTO_ITERATIONS_RANGE
+        self.undecided_fraction = undecided(limit)
+        raised_from, self._iterations_raised_from = self._iterations_raised_from, None
+        decided, last_decided = 0., self._iterations_decided
+        if raised_from is not None:
+            decided = self._iterations_decided = raised_from - self.undecided_fraction
+        # Deep views escape more with every doubling at first (or nothing yet), a stall is when it decides few and fewer
+        fewer = decided < last_decided or (decided == 0 and escaped_its.size > 0)
+        if raised_from is not None and decided < raised_from * AUTO_ITERATIONS_MIN_PROGRESS and fewer:
+            new_limit = max(limit // 2, min_limit)
+            self._iterations_stalled = True
+        elif self.undecided_fraction > AUTO_ITERATIONS_UNDECIDED and not self._iterations_stalled:
+            new_limit = min(limit * 2, max_limit)
+            self._iterations_raised_from = self.undecided_fraction
+        else:
+            # Lowering must not make it raise again, in views where it doesn't raise (stalled) it may only add a few
+            max_undecided = self.undecided_fraction + AUTO_ITERATIONS_UNDECIDED / 2
+            if not self._iterations_stalled:
+                max_undecided = min(max_undecided, AUTO_ITERATIONS_UNDECIDED)
+            new_limit = min_limit
+            while new_limit < limit and undecided(new_limit) > max_undecided:
+                new_limit *= 2
+            new_limit = min(new_limit, limit)
+
+        if new_limit != limit:
+            self._settings.iterations = new_limit
+            self.reRender(keep_iterations=True)
+
+    def _beginTiledSubmission(self) -> List[Rect]:
+        """Start the next frame with the colors of the last one (for the tiles that aren't rendered yet), returns its tiles."""
+        self._drawFrameColor(self._last_frame, self._next_frame.color_fbo)
+        width, height = self._next_frame.size
+        tiles = [
+            (x, y, min(RENDER_TILE_SIZE, width - x), min(RENDER_TILE_SIZE, height - y))
+            for y in range(0, height, RENDER_TILE_SIZE)
+            for x in range(0, width, RENDER_TILE_SIZE)
+        ]
+        # The middle of the screen fills in first
+        tiles.sort(key=lambda t: (t[0] + t[2] / 2 - width / 2) ** 2 + (t[1] + t[3] / 2 - height / 2) ** 2)
+        return tiles
+
+    def _colorFrame(self, frame: _FrameTarget, tiles: List[Rect] = None):
+        """Coloring pass: color a frame (or some of its tiles) from its iteration state."""
+        frame.color_fbo.use()
+        frame.data.use(0)
+        self._color_palette_tex.use(1)
+        frame.anti_aliased.use(2)
+        self._color_program["uData"] = 0
+        self._color_program["uColorPalette"] = 1
+        self._color_program["uAntiAliased"] = 2
+        self._color_program["uUseAntiAliased"] = self._anti_aliased_valid
+        self._color_program["uColorChangeSpeed"] = self._settings.color_change_speed
+        self._color_program["uIters"] = self._settings.iterations
+        for tile in tiles or [None]:
+            frame.color_fbo.scissor = tile
+            # noinspection PyTypeChecker
+            self._color_vao.render(mode=gl.TRIANGLE_STRIP)
+        frame.color_fbo.scissor = None
+
+    def _drawFrameColor(self, frame: _FrameTarget, dst: gl.Framebuffer):
+        """Copy the colors of a frame, upscaled if it was rendered at a lower resolution."""
+        if frame.size == tuple(dst.size):
+            self._ctx.copy_framebuffer(src=frame.color_fbo, dst=dst)
+        else:
+            dst.use()
+            frame.color.use(0)
+            self._upscale_sampler.use(0)
+            self._upscale_program["uImage"] = 0
+            # noinspection PyTypeChecker
+            self._upscale_vao.render(mode=gl.TRIANGLE_STRIP)
+            self._upscale_sampler.clear(0)
+
+    def _presentFrame(self, frame: _FrameTarget = None):
+        """Show a frame (the last one by default) on the screen."""
+        self._drawFrameColor(frame or self._last_frame, self._screen)
+        self._screen.use()
+
+    def _snapTranslation(self) -> Vec2:
+        """While panning, move by whole pixels of the last frame, so all of its pixels can be reused exactly."""
+        last = self._last_frame
+        if self.scale != last.scale or self._next_frame.size != last.size or self._window.aspect_ratio != last.aspect_ratio:
+            return +self.translation
+        pixel = Vec2(last.scale * last.aspect_ratio * 2 / last.size[0], last.scale * 2 / last.size[1])
+        delta = self.translation - last.translation
+        return last.translation + Vec2(round(delta.x / pixel.x) * pixel.x, round(delta.y / pixel.y) * pixel.y)
+
+    def _applyReprojectionUniforms(self, reproject: bool, translation: Vec2, refine_fraction: float):
+        self._main_program["uReproject"] = reproject
+        if not reproject:
+            return
+        # Maps pixel coordinates of the new frame to the texel coordinates of the last one (both are bottom-up)
+        last = self._last_frame
+        width, height = self._next_frame.size
+        last_width, last_height = last.size
+        aspect_ratio, last_aspect_ratio = self._window.aspect_ratio, last.aspect_ratio
+        factor = (aspect_ratio * self.scale * last_width / (width * last.scale * last_aspect_ratio), self.scale * last_height / (height * last.scale))
+        offset = (
+            ((translation.x - last.translation.x - aspect_ratio * self.scale) / (last.scale * last_aspect_ratio) + 1) * last_width / 2,
+            ((translation.y - last.translation.y - self.scale) / last.scale + 1) * last_height / 2
+        )
+        exact = all(abs(f - 1) < 1E-6 for f in factor) and all(abs(o - round(o)) < 1E-3 for o in offset)
+        if exact:
+            factor, offset = (1, 1), (round(offset[0]), round(offset[1]))
 
-        self._ctx.copy_framebuffer(src=self._ctx.screen, dst=self._last_frame_fbo)
+        self._main_program["uCacheFactor"] = factor
+        self._main_program["uCacheOffset"] = offset
+        self._main_program["uCacheExact"] = exact
+        self._main_program["uRefineFraction"] = refine_fraction
 
     def startPathVisualization(self, pos: Vec2):
         self.path_buffer.clear()
@@ -251,21 +888,21 @@ class FractalRenderer:
             target_iters = int((frame_time - self._path_begin_time) * self._settings.path_speed)
             missing_iters = target_iters - self.path_current_iters
             if missing_iters > 0:
-                for i in range(missing_iters):
-                    try:
-                        next_z = self._settings.fractal.py_func(self._path_current_z, self._path_c_point)
-                    except ArithmeticError as e:
-                        logging.error(f"Path gen failed: {e}")
-                        self.path_should_generate = False
-                        break
-                    delta = next_z - self._path_current_z
-                    if abs(delta.real)+abs(delta.imag) < .0000001 or next_z.real*next_z.real + next_z.imag*next_z.imag > self._settings.audio_escape_threshold ** 2:
-                        self.path_should_generate = False
-                        break
-                    # print(self._path_current_z)
-                    self._path_current_z = next_z
-                    self.path_buffer.append(next_z)
-                    self.path_current_iters += 1
+                orbit = np.empty(missing_iters, dtype=np.complex128)
+                count, error = self._settings.fractal.orbit_func(
+                    self._path_current_z, self._path_c_point, orbit, missing_iters,
+                    self._settings.audio_escape_threshold ** 2, PATH_CONVERGENCE_DISTANCE ** 2
+                )
+                if error is not None:
+                    # The points before the error are kept
+                    logging.error(f"Path gen failed: {error}")
+                if count < missing_iters:  # escaped, converged or failed
+                    self.path_should_generate = False
+                if count > 0:
+                    # Only the points that are kept are converted
+                    self.path_buffer.extend(orbit[max(count - self._settings.path_segments - 1, 0):count].tolist())
+                    self._path_current_z = complex(orbit[count - 1])
+                    self.path_current_iters += count
 
         # ----- Removing Excess -----
         to_remove = len(self.path_buffer) - self._settings.path_segments - 1
@@ -295,6 +932,7 @@ class FractalRenderer:
     def _renderPaths(self, frame_time: float):
         if self._path_current_z is None:
             return
+        from pyrr import Matrix44
 
         self._updatePath(frame_time)
 
@@ -324,12 +962,25 @@ class FractalRenderer:
 
     def frame(self, frame_time: float, dt: float):
         self.frame_time = frame_time
-        self._updateTransformation(dt)
-        try:
-            self._renderFractalImage()
-        except Exception as e:
-            logging.error(f"Fractal render failed: {e}")
-        self._renderPaths(frame_time)
+        with self.profiler.phase("Transformation"):
+            self._updateTransformation(dt)
+        gpu_start = time.perf_counter_ns()
+        with self._frame_time_query:
+            with self.profiler.phase("Fractal"):
+                try:
+                    self._renderFractalImage()
+                except Exception as e:
+                    logging.error(f"Fractal render failed: {e}")
+            with self.profiler.phase("Path"):
+                self._renderPaths(frame_time)
+        self.render_time = self._frame_time_query.elapsed
+        self.profiler.record(GPU_PHASE, gpu_start, self.render_time)
+        if self._rendered_moving:
+            self._adaptRenderScale(self.render_time / 1E9)
+        if self._tile_pixels > 0:
+            self._adaptTileBudget(self.render_time / 1E9)
 
     def drawCoordinateAxis(self):
-        coordinate_axis.drawCoordinateAxis(self.translation, self.scale, (1,0,0,1), (1,0,0,1))
+        from utils import coordinate_axis  # ImGui and SDL
+        x, y = self.absoluteTranslation()
+        coordinate_axis.drawCoordinateAxis(Vec2(float(x), float(y)), self.scale, (1,0,0,1), (1,0,0,1))
@@ -1,19 +1,56 @@
 from typing import Callable, Optional
-from math import sin, cos, tan, sinh, cosh, exp, e
+from math import sin, cos
+import numpy as np
+
+from fractal.func import FractalFunction, CompilationError, dot, cir_dot, np_complex, np_dot, np_cir_dot
+from fractal.orbit import OrbitKernel, orbitKernel
 
 class FractalType:
-    def __init__(self, name: str, shader_func: str, py_func: Callable[[complex, complex], complex], glsl_source: Optional[str] = None):
-        """glsl_source: if non-None, this gets inserted into 'PY_INSERT_RANDOMLY_GENERATED_FUNCTIONS;' part of main.frag, for randomly generated expressions."""
+    def __init__(self, name: str, shader_func: str, py_func: Callable[[complex, complex], complex], glsl_source: Optional[str] = None,
+                 np_func: Optional[Callable[[np.ndarray, np.ndarray], np.ndarray]] = None, py_expression: Optional[str] = None,
+                 simply_connected: bool = False, shader_interior_func: Optional[str] = None,
+                 np_interior_func: Optional[Callable[[np.ndarray], np.ndarray]] = None, orbit_expression: Optional[str] = None,
+                 perturbation: bool = False):
+        """
+        glsl_source: the GLSL function of randomly generated expressions, named shader_func, it's linked into main.frag as a shader module
+                     (see shader_modules.py) when the fractal is selected. None for the ones in shaders/fractals.glsl.
+        np_func: the same function as py_func, but works on whole complex NumPy arrays (used by the CPU renderer).
+        py_expression: the source of py_func for randomly generated expressions.
+        simply_connected: if regions with the same iteration count have no holes, so a region can be filled in once its border is known
+                          (rectangle subdivision in the CPU renderer). Off unless known, it's wrong for maps like Henon, Ikeda and Chirikov.
+        shader_interior_func: name of a 'bool f(VEC2 c)' module in shaders/fractals.glsl that is true for points known to never escape (analytic interior test).
+        np_interior_func: the array version of shader_interior_func, returns a bool mask.
+        orbit_expression: py_func as a python expression of z and c, it's compiled into the orbit kernel (see orbit_func),
+                          py_expression is used if None.
+        perturbation: it is z^2 + c, so views deeper than double-double precision can be rendered with perturbation
+                      (Precisions.Perturbation, see deep_zoom.py).
+        """
         self.name = name
         self.shader_func = shader_func
         self.py_func = py_func
         self.glsl_source = glsl_source
+        self.np_func = np_func
+        self.py_expression = py_expression
+        self.simply_connected = simply_connected
+        self.shader_interior_func = shader_interior_func
+        self.np_interior_func = np_interior_func
+        self.orbit_expression = orbit_expression if orbit_expression is not None else py_expression
+        self.perturbation = perturbation
+        self._orbit_func: Optional[OrbitKernel] = None
 
-def cir_dot(a: complex, b: complex) -> complex:
-    return complex(a.real*b.real, a.imag*b.imag)
+    @property
+    def orbit_func(self) -> OrbitKernel:
+        """py_func iterated up to N times in one call, for paths and audio (see fractal.orbit.OrbitKernel)."""
+        if self._orbit_func is None:
+            self._orbit_func = orbitKernel(self.orbit_expression, self.py_func)
+        return self._orbit_func
 
-def dot(a: complex, b: complex) -> float:
-    return a.real*b.real + a.imag*b.imag
+    def __reduce__(self):
+        # Functions can't be pickled (needed for worker processes),
+        # built-in types are looked up by name and generated ones are rebuilt from their source
+        if self.py_expression is None:
+            return byName, (self.name,)
+        return _runtimeFractalType, (self.name, self.shader_func, self.py_expression, self.glsl_source)
 
 def _ikeda(z, c):
     t = 0.4 - 6.0 / (1.0 + dot(z, z))
@@ -24,27 +61,88 @@ def _chirikov(z, c):
     zi_plus = c.imag*sin(z.real)
     return complex(z.real + c.real*(z.imag + zi_plus), z.imag + zi_plus)
 
+def _np_burning_ship(z, c):
+    return np_complex(z.real*z.real - z.imag*z.imag, 2.0*np.abs(z.real*z.imag)) + c
+def _np_ikeda(z, c):
+    t = 0.4 - 6.0 / (1.0 + np_dot(z, z))
+    st = np.sin(t)
+    ct = np.cos(t)
+    return np_complex(1.0 + c.real * (z.real * ct - z.imag * st), c.imag * (z.real * st + z.imag * ct))
+def _np_chirikov(z, c):
+    zi_plus = c.imag*np.sin(z.real)
+    return np_complex(z.real + c.real*(z.imag + zi_plus), z.imag + zi_plus)
+
+def _np_mandelbrot_interior(c):
+    # Main cardioid and period 2 bulb
+    x = c.real - .25
+    y2 = c.imag*c.imag
+    q = x*x + y2
+    return (q * (q + x) <= .25 * y2) | ((c.real + 1)*(c.real + 1) + y2 <= .0625)
+
+# _ikeda in one expression, t is computed once by the orbit kernel
+_IKEDA_EXPRESSION = ("complex(1.0 + c.real * (z.real * cos(0.4 - 6.0 / (1.0 + dot(z, z))) - z.imag * sin(0.4 - 6.0 / (1.0 + dot(z, z)))), "
+                     "c.imag * (z.real * sin(0.4 - 6.0 / (1.0 + dot(z, z))) + z.imag * cos(0.4 - 6.0 / (1.0 + dot(z, z)))))")
+
+# Orbits that come back closer than this to an earlier point are considered periodic (never escaping),
+# relative to the size of a pixel
+PERIODICITY_TOLERANCE = 1E-3
+
+def periodicityThreshold(scale: float, height: int) -> float:
+    """Squared distance for the periodicity check at a view scale (see Transformation.scale) and image height."""
+    return (scale * 2 / height * PERIODICITY_TOLERANCE) ** 2
+
 FRACTALS = [
-    FractalType("Mandelbrot", "mandelbrot", lambda z,c: z*z + c),
-    FractalType("Burning Ship", "burning_ship", lambda z,c: complex(abs(z.real), abs(z.imag))**2 + c),
-    FractalType("Feather", "feather", lambda z,c: (z**3) / (1 + cir_dot(z, z)) + c),
-    FractalType("SFX", "sfx", lambda z,c: z * dot(z,z) - z * cir_dot(c,c)),
-    FractalType("Henon", "henon", lambda z,c: complex(1 - c.real*z.real*z.real + z.imag, c.imag * z.real)),
-    FractalType("Duffing", "duffing", lambda z,c: complex(z.imag, -c.imag*z.real + c.real*z.imag - z.imag*z.imag*z.imag)),
-    FractalType("Ikeda", "ikeda", _ikeda),
-    FractalType("Chirikov", "chirikov", _chirikov),
-    FractalType("Chirikov Mutate", "chirikov_mutate", lambda z,c: complex(z.real + c.real*z.imag, z.imag + c.imag*sin(z.real))),
+    FractalType("Mandelbrot", "mandelbrot", lambda z,c: z*z + c,
+                np_func=lambda z,c: z*z + c, orbit_expression="z*z + c", simply_connected=True,
+                shader_interior_func="mandelbrot_interior", np_interior_func=_np_mandelbrot_interior, perturbation=True),
+    FractalType("Burning Ship", "burning_ship", lambda z,c: complex(abs(z.real), abs(z.imag))**2 + c,
+                np_func=_np_burning_ship, orbit_expression="complex(abs(z.real), abs(z.imag))**2 + c", simply_connected=True),
+    FractalType("Feather", "feather", lambda z,c: (z**3) / (1 + cir_dot(z, z)) + c,
+                np_func=lambda z,c: (z*z*z) / (1 + np_cir_dot(z, z)) + c, orbit_expression="(z**3) / (1 + cir_dot(z, z)) + c"),
+    FractalType("SFX", "sfx", lambda z,c: z * dot(z,z) - z * cir_dot(c,c),
+                np_func=lambda z,c: z * np_dot(z,z) - z * np_cir_dot(c,c), orbit_expression="z * dot(z,z) - z * cir_dot(c,c)"),
+    FractalType("Henon", "henon", lambda z,c: complex(1 - c.real*z.real*z.real + z.imag, c.imag * z.real),
+                np_func=lambda z,c: np_complex(1 - c.real*z.real*z.real + z.imag, c.imag * z.real),
+                orbit_expression="complex(1 - c.real*z.real*z.real + z.imag, c.imag * z.real)"),
+    FractalType("Duffing", "duffing", lambda z,c: complex(z.imag, -c.imag*z.real + c.real*z.imag - z.imag*z.imag*z.imag),
+                np_func=lambda z,c: np_complex(z.imag, -c.imag*z.real + c.real*z.imag - z.imag*z.imag*z.imag),
+                orbit_expression="complex(z.imag, -c.imag*z.real + c.real*z.imag - z.imag*z.imag*z.imag)"),
+    FractalType("Ikeda", "ikeda", _ikeda, np_func=_np_ikeda, orbit_expression=_IKEDA_EXPRESSION),
+    FractalType("Chirikov", "chirikov", _chirikov, np_func=_np_chirikov,
+                orbit_expression="complex(z.real + c.real*(z.imag + c.imag*sin(z.real)), z.imag + c.imag*sin(z.real))"),
+    FractalType("Chirikov Mutate", "chirikov_mutate", lambda z,c: complex(z.real + c.real*z.imag, z.imag + c.imag*sin(z.real)),
+                np_func=lambda z,c: np_complex(z.real + c.real*z.imag, z.imag + c.imag*np.sin(z.real)),
+                orbit_expression="complex(z.real + c.real*z.imag, z.imag + c.imag*sin(z.real))"),
 ]
 
 FRACTAL_NAMES = [f.name for f in FRACTALS]
 
-def addRuntimeFractalType(name: str, glsl_func_name: str, py_expression: str, glsl_expression: str) -> FractalType:
-    """Adds fractal types at runtime."""
-    FRACTALS.append(new_frac := FractalType(
+def _runtimeFractalType(name: str, glsl_func_name: str, py_expression: str, glsl_source: str) -> FractalType:
+    # Compiled like fractal functions, the optimizing pass removes most of the generator's redundant work
+    function = FractalFunction(f"return {py_expression}")
+    function.resolve(compile_glsl=False)
+    return FractalType(
         name=name,
         shader_func=glsl_func_name,
-        py_func=eval(f"lambda z,c: {py_expression}\n"),
-        glsl_source=f"VEC2 {glsl_func_name}(VEC2 z,VEC2 c){{return {glsl_expression.replace(' ', '')};}}"
+        py_func=function.func,
+        glsl_source=glsl_source,
+        np_func=function.callArrays,
+        py_expression=py_expression
+    )
+
+def _generatedGLSLSource(glsl_func_name: str, py_expression: str, glsl_expression: str) -> str:
+    """The GLSL function compiled from the optimized python expression, or the generator's own if that fails."""
+    function = FractalFunction(f"return {py_expression}")
+    try:
+        function.resolve(compile_numpy=False)
+        return function.getGLSLFunc(name=glsl_func_name)
+    except CompilationError:
+        return f"VEC2 {glsl_func_name}(VEC2 z,VEC2 c){{return {glsl_expression.replace(' ', '')};}}"
+
+def addRuntimeFractalType(name: str, glsl_func_name: str, py_expression: str, glsl_expression: str) -> FractalType:
+    """Adds fractal types at runtime."""
+    FRACTALS.append(new_frac := _runtimeFractalType(
+        name, glsl_func_name, py_expression, _generatedGLSLSource(glsl_func_name, py_expression, glsl_expression)
     ))
     FRACTAL_NAMES.append(name)
     return new_frac
@@ -0,0 +1,172 @@
+"""
+Render fractal views with the real GPU pipeline (FractalRenderer and main.frag) without a window or ImGui, into an
+offscreen framebuffer of a standalone GL context (EGL works on machines without a display, like CI servers).
+Renders until the image is finished (iteration limit reached, anti-aliasing done) and reports the timing.
+Only needs moderngl, numpy and gdmath, not the GUI libraries (moderngl_window, SDL, ImGui).
+
+    python headless_render.py out.png --size 1280x720 --center -0.743643887037 0.131825904205 --scale 1E-9
+    python headless_render.py out.png --backend egl --precision 2x64bit --json timing.json
+"""
+import argparse
+import json
+import math
+import time
+from dataclasses import dataclass, asdict
+from decimal import Decimal
+from typing import Tuple, List, Optional
+
+import moderngl as gl
+import numpy as np
+
+import fractals
+from fractal.transformation import Transformation
+from fractal_render import FractalRenderer
+from poster_render import PNGWriter
+from settings import Settings, Precisions
+
+# Frames a render may take before it is given up, finishing usually takes static_frame_mix's anti-aliasing frames
+DEFAULT_MAX_FRAMES = 1000
+
+
+class OffscreenWindow:
+    """The parts of a window FractalRenderer uses."""
+    def __init__(self, size: Tuple[int, int]):
+        self.size = size
+
+    @property
+    def width(self) -> int:
+        return self.size[0]
+
+    @property
+    def height(self) -> int:
+        return self.size[1]
+
+    @property
+    def aspect_ratio(self) -> float:
+        return self.size[0] / self.size[1]
+
+
+@dataclass
+class HeadlessResult:
+    image: np.ndarray  # (height, width, 3) uint8, from the top
+    frames: int
+    finished: bool  # the image was finished within the frame limit
+    gpu_times: List[int]  # of every frame in nanoseconds
+    wall_time: float  # seconds, from the first frame until the image was read back
+    precision: Precisions  # in use at the end
+    iterations: int  # limit at the end
+
+    @property
+    def gpu_time(self) -> int:
+        return sum(self.gpu_times)
+
+    def dumpJson(self) -> dict:
+        dat = asdict(self)
+        del dat["image"]
+        dat["precision"] = self.precision.name
+        dat["gpu_time"] = self.gpu_time
+        return dat
+
+
+class HeadlessRenderer:
+    def __init__(self, size: Tuple[int, int], settings: Settings = None, backend: str = None):
+        """:param backend: of the standalone context, "egl" to render without a display (see moderngl.create_context)"""
+        self.settings = settings if settings is not None else Settings()
+        self.ctx = gl.create_standalone_context(require=400, **({} if backend is None else {"backend": backend}))
+        self.window = OffscreenWindow(size)
+        self._screen_tex = self.ctx.texture(size, 4)
+        self.screen = self.ctx.framebuffer([self._screen_tex])
+        self.screen.use()
+        self.renderer = FractalRenderer(self.ctx, self.window, self.settings, screen=self.screen)
+        # Drivers finish compiling shaders on their first draw, which shouldn't count towards the first render's time
+        self.renderer.frame(0., 0.)
+        self.ctx.finish()
+
+    def render(self, view: Transformation, fractal: fractals.FractalType = None,
+               max_frames: int = DEFAULT_MAX_FRAMES) -> HeadlessResult:
+        """:raises ValueError: if the view is deeper than the precision setting allows (see FractalRenderer.min_scale)"""
+        if fractal is not None and fractal is not self.settings.fractal:
+            self.renderer.setFractal(fractal)
+        if view.log_scale < math.log10(self.renderer.min_scale):
+            raise ValueError(f"The view is deeper than {self.settings.fractal.name} can be rendered "
+                             f"with this precision setting (scale {self.renderer.min_scale:g})")
+        self.renderer.setView(view)
+        gpu_times = []
+        self.ctx.finish()
+        start = time.perf_counter()
+        finished = False
+        while len(gpu_times) < max_frames:
+            self.renderer.frame(time.perf_counter() - start, 0.)
+            if not self.renderer.rendered:  # nothing was left to render, the last frame only presented the image
+                finished = True
+                break
+            gpu_times.append(self.renderer.render_time)
+        image = np.frombuffer(self.screen.read(components=3), dtype=np.uint8).reshape(
+            self.window.height, self.window.width, 3)[::-1]
+        return HeadlessResult(
+            image, len(gpu_times), finished, gpu_times, time.perf_counter() - start,
+            self.renderer.precision, self.settings.iterations
+        )
+
+    def close(self):
+        self.ctx.release()
+
+
+def _parseSize(text: str) -> Tuple[int, int]:
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def _parsePrecision(text: str) -> Optional[Precisions]:
+    """None for automatic precision."""
+    if text == "auto":
+        return None
+    return next(p for p in Precisions if p.value[1] == text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a fractal view on the GPU without a window.")
+    parser.add_argument("output", help="output file, .png")
+    parser.add_argument("--size", type=_parseSize, default=(1280, 720), help="WIDTHxHEIGHT (default: 1280x720)")
+    parser.add_argument("--center", type=Decimal, nargs=2, default=(-.5, 0.), metavar=("X", "Y"), help="at any precision")
+    parser.add_argument("--scale", type=float, default=1.5, help="half the height of the view")
+    parser.add_argument("--fractal", choices=fractals.FRACTAL_NAMES, default="Mandelbrot")
+    parser.add_argument("--iterations", type=int, help="fixed iteration limit (default: automatic)")
+    parser.add_argument("--precision", choices=["auto"] + [p.value[1] for p in Precisions], default="auto")
+    parser.add_argument("--backend", help='GL context backend, "egl" without a display (default: moderngl\'s)')
+    parser.add_argument("--frames", type=int, default=DEFAULT_MAX_FRAMES, help="give up after this many frames")
+    parser.add_argument("--json", help="write the timing to this JSON file")
+    args = parser.parse_args()
+
+    settings = Settings()
+    settings.fractal = fractals.byName(args.fractal)
+    if args.iterations is not None:
+        settings.iterations = args.iterations
+        settings.auto_iterations = False
+    precision = _parsePrecision(args.precision)
+    if precision is not None:
+        settings.precision = precision
+        settings.auto_precision = False
+
+    renderer = HeadlessRenderer(args.size, settings, args.backend)
+    try:
+        result = renderer.render(Transformation(tuple(args.center), args.scale), max_frames=args.frames)
+    except ValueError as e:
+        parser.exit(1, f"error: {e}\n")
+    finally:
+        renderer.close()
+    with open(args.output, "wb") as file:
+        writer = PNGWriter(file, args.size)
+        writer.writeRows(result.image)
+        writer.close()
+
+    print(f"{result.frames} frames{'' if result.finished else ' (unfinished)'}, "
+          f"GPU {result.gpu_time / 1E6:.1f} ms, wall {result.wall_time * 1E3:.1f} ms, "
+          f"{result.precision.value[1]}, {result.iterations} iterations")
+    if args.json is not None:
+        with open(args.json, "w") as file:
+            json.dump(result.dumpJson(), file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
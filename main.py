@@ -1,4 +1,5 @@
 import colorsys
+import json
 import logging
 import weakref
 
@@ -6,6 +7,7 @@ import sdl2
 import sdl2.touch
 import os
 import sys
+import time
 from typing import Tuple
 
 import moderngl as gl
@@ -14,7 +16,7 @@ from moderngl_window.timers.clock import Timer
 from imgui_bundle import imgui
 from gdmath import Vec2, Vec2i
 
-from utils import imgui_utils
+from utils import imgui_utils, color_utils
 try:
     from utils import shader_reload_observer
 except ImportError:
@@ -23,13 +25,17 @@ import utils.window
 import settings
 from settings import Settings
 import fractal_render
+import profiler
 import fractals
+from fractal.transformation import Transformation
 import audio
 import gui.gui
 
 import random_fractal_expression_generator
 
 USE_VIZTRACER = False
+# Seconds the frame time average of the fps readout reacts over
+FPS_AVERAGE_TIME = .1
 
 os.environ["MODERNGL_WINDOW"] = "pyglet"
 
@@ -72,7 +78,8 @@ class FractalWindow(moderngl_window.WindowConfig):
         self.gui = gui.gui.Gui(self)
         self.settings = Settings()
 
-        self.rndr = fractal_render.FractalRenderer(self.ctx, self.wnd, self.settings)
+        self.profiler = profiler.FrameProfiler()
+        self.rndr = fractal_render.FractalRenderer(self.ctx, self.wnd, self.settings, self.profiler)
         self.syn = audio.Synthesizer(self.settings)
         self._do_audio_fade = False
         self._rainbow_path = False
@@ -88,22 +95,26 @@ class FractalWindow(moderngl_window.WindowConfig):
         self._color_gradient_edit = imgui_utils.ColorGradientEdit(
             identifier="##fractal_color_palette",
             gradient=self.settings.color_palette,
-            repeating=True
+            repeating=True,
+            interpolation=self.settings.color_interpolation
         )
 
-        self._history_dts = []
         self.render_time = 0.0
+        # Exponential moving average of dt for the fps readout, kept even while the profiler is paused
+        self._average_dt = 0.0
 
     def render(self, frame_time, dt):
-        with self.ctx.query(time=True) as gl_query:
-            self.rndr.frame(frame_time, dt)
-        self.render_time = gl_query.elapsed
+        self._average_dt += (dt - self._average_dt) * min(dt / FPS_AVERAGE_TIME, 1.)
+        self.rndr.frame(frame_time, dt)
+        self.render_time = self.rndr.render_time
 
-        self.buildImGui(frame_time, dt)
+        with self.profiler.phase("ImGui"):
+            self.buildImGui(frame_time, dt)
         if self._show_coordinate_axis:
             self.rndr.drawCoordinateAxis()
 
-        self.gui.build()
+        with self.profiler.phase("ImGui"):
+            self.gui.build()
 
         if self._rainbow_path:
             self.settings.path_color = (*colorsys.hsv_to_rgb(frame_time / 5, 1, 1), 1)
@@ -112,7 +123,8 @@ class FractalWindow(moderngl_window.WindowConfig):
             self._fractalInteract(self.mouse_pos)
             self._mouse_dragging_delta_for_audio_trigger = Vec2(0)
 
-        self.syn.update()
+        with self.profiler.phase("Audio"):
+            self.syn.update()
 
         self.detectDebugShaderReload()
 
@@ -125,6 +137,24 @@ class FractalWindow(moderngl_window.WindowConfig):
         if changed:
             self.rndr.reRender()
 
+    @property
+    def reKeepTrig(self):
+        return None
+    # Re-Render trigger helper property, for settings that don't invalidate the computed iterations
+    @reKeepTrig.setter
+    def reKeepTrig(self, changed: bool):
+        if changed:
+            self.rndr.reRender(keep_iterations=True)
+
+    @property
+    def reColorTrig(self):
+        return None
+    # Re-Color trigger helper property, for settings that only change the colors
+    @reColorTrig.setter
+    def reColorTrig(self, changed: bool):
+        if changed:
+            self.rndr.recolor()
+
     def _generateRandomFractalExpression(self):
         py_exp, gl_exp = random_fractal_expression_generator.genFractalExpression(1, 0.8)
         print(py_exp)
@@ -203,6 +233,19 @@ class FractalWindow(moderngl_window.WindowConfig):
 
             if imgui.button("Reset View"):
                 self.rndr.resetTransformation()
+            imgui.same_line()
+            if imgui.button("Copy"):
+                imgui.set_clipboard_text(json.dumps(self.rndr.view.dumpJson()))
+            if imgui.is_item_hovered():
+                imgui.set_tooltip("Copy the view to the clipboard (as JSON, at full precision)")
+            imgui.same_line()
+            if imgui.button("Paste"):
+                try:
+                    self.rndr.setView(Transformation.loadJson(json.loads(imgui.get_clipboard_text())))
+                except (ValueError, KeyError, TypeError, ArithmeticError) as e:
+                    logging.error(f"Clipboard doesn't contain a view: {e}")
+            if imgui.is_item_hovered():
+                imgui.set_tooltip("Go to a view copied before")
             imgui.unindent(indent)
             imgui.separator()
 
@@ -213,35 +256,67 @@ class FractalWindow(moderngl_window.WindowConfig):
         if imgui.collapsing_header("Rendering"):
             imgui.indent(indent)
             imgui.push_item_width(item_width)
-            self.reChTrig, self.settings.iterations = imgui.drag_int("Iters", self.settings.iterations, v_min=1, v_max=32768, v_speed=15, flags=imgui.SliderFlags_.logarithmic)
+            self.reKeepTrig, self.settings.auto_iterations = imgui.checkbox("Auto Iters", self.settings.auto_iterations)
+            if imgui.is_item_hovered():
+                imgui.set_tooltip("Raise or lower the iteration limit until almost no pixels reach it")
+            imgui.begin_disabled(self.settings.auto_iterations)
+            self.reKeepTrig, self.settings.iterations = imgui.drag_int("Iters", self.settings.iterations, v_min=1, v_max=32768, v_speed=15, flags=imgui.SliderFlags_.logarithmic)
+            imgui.end_disabled()
+            if imgui.is_item_hovered(imgui.HoveredFlags_.allow_when_disabled):
+                imgui.set_tooltip(f"{self.rndr.undecided_fraction:.2%} of the pixels reached the limit")
             self.reChTrig, self.settings.render_escape_threshold = imgui.drag_float("Esc. TH.", self.settings.render_escape_threshold, v_min=0.01, v_max=1E7, v_speed=10000, format=f"%.{0 if self.settings.render_escape_threshold > 100 else 3}f", flags=imgui.SliderFlags_.logarithmic)
-            switched_prec, self.settings.double_precision = imgui.checkbox("64bit Prec.", self.settings.double_precision)
+            switched_auto_prec, self.settings.auto_precision = imgui.checkbox("Auto Prec.", self.settings.auto_precision)
+            if imgui.is_item_hovered():
+                imgui.set_tooltip("Use the fastest precision that is still exact enough for the current zoom")
+            imgui.begin_disabled(self.settings.auto_precision)
+            shown_prec = self.rndr.precision if self.settings.auto_precision else self.settings.precision
+            switched_prec, new_prec = imgui.combo("Precision", shown_prec.value[0], settings.PRECISION_NAMES)
+            imgui.end_disabled()
+            if imgui.is_item_hovered(imgui.HoveredFlags_.allow_when_disabled):
+                imgui.set_tooltip("Number format of the fractal math, 2x64bit (double-double) zooms about twice as deep as 64bit")
             if switched_prec:
+                self.settings.precision = list(settings.Precisions)[new_prec]
+            if switched_prec or switched_auto_prec:
                 self.rndr.reloadShaders(reload_source=False)
-            self.reChTrig, self.settings.render_samples = imgui.drag_int("Samples", self.settings.render_samples, v_min=1, v_max=10, v_speed=.05)
-            self.reChTrig, self.settings.static_frame_mix = imgui.drag_float("St. Frame Mix", self.settings.static_frame_mix, v_min=0, v_max=2, v_speed=.005)
+            switched_interior, self.settings.interior_detection = imgui.checkbox("Interior Det.", self.settings.interior_detection)
+            if imgui.is_item_hovered():
+                imgui.set_tooltip("Stop iterating points that are known to never escape (periodic orbits, cardioid & bulb)")
+            if switched_interior:
+                self.rndr.reloadShaders(reload_source=False)
+            _, self.settings.dynamic_resolution = imgui.checkbox("Dyn. Res.", self.settings.dynamic_resolution)
+            if imgui.is_item_hovered():
+                imgui.set_tooltip("Lower the resolution while the view moves to keep the frame rate up")
+            _, self.settings.frame_time_budget = imgui.drag_float("Budget ms", self.settings.frame_time_budget, v_min=1, v_max=100, v_speed=.1, format="%.1f")
+            if imgui.is_item_hovered():
+                imgui.set_tooltip("GPU time per frame for the fractal, heavy views fill in over several frames")
+            self.reKeepTrig, self.settings.render_samples = imgui.drag_int("Samples", self.settings.render_samples, v_min=1, v_max=10, v_speed=.05)
+            self.reKeepTrig, self.settings.static_frame_mix = imgui.drag_float("St. Frame Mix", self.settings.static_frame_mix, v_min=0, v_max=2, v_speed=.005)
 
             imgui.text("Color Palette:")
             imgui.set_next_item_width(-1)
             if self._color_gradient_edit.build():
                 self.settings.color_palette = self._color_gradient_edit.gradient
                 self.rndr.reloadColorPalette()
-            self.reChTrig, self.settings.color_change_speed = imgui.drag_float("Color Speed", self.settings.color_change_speed, v_min=0, v_max=1, v_speed=.005, flags=imgui.SliderFlags_.logarithmic)
+            changed, new_interp = imgui.combo("Interp.##color", self.settings.color_interpolation.value, color_utils.GRADIENT_INTERP_NAMES)
+            if changed:
+                self.settings.color_interpolation = color_utils.GradientInterpolations[color_utils.GRADIENT_INTERP_NAMES[new_interp]]
+                self._color_gradient_edit.interpolation = self.settings.color_interpolation
+                self.rndr.reloadColorPalette()
+            self.reColorTrig, self.settings.color_change_speed = imgui.drag_float("Color Speed", self.settings.color_change_speed, v_min=0, v_max=1, v_speed=.005, flags=imgui.SliderFlags_.logarithmic)
 
             imgui.separator()
             imgui.text(f"Static Frames: {self.rndr.static_frames if self.rndr.static_frames <= 1000 else '>1000'}")
             imgui.text(f"Anti-Aliasing: {self.rndr.should_apply_aa}")
             imgui.text(f"Rendering: {self.rndr.rendered}")
-            self._history_dts.append(dt)
-            if sum(self._history_dts) > .1:
-                self._history_dts.pop(0)
-                avg_dt = 0 if len(self._history_dts) == 0 else sum(self._history_dts) / len(self._history_dts)
-                imgui.text("%.1f fps" % (1 / max(avg_dt, .001)))
-                imgui.text("%.3f ms" % (self.render_time / 1E6))
+            imgui.text("%.1f fps" % (1 / max(self._average_dt, .001)))
+            imgui.same_line()
+            imgui.text(f"@ {self.rndr.render_scale:.0%} res.")
+            imgui.text("%.3f ms" % (self.render_time / 1E6))
             if imgui.button("Reset Settings##render"):
                 self.settings.resetRenderSettings()
                 self.rndr.reloadShaders(reload_source=False)
                 self._color_gradient_edit.gradient = self.settings.color_palette
+                self._color_gradient_edit.interpolation = self.settings.color_interpolation
                 self.rndr.reloadColorPalette()
             imgui.pop_item_width()
             imgui.unindent(indent)
@@ -332,6 +407,22 @@ class FractalWindow(moderngl_window.WindowConfig):
                 self.syn.stopSound()
             imgui.pop_item_width()
             imgui.unindent(indent)
+            imgui.separator()
+
+        # ---------- Profiler ----------
+        imgui.set_next_item_open(False, cond=imgui.Cond_.first_use_ever)
+        if imgui.collapsing_header("Profiler"):
+            imgui.indent(indent)
+            self.profiler.drawImGui((300, 80))
+            _, self.profiler.paused = imgui.checkbox("Pause", self.profiler.paused)
+            imgui.same_line()
+            if imgui.button("Export Trace"):
+                path = time.strftime("frame_trace_%Y%m%d_%H%M%S.json")
+                self.profiler.dumpChromeTrace(path)
+                print(f"Frame trace saved to {os.path.abspath(path)}")
+            if imgui.is_item_hovered():
+                imgui.set_tooltip("Save the kept frames as a Chrome trace (chrome://tracing or ui.perfetto.dev)")
+            imgui.unindent(indent)
 
         imgui.end()
         imgui.pop_style_color()
@@ -474,6 +565,7 @@ def main():
     timer.start()
 
     while not window.is_closing:
+        config.profiler.beginFrame()
         current_time, delta = timer.next_frame()
 
         if config.clear_color is not None:
@@ -484,7 +576,8 @@ def main():
 
         window.render(current_time, delta)
         if not window.is_closing:
-            window.swap_buffers()
+            with config.profiler.phase("Swap"):
+                window.swap_buffers()
 
     _, duration = timer.stop()
     window.destroy()
@@ -0,0 +1,214 @@
+"""
+Poster renderer: renders a view at any resolution (gigapixel images, far beyond the window) on the CPU.
+
+The image is rendered in strips of rows with the tiled renderer and every finished strip is written to the file
+right away, so the whole image is never held in memory. Strips get fewer rows the wider the image is,
+which keeps memory use bounded no matter how large the output is.
+
+    python poster_render.py poster.png --size 32768x32768 --center -0.745 0.11 --scale 0.01 --supersample 2
+"""
+import argparse
+import math
+import struct
+import sys
+import time
+import zlib
+from decimal import Decimal
+from typing import Tuple, BinaryIO
+
+import numpy as np
+
+import cpu_render
+import fractals
+from fractal.transformation import Transformation
+from settings import Settings, Precisions
+from tiled_render import TiledRenderer
+
+# Output pixels per strip (a strip is written at once)
+STRIP_PIXELS = 1 << 22
+# Samples rendered by the tiled renderer at once (a strip is rendered in chunks of columns)
+CHUNK_SAMPLES = 1 << 22
+
+
+class PNGWriter:
+    """Writes an 8 bit RGB PNG row by row, the compressed data is written as it is produced."""
+    def __init__(self, file: BinaryIO, size: Tuple[int, int]):
+        self._file = file
+        self.size = size
+        self._compressor = zlib.compressobj(6)
+        file.write(b"\x89PNG\r\n\x1a\n")
+        # Bit depth 8, color type 2 (RGB), default compression, filter and no interlacing
+        self._writeChunk(b"IHDR", struct.pack(">IIBBBBB", size[0], size[1], 8, 2, 0, 0, 0))
+
+    def _writeChunk(self, chunk_type: bytes, data: bytes):
+        self._file.write(struct.pack(">I", len(data)))
+        self._file.write(chunk_type)
+        self._file.write(data)
+        self._file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type))))
+
+    def writeRows(self, rows: np.ndarray):
+        """:param rows: (rows, width, 3) uint8, the next rows from the top"""
+        # Every row starts with its filter type, 0 (none)
+        filtered = np.zeros((rows.shape[0], rows.shape[1] * 3 + 1), dtype=np.uint8)
+        filtered[:, 1:] = rows.reshape(rows.shape[0], -1)
+        data = self._compressor.compress(filtered.tobytes())
+        if data:
+            self._writeChunk(b"IDAT", data)
+
+    def close(self):
+        self._writeChunk(b"IDAT", self._compressor.flush())
+        self._writeChunk(b"IEND", b"")
+
+
+class TIFFWriter:
+    """
+    Writes an uncompressed 8 bit RGB TIFF (one strip per row) row by row.
+    All offsets are known from the size, so the header is written first and the rows follow as they come.
+    """
+    _SHORT, _LONG, _RATIONAL = 3, 4, 5
+    _TYPE_FORMATS = {_SHORT: "H", _LONG: "I", _RATIONAL: "I"}
+
+    def __init__(self, file: BinaryIO, size: Tuple[int, int]):
+        self._file = file
+        self.size = size
+        width, height = size
+        row_bytes = width * 3
+        if row_bytes * height + 16 * height + 1024 >= 2 ** 32:
+            raise ValueError("Image too large for TIFF (4GB limit), use PNG instead")
+
+        entries = [
+            (256, self._LONG, [width]),  # ImageWidth
+            (257, self._LONG, [height]),  # ImageLength
+            (258, self._SHORT, [8, 8, 8]),  # BitsPerSample
+            (259, self._SHORT, [1]),  # Compression: none
+            (262, self._SHORT, [2]),  # PhotometricInterpretation: RGB
+            (273, self._LONG, None),  # StripOffsets, filled in below
+            (277, self._SHORT, [3]),  # SamplesPerPixel
+            (278, self._LONG, [1]),  # RowsPerStrip
+            (279, self._LONG, [row_bytes] * height),  # StripByteCounts
+            (282, self._RATIONAL, [72, 1]),  # XResolution
+            (283, self._RATIONAL, [72, 1]),  # YResolution
+            (296, self._SHORT, [2]),  # ResolutionUnit: inch
+        ]
+        ifd_offset = 8
+        extra_offset = ifd_offset + 2 + len(entries) * 12 + 4
+        # Values that don't fit in the 4 bytes of an entry are stored after the IFD
+        extra_size = sum(self._valueSize(t, v) for _, t, v in entries if v is not None and self._valueSize(t, v) > 4)
+        extra_size += height * 4 if height > 1 else 0
+        data_offset = extra_offset + extra_size
+        entries[5] = (273, self._LONG, [data_offset + row * row_bytes for row in range(height)])
+
+        ifd = [struct.pack("<H", len(entries))]
+        extra = []
+        for tag, value_type, values in entries:
+            packed = struct.pack(f"<{len(values)}{self._TYPE_FORMATS[value_type]}", *values)
+            count = len(values) // 2 if value_type == self._RATIONAL else len(values)
+            if len(packed) <= 4:
+                ifd.append(struct.pack("<HHI", tag, value_type, count) + packed.ljust(4, b"\0"))
+            else:
+                ifd.append(struct.pack("<HHII", tag, value_type, count, extra_offset + sum(map(len, extra))))
+                extra.append(packed)
+        ifd.append(struct.pack("<I", 0))  # no next IFD
+
+        file.write(b"II*\0" + struct.pack("<I", ifd_offset))
+        file.write(b"".join(ifd))
+        file.write(b"".join(extra))
+
+    def _valueSize(self, value_type: int, values: list) -> int:
+        return len(values) * (2 if value_type == self._SHORT else 4)
+
+    def writeRows(self, rows: np.ndarray):
+        """:param rows: (rows, width, 3) uint8, the next rows from the top"""
+        self._file.write(np.ascontiguousarray(rows).tobytes())
+
+    def close(self):
+        pass
+
+
+def chunkView(view: Transformation, size: Tuple[int, int], rect: Tuple[int, int, int, int]) -> Transformation:
+    """The view of a (x, y, width, height) rectangle of an image, its pixels are at the same positions as in the image."""
+    width, height = size
+    x, y, rect_width, rect_height = rect
+    offset_x = ((x + rect_width / 2) / width * 2 - 1) * (width / height) * view.scale
+    offset_y = -((y + rect_height / 2) / height * 2 - 1) * view.scale
+    return Transformation(view.offsetCenter((offset_x, offset_y)), log_scale=view.log_scale + math.log10(rect_height / height))
+
+
+def renderPoster(path: str, settings: Settings, view: Transformation, size: Tuple[int, int],
+                 supersample: int = 1, workers: int = None, progress: bool = True):
+    """
+    Render a view with the render settings into a PNG or TIFF file.
+    The precision is the one the view needs (see cpu_render.viewPrecision), views deeper than double-double can't
+    be rendered by the tiled renderer.
+
+    :param supersample: render supersample x supersample samples per pixel (on a regular grid) and average them
+    """
+    width, height = size
+    precision = cpu_render.viewPrecision(settings, view, height * supersample)
+    if precision is Precisions.Perturbation or view.scale < Precisions.DoubleDouble.min_scale:
+        raise ValueError(f"Posters can't be rendered at scales below {Precisions.DoubleDouble.min_scale:g}")
+    writer_type = TIFFWriter if path.lower().endswith((".tif", ".tiff")) else PNGWriter
+    palette = cpu_render.settingsPalette(settings)
+    strip_rows = min(height, max(1, STRIP_PIXELS // width))
+    chunk_columns = min(width, max(1, CHUNK_SAMPLES // (strip_rows * supersample ** 2)))
+
+    start = time.perf_counter()
+    with open(path, "wb") as file, TiledRenderer(workers) as renderer:
+        writer = writer_type(file, size)
+        strip = np.empty((strip_rows, width, 3), dtype=np.uint8)
+        for y in range(0, height, strip_rows):
+            rows = min(strip_rows, height - y)
+            for x in range(0, width, chunk_columns):
+                columns = min(chunk_columns, width - x)
+                chunk = chunkView(view, size, (x, y, columns, rows))
+                result = renderer.render(
+                    settings.fractal, chunk, (columns * supersample, rows * supersample), settings.iterations,
+                    settings.render_escape_threshold, precision, True, settings.interior_detection
+                )
+                colors = cpu_render.colorize(result, palette, settings.color_change_speed)
+                colors = colors.reshape(rows, supersample, columns, supersample, 3).mean(axis=(1, 3))
+                strip[:rows, x:x + columns] = cpu_render.toRGB8(colors)
+            writer.writeRows(strip[:rows])
+
+            if progress:
+                done = (y + rows) * width
+                elapsed = time.perf_counter() - start
+                print(f"\r{done / (width * height):6.1%}  {done / 1E6 / elapsed:8.2f} MP/s", end="", file=sys.stderr, flush=True)
+        writer.close()
+
+    if progress:
+        elapsed = time.perf_counter() - start
+        print(f"\rRendered {width}x{height} ({supersample ** 2} samples per pixel) in {elapsed:.1f}s, "
+              f"{width * height / 1E6 / elapsed:.2f} MP/s", file=sys.stderr)
+
+
+def _parseSize(text: str) -> Tuple[int, int]:
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a fractal view into a (very large) PNG or TIFF image.")
+    parser.add_argument("output", help="output file, .png or .tif")
+    parser.add_argument("--size", type=_parseSize, default=(3840, 2160), help="WIDTHxHEIGHT (default: 3840x2160)")
+    parser.add_argument("--center", type=Decimal, nargs=2, default=(-.5, 0.), metavar=("X", "Y"), help="at any precision")
+    parser.add_argument("--scale", type=float, default=1.5, help="half the height of the view")
+    parser.add_argument("--fractal", choices=fractals.FRACTAL_NAMES, default="Mandelbrot")
+    parser.add_argument("--iterations", type=int, help="default: the render settings")
+    parser.add_argument("--supersample", type=int, default=1, help="render NxN samples per pixel")
+    parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    settings = Settings()
+    settings.fractal = fractals.byName(args.fractal)
+    if args.iterations is not None:
+        settings.iterations = args.iterations
+    view = Transformation(tuple(args.center), args.scale)
+    try:
+        renderPoster(args.output, settings, view, args.size, args.supersample, args.workers)
+    except ValueError as e:
+        parser.exit(1, f"error: {e}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Frame profiler: CPU time of every phase of the last frames in a ring buffer, shown live in ImGui and exported as a
+Chrome trace (open it in chrome://tracing or https://ui.perfetto.dev).
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Tuple
+
+import numpy as np
+
+# Phases of a frame, in the order they run
+PHASES = (
+    "Transformation",  # camera movement
+    "Fractal",  # fractal image passes (CPU side)
+    "Path",  # path generation, upload and drawing
+    "ImGui",  # building the UI
+    "Audio",  # Synthesizer.update
+    "Swap",  # ImGui drawing and the buffer swap (waits for vsync)
+)
+# GPU time of the fractal image (and the paths), measured with a time query
+GPU_PHASE = "Fractal GPU"
+PHASE_COLORS = {
+    "Transformation": (.6, .6, .6),
+    "Fractal": (.2, .5, 1.),
+    "Path": (1., .3, .2),
+    "ImGui": (.3, .8, .3),
+    "Audio": (1., .8, .1),
+    "Swap": (.6, .3, .9),
+    GPU_PHASE: (.1, .8, .9),
+}
+FRAMES = 300
+
+
+class FrameProfiler:
+    """Phases are timed with phase() between beginFrame() calls, only the last `capacity` frames are kept."""
+    def __init__(self, capacity: int = FRAMES):
+        self.capacity = capacity
+        self.phases = PHASES + (GPU_PHASE,)
+        self._columns = {name: i for i, name in enumerate(self.phases)}
+        self._frame_starts = np.zeros(capacity, dtype=np.int64)  # perf_counter_ns
+        # Start (relative to the frame start) and duration of every phase in nanoseconds, durations of -1 didn't run
+        self._starts = np.zeros((capacity, len(self.phases)), dtype=np.int64)
+        self._durations = np.full((capacity, len(self.phases)), -1, dtype=np.int64)
+        self._index = 0
+        self.frame_count = 0  # frames begun so far
+        self.paused = False
+
+    def beginFrame(self):
+        if self.paused:
+            return
+        self.frame_count += 1
+        self._index = self.frame_count % self.capacity
+        self._frame_starts[self._index] = time.perf_counter_ns()
+        self._durations[self._index] = -1
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter_ns() - start)
+
+    def record(self, name: str, start: int, duration: int):
+        """Add time to a phase of the current frame, a phase that runs more than once per frame spans all of its runs."""
+        if self.paused:
+            return
+        i, column = self._index, self._columns[name]
+        offset = start - self._frame_starts[i]
+        if self._durations[i, column] < 0:
+            self._starts[i, column] = offset
+            self._durations[i, column] = duration
+        else:
+            self._durations[i, column] += duration
+
+    def frames(self) -> np.ndarray:
+        """Ring buffer indices of the finished frames that are kept, from the oldest."""
+        count = min(self.frame_count - 1, self.capacity - 1)
+        return (np.arange(self.frame_count - count, self.frame_count)) % self.capacity
+
+    def frameTimes(self) -> np.ndarray:
+        """Durations of the finished frames in nanoseconds (until the next frame began)."""
+        frames = self.frames()
+        return self._frame_starts[(frames + 1) % self.capacity] - self._frame_starts[frames]
+
+    def averageFrameTime(self, duration: float = 1E8) -> float:
+        """Average duration of the last frames that took about this long (nanoseconds), 0 before the first one."""
+        times = self.frameTimes()[::-1]
+        if len(times) == 0:
+            return 0.
+        return float(times[:max(1, np.searchsorted(np.cumsum(times), duration))].mean())
+
+    def phaseTimes(self) -> np.ndarray:
+        """(frames, phases) durations of the finished frames in nanoseconds, 0 where a phase didn't run."""
+        return np.maximum(self._durations[self.frames()], 0)
+
+    def dumpChromeTrace(self, path: str):
+        """Write the kept frames as Chrome trace events: one track for the CPU phases, one for the GPU."""
+        pid = os.getpid()
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": "CPU"}},
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": 1, "args": {"name": "GPU"}},
+        ]
+        base = None
+        for frame, frame_time in zip(self.frames(), self.frameTimes()):
+            frame_start = int(self._frame_starts[frame])
+            base = frame_start if base is None else base
+            events.append({
+                "name": "Frame", "ph": "X", "pid": pid, "tid": 0,
+                "ts": (frame_start - base) / 1E3, "dur": int(frame_time) / 1E3,
+            })
+            for column, name in enumerate(self.phases):
+                duration = int(self._durations[frame, column])
+                if duration < 0:
+                    continue
+                events.append({
+                    "name": name, "ph": "X", "pid": pid, "tid": 1 if name == GPU_PHASE else 0,
+                    "ts": (frame_start - base + int(self._starts[frame, column])) / 1E3, "dur": duration / 1E3,
+                })
+        with open(path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+    # noinspection PyTypeChecker
+    def drawImGui(self, size: Tuple[float, float], max_ms: float = 1000 / 30):
+        """Stacked bars of the phase times of every kept frame (the frame time as a line) and a legend with averages."""
+        from imgui_bundle import imgui
+        from utils.imgui_utils import colorU32
+
+        draw_list = imgui.get_window_draw_list()
+        x0, y0 = imgui.get_cursor_screen_pos()
+        width, height = size
+        draw_list.add_rect_filled((x0, y0), (x0 + width, y0 + height), colorU32((0., 0., 0., .5)))
+        phase_times = self.phaseTimes() / 1E6
+        frame_times = self.frameTimes() / 1E6
+        bar_width = width / self.capacity
+        to_y = lambda ms: y0 + height - min(ms / max_ms, 1.) * height
+        cpu_columns = [self._columns[name] for name in PHASES]
+        for i, (times, frame_time) in enumerate(zip(phase_times, frame_times)):
+            x = x0 + width - (len(frame_times) - i) * bar_width
+            bottom = 0.
+            for column in cpu_columns:
+                if times[column] > 0:
+                    draw_list.add_rect_filled(
+                        (x, to_y(bottom + times[column])), (x + max(bar_width, 1), to_y(bottom)),
+                        colorU32(PHASE_COLORS[self.phases[column]])
+                    )
+                    bottom += times[column]
+            draw_list.add_line((x, to_y(frame_time)), (x + bar_width, to_y(frame_time)), colorU32((1., 1., 1., .8)))
+        for ms in (1000 / 60, 1000 / 30):
+            if ms <= max_ms:
+                draw_list.add_line((x0, to_y(ms)), (x0 + width, to_y(ms)), colorU32((1., 1., 1., .25)))
+        imgui.dummy(size)
+        if imgui.is_item_hovered() and len(frame_times) > 0:
+            i = len(frame_times) - 1 - int((x0 + width - imgui.get_mouse_pos().x) / bar_width)
+            if 0 <= i < len(frame_times):
+                imgui.set_tooltip("\n".join(
+                    [f"Frame: {frame_times[i]:.2f} ms"] +
+                    [f"{name}: {phase_times[i, column]:.2f} ms" for column, name in enumerate(self.phases)]
+                ))
+
+        averages = phase_times.mean(axis=0) if len(phase_times) > 0 else np.zeros(len(self.phases))
+        maxima = phase_times.max(axis=0) if len(phase_times) > 0 else np.zeros(len(self.phases))
+        for column, name in enumerate(self.phases):
+            imgui.color_button(f"##{name}", (*PHASE_COLORS[name], 1.), imgui.ColorEditFlags_.no_tooltip.value, (10, 10))
+            imgui.same_line()
+            imgui.text(f"{name}: {averages[column]:.2f} ms (max {maxima[column]:.2f})")
@@ -41,27 +41,30 @@ cxOrFloat2In = lambda a,b: complex if (a is complex or b is complex) else float
 def always(value):
     return lambda *_: value
 def glslF2Cx(form: str):
-    return lambda *ts: form.format(*((f"{{{i}}}" if t is complex else f"VEC2({{{i}}}, 0.)") for i,t in enumerate(ts)))
+    return lambda *ts: form.format(*((f"{{{i}}}" if t is complex else f"cx_real({{{i}}})") for i,t in enumerate(ts)))
+def glslFloatOrCx(form_float: str, form_cx: str):
+    """The complex form (with float inputs converted to complex) if any input is complex, otherwise the float form."""
+    return lambda *ts: glslF2Cx(form_cx)(*ts) if complex in ts else form_float
 def twoForm(form_float: str, form_cx: str):
     return lambda t: form_cx if t is complex else form_float
 
 OPERATIONS = (
-    CREATE_CX := Op("cx", always("complex({0}, {1})"), always("VEC2({0}, {1})"), (float, float), always(complex)),
-    RE := Op("re", always("{0}.real"), always("{0}.x"), (complex,), always(float)),
-    IM := Op("re", always("{0}.imag"), always("{0}.y"), (complex,), always(float)),
+    CREATE_CX := Op("cx", always("complex({0}, {1})"), always("cx({0}, {1})"), (float, float), always(complex)),
+    RE := Op("re", always("{0}.real"), always("cx_re({0})"), (complex,), always(float)),
+    IM := Op("re", always("{0}.imag"), always("cx_im({0})"), (complex,), always(float)),
     INVERSE := Op("inverse", always("(-{0})"), always("(-{0})"), (float | complex,), sameAsIn),
-    ADD := Op("add", always("({0} + {1})"), always("({0} + {1})"), (float | complex, float | complex), cxOrFloat2In),
-    SUB := Op("sub", always("({0} - {1})"), always("({0} - {1})"), (float | complex, float | complex), cxOrFloat2In),
+    ADD := Op("add", always("({0} + {1})"), glslFloatOrCx("f_add({0}, {1})", "cx_add({0}, {1})"), (float | complex, float | complex), cxOrFloat2In),
+    SUB := Op("sub", always("({0} - {1})"), glslFloatOrCx("f_sub({0}, {1})", "cx_sub({0}, {1})"), (float | complex, float | complex), cxOrFloat2In),
     #TODO: improve mul and div
-    MUL := Op("mul", always("({0} * {1})"), always("({0} * {1})"), (float, float), always(float)),
+    MUL := Op("mul", always("({0} * {1})"), always("f_mul({0}, {1})"), (float, float), always(float)),
     MUL_CX := Op("mul_cx", always("({0} * {1})"), glslF2Cx("cx_mul({0}, {1})"), (complex, float | complex), always(complex)),
-    DIV := Op("div", always("({0} / {1})"), always("({0} / {1})"), (float, float), always(float)),
+    DIV := Op("div", always("({0} / {1})"), always("f_div({0}, {1})"), (float, float), always(float)),
     DIV_CX := Op("div_cx", always("({0} / {1})"), glslF2Cx("cx_div({0}, {1})"), (complex, float | complex), always(complex)),
-    SQUARE := Op("square", always("({0} ** 2)"), twoForm("({0} * {0})", "cx_sqr({0})"), (float | complex,), sameAsIn),
-    CUBE := Op("cube", always("({0} ** 3)"), twoForm("({0} * {0} * {0})", "cx_cube({0})"), (float | complex,), sameAsIn),
+    SQUARE := Op("square", always("({0} ** 2)"), twoForm("f_sqr({0})", "cx_sqr({0})"), (float | complex,), sameAsIn),
+    CUBE := Op("cube", always("({0} ** 3)"), twoForm("f_mul(f_sqr({0}), {0})", "cx_cube({0})"), (float | complex,), sameAsIn),
     EXP := Op("exp", always("(e ** ({0}))"), twoForm("expF({0})", "cx_exp({0})"), (float | complex,), sameAsIn),
-    DOT := Op("dot", always("dot({0}, {1})"), always("dot({0}, {1})"), (complex, complex), always(float)),
-    CIR_DOT := Op("cir_dot", always("cir_dot({0}, {1})"), always("({0} * {1})"), (complex, complex), always(complex)),
+    DOT := Op("dot", always("dot({0}, {1})"), always("cx_dot({0}, {1})"), (complex, complex), always(float)),
+    CIR_DOT := Op("cir_dot", always("cir_dot({0}, {1})"), always("cx_cir_dot({0}, {1})"), (complex, complex), always(complex)),
     SIN := Op("sin", always("sin({0})"), always("sinF({0})"), (float,), always(float)),
     COS := Op("cos", always("cos({0})"), always("cosF({0})"), (float,), always(float)),
     TAN := Op("tan", always("tan({0})"), always("tanF({0})"), (float,), always(float)),
@@ -70,7 +73,7 @@ OPERATIONS = (
 def randomFloatValue(inputs: Tuple[Tuple[Any, Tuple[str, str]], ...]) -> Tuple[Tuple[Any, Tuple[str, str]], Optional[Op]]:
     if random() < .2:
         val = randint(0, 100) / 10
-        return (float, ("%.1f" % val, "%.1f" % val)), None
+        return (float, ("%.1f" % val, "F(%.1f)" % val)), None
     else:
         sym = choice(inputs)
         if sym[0] is float:
@@ -1,6 +1,6 @@
 import random
 import time
-from math import sin, cos, pi
+from math import sin, cos, pi, ulp
 from enum import Enum
 
 import fractals
@@ -15,11 +15,17 @@ class Settings:
 
         # Render Settings
         self.iterations = None
+        self.auto_iterations = None
         self.render_escape_threshold = None
         self.render_samples = None
         self.static_frame_mix = None
-        self.double_precision = None
+        self.precision: Precisions = None
+        self.auto_precision = None
+        self.interior_detection = None
+        self.dynamic_resolution = None
+        self.frame_time_budget = None
         self.color_palette = None
+        self.color_interpolation: color_utils.GradientInterpolations = None
         self.color_change_speed = None
         self.resetRenderSettings()
 
@@ -41,13 +47,19 @@ class Settings:
         self.resetAudioSettings()
 
     def resetRenderSettings(self):
-        self.iterations = 2048
+        self.iterations = 2048  # chosen by the renderer when auto_iterations is on
+        self.auto_iterations = True
         self.render_escape_threshold = 1000.
         self.render_samples = 1
         self.static_frame_mix = .5
-        self.double_precision = False
+        self.precision = Precisions.Single  # used when auto_precision is off
+        self.auto_precision = True
+        self.interior_detection = True
+        self.dynamic_resolution = True
+        self.frame_time_budget = 10.  # milliseconds of GPU time per frame for the fractal
         # self.color_palette = color_utils.generateRainbowGradient(18)
         self.color_palette = color_utils.gradientFromFunc(10, True, lambda t: (sin(t*2*pi)*.5+.5, cos(t*2*pi)*.5+.5, 1.))
+        self.color_interpolation = color_utils.GradientInterpolations.Linear
         self.color_change_speed = .016
 
     def resetPathSettings(self):
@@ -65,6 +77,48 @@ class Settings:
         self.interpolation = AudioInterpolations.Cubic
         self.audio_escape_threshold = 10000.
 
+class Precisions(Enum):
+    """From the cheapest to the most precise: (index, name, smallest view scale, spacing of its numbers relative to a double's)"""
+    Single = (0, "32bit", 1E-7, 2 ** 29)
+    Double = (1, "64bit", 1E-16, 1)
+    DoubleDouble = (2, "2x64bit", 1E-29, 2 ** -53)  # double-double, see double_double.py
+    # Pixels are offsets from a reference orbit in double precision, so their spacing doesn't depend on the position,
+    # only for fractals that support it (FractalType.perturbation), see deep_zoom.py
+    Perturbation = (3, "Perturbation", 1E-300, 0)
+
+    @property
+    def uses_doubles(self) -> bool:
+        return self is not Precisions.Single
+
+    @property
+    def min_scale(self) -> float:
+        return self.value[2]
+
+    def ulp(self, x: float) -> float:
+        """Same as math.ulp, in this precision."""
+        return ulp(x) * self.value[3]
+
+PRECISION_NAMES = list(p.value[1] for p in Precisions)
+# Automatic precision only uses a precision while pixels are at least this many of its ulps wide at the view,
+# rounding errors grow while iterating
+PRECISION_PIXEL_ULPS = 2 ** 8
+
+def requiredPrecision(scale: float, height: int, position: float, margin: float = 1, perturbation: bool = False) -> Precisions:
+    """
+    The cheapest precision that resolves the pixels of a view.
+
+    :param scale: see Transformation.scale
+    :param position: the largest absolute coordinate of the view
+    :param margin: pixels must be this many times larger than needed
+    :param perturbation: the fractal can be rendered with Precisions.Perturbation
+    """
+    pixel_size = scale * 2 / height
+    precisions = list(Precisions) if perturbation else list(Precisions)[:-1]
+    for precision in precisions:
+        if scale >= precision.min_scale and pixel_size >= precision.ulp(max(position, scale)) * PRECISION_PIXEL_ULPS * margin:
+            return precision
+    return precisions[-1]
+
 class AudioInterpolations(Enum):
     Nearest = (0, "nearest")
     Linear = (1, "linear")
@@ -0,0 +1,88 @@
+"""
+A small module system for GLSL: named function modules, a program links only the modules it uses (the fractal function
+and interior test in main.frag) and the ones they call, every module after its dependencies, so the source to compile
+doesn't grow with the number of modules (generated fractals).
+
+Module files have the modules one after another, each one starts with a "// module: <name>" line:
+
+    // module: mandelbrot
+    VEC2 mandelbrot(VEC2 z, VEC2 c) {
+        return cx_add(cx_sqr(z), c);
+    }
+
+A module depends on the modules it calls, so a module should be named after the function it defines.
+"""
+import re
+from typing import Dict, FrozenSet, Iterable, List
+
+MODULE_HEADER = re.compile(r"^//\s*module:\s*(\w+)\s*$", re.MULTILINE)
+_COMMENT = re.compile(r"//[^\n]*|/\*.*?\*/", re.DOTALL)
+_CALL = re.compile(r"\b(\w+)\s*\(")
+
+
+class ShaderModuleError(Exception):
+    """An unknown module or a circular dependency (GLSL has no recursion)."""
+
+
+class ShaderModules:
+    def __init__(self):
+        self._sources: Dict[str, str] = {}
+        self._calls: Dict[str, FrozenSet[str]] = {}  # names called by the modules, found when they're first linked
+
+    def add(self, name: str, source: str):
+        """Add or replace a module."""
+        self._sources[name] = source if source.endswith("\n") else source + "\n"
+        self._calls.pop(name, None)
+
+    def load(self, text: str):
+        """Add the modules of a module file, the text before the first module is ignored."""
+        parts = MODULE_HEADER.split(text)
+        for name, source in zip(parts[1::2], parts[2::2]):
+            self.add(name, source.strip("\n"))
+
+    def copy(self) -> "ShaderModules":
+        modules = ShaderModules()
+        modules._sources = dict(self._sources)
+        modules._calls = dict(self._calls)
+        return modules
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._sources
+
+    def __len__(self) -> int:
+        return len(self._sources)
+
+    def dependencies(self, name: str) -> List[str]:
+        """The modules the module calls."""
+        calls = self._calls.get(name)
+        if calls is None:
+            calls = self._calls[name] = frozenset(_CALL.findall(_COMMENT.sub("", self._sources[name]))) - {name}
+        return sorted(call for call in calls if call in self._sources)
+
+    def resolve(self, roots: Iterable[str]) -> List[str]:
+        """Names of the modules the roots need (the roots too), each one once and after its dependencies."""
+        order: List[str] = []
+        done = set()
+        path: List[str] = []  # modules being resolved
+
+        def visit(name: str):
+            if name in done:
+                return
+            if name not in self._sources:
+                raise ShaderModuleError(f"Unknown shader module '{name}'" + (f" (called by '{path[-1]}')" if path else ""))
+            if name in path:
+                raise ShaderModuleError(f"Circular shader module dependency: {' -> '.join(path[path.index(name):] + [name])}")
+            path.append(name)
+            for dependency in self.dependencies(name):
+                visit(dependency)
+            path.pop()
+            done.add(name)
+            order.append(name)
+
+        for root in roots:
+            visit(root)
+        return order
+
+    def link(self, roots: Iterable[str]) -> str:
+        """Source of the modules the roots need, in order."""
+        return "".join(self._sources[name] for name in self.resolve(roots))
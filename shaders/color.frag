@@ -0,0 +1,36 @@
+#version 400 core
+
+// Coloring pass: colors a frame from the iteration state main.frag left in it, so color changes don't need iterating
+
+out vec4 fragColor;
+
+#define STATE_ESCAPED 0
+
+uniform sampler2D uData;  // fragData of main.frag
+uniform sampler2D uAntiAliased;  // fragAntiAliased of main.frag
+uniform bool uUseAntiAliased;
+
+uniform sampler2D uColorPalette;
+uniform float uColorChangeSpeed;
+uniform int uIters;
+
+// Same as in main.frag
+vec3 iterationColor(int it) {
+    float palettePos = float(it) * uColorChangeSpeed;
+    return texture(uColorPalette, vec2(palettePos, .5)).rgb;
+}
+
+vec3 stateColor(int it, int state) {
+    return state == STATE_ESCAPED && it < uIters ? iterationColor(it) : vec3(0.);
+}
+
+void main() {
+    ivec2 texel = ivec2(gl_FragCoord.xy);
+    vec4 anti_aliased = texelFetch(uAntiAliased, texel, 0);
+    if (uUseAntiAliased && anti_aliased.a > 0.) {
+        fragColor = vec4(anti_aliased.rgb, 1.);
+        return;
+    }
+    vec4 data = texelFetch(uData, texel, 0);
+    fragColor = vec4(stateColor(int(data.x), int(data.z)), 1.);
+}
@@ -0,0 +1,82 @@
+// Functions main.frag links as modules (see shader_modules.py), a program only gets the fractal function and the
+// interior test in use, and the modules they call. Every module starts with a "// module: <name>" line, the name is
+// the function it defines. The FLOAT (f_*) and VEC2 (cx_*) functions of main.frag can be used in every module.
+
+// ---------- Complex functions ---------
+// module: cx_sin
+VEC2 cx_sin(VEC2 a) {
+    return cx(f_mul(sinF(cx_re(a)), coshF(cx_im(a))), f_mul(cosF(cx_re(a)), sinhF(cx_im(a))));
+}
+// module: cx_cos
+VEC2 cx_cos(VEC2 a) {
+    return cx(f_mul(cosF(cx_re(a)), coshF(cx_im(a))), f_neg(f_mul(sinF(cx_re(a)), sinhF(cx_im(a)))));
+}
+// module: cx_exp
+VEC2 cx_exp(VEC2 a) {
+    return cx_scale(cx(cosF(cx_im(a)), sinF(cx_im(a))), expF(cx_re(a)));
+}
+//TODO: cx_tan(VEC2 a, VEC2 b)
+//TODO: cx_pow(VEC2 a, VEC2 b)
+//TODO: cx_log(VEC2 a, VEC2 b)
+//TODO: cx_sqrt(VEC2 a)
+
+// ---------- Fractals ---------
+// module: mandelbrot
+VEC2 mandelbrot(VEC2 z, VEC2 c) {
+    return cx_add(cx_sqr(z), c);
+}
+// module: burning_ship
+VEC2 burning_ship(VEC2 z, VEC2 c) {
+    return cx_add(cx(f_sub(f_sqr(cx_re(z)), f_sqr(cx_im(z))), f_mul(F(2.), f_abs(f_mul(cx_re(z), cx_im(z))))), c);
+}
+// module: feather
+VEC2 feather(VEC2 z, VEC2 c) {
+    return cx_add(cx_div(cx_cube(z), cx_add(cx_one, cx_cir_dot(z, z))), c);
+}
+// module: sfx
+VEC2 sfx(VEC2 z, VEC2 c) {
+    return cx_sub(cx_scale(z, cx_dot(z, z)), cx_mul(z, cx_cir_dot(c, c)));
+}
+// module: henon
+VEC2 henon(VEC2 z, VEC2 c) {
+    FLOAT x = cx_re(z);
+    return cx(f_add(f_sub(F(1.), f_mul(f_mul(cx_re(c), x), x)), cx_im(z)), f_mul(cx_im(c), x));
+}
+// module: duffing
+VEC2 duffing(VEC2 z, VEC2 c) {
+    FLOAT y = cx_im(z);
+    return cx(y, f_sub(f_add(f_mul(f_neg(cx_im(c)), cx_re(z)), f_mul(cx_re(c), y)), f_mul(f_sqr(y), y)));
+}
+// module: ikeda
+VEC2 ikeda(VEC2 z, VEC2 c) {
+    FLOAT t = f_sub(F(0.4), f_div(F(6.), f_add(F(1.), cx_dot(z, z))));
+    FLOAT st = sinF(t);
+    FLOAT ct = cosF(t);
+    return cx(f_add(F(1.), f_mul(cx_re(c), f_sub(f_mul(cx_re(z), ct), f_mul(cx_im(z), st)))),
+              f_mul(cx_im(c), f_add(f_mul(cx_re(z), st), f_mul(cx_im(z), ct))));
+}
+// module: chirikov
+VEC2 chirikov(VEC2 z, VEC2 c) {
+    FLOAT y = f_add(cx_im(z), f_mul(cx_im(c), sinF(cx_re(z))));
+    return cx(f_add(cx_re(z), f_mul(cx_re(c), y)), y);
+}
+// module: chirikov_mutate
+VEC2 chirikov_mutate(VEC2 z, VEC2 c) {
+    return cx(f_add(cx_re(z), f_mul(cx_re(c), cx_im(z))), f_add(cx_im(z), f_mul(cx_im(c), sinF(cx_re(z)))));
+}
+
+// ---------- Interior tests ---------
+// true means c never escapes
+// module: no_interior
+bool no_interior(VEC2 c) {
+    return false;
+}
+// module: mandelbrot_interior
+bool mandelbrot_interior(VEC2 c) {
+    // Main cardioid and period 2 bulb
+    FLOAT x = f_sub(cx_re(c), F(0.25));
+    FLOAT y2 = f_sqr(cx_im(c));
+    FLOAT q = f_add(f_sqr(x), y2);
+    FLOAT xp1 = f_add(cx_re(c), F(1.));
+    return f_approx(f_sub(f_mul(q, f_add(q, x)), f_mul(F(0.25), y2))) <= 0. || f_approx(f_add(f_sqr(xp1), y2)) <= 0.0625;
+}
@@ -1,4 +1,4 @@
-#version 400 compatibility
+#version 400 core
 //#extension GL_NV_gpu_shader_fp64 : enable
 //#extension GL_NV_gpu_shader5 : enable
 //#extension GL_ARB_gpu_shader_fp64 : enable
@@ -8,25 +8,53 @@
 precision highp float;
 
 in vec2 fragCoord;
-out vec4 fragColor;
+// Colors are made by the coloring pass (color.frag) from fragData, except for the anti-aliased image:
+// rgb: mixed anti-aliasing samples, a: 1 if the pixel has them, 0 if it is colored from its center's iteration state
+layout(location = 0) out vec4 fragAntiAliased;
+// Iteration state of the pixel center, x: iteration count, y: 1 if it was computed for this pixel, 0 if it was
+// reprojected from an older frame, z: STATE_*, w: iteration count of the anti-aliasing sample in progress
+layout(location = 1) out vec4 fragData;
+layout(location = 2) out uvec4 fragZ;  // z of the pixel center (packZ)
+layout(location = 3) out vec4 fragSamples;  // rgb: sum of the finished anti-aliasing samples, w: their count
+layout(location = 4) out uvec4 fragSampleZ;  // z of the anti-aliasing sample in progress
+// lo parts of fragZ and fragSampleZ in double-double precision and the reference orbit index in perturbation,
+// these have no attachment in the other precisions
+layout(location = 5) out uvec4 fragZLow;
+layout(location = 6) out uvec4 fragSampleZLow;
+
+#define STATE_ESCAPED 0
+#define STATE_RUNNING 1  // reached the iteration limit, can be continued
+#define STATE_INTERIOR 2  // known to never escape
 
 #PY_PRECISION_DEFINE USE_DOUBLE_PRECISION
+#PY_DOUBLE_DOUBLE_DEFINE USE_DOUBLE_DOUBLE
+// Perturbation (double precision): pixels iterate their offset from a reference orbit, see deep_zoom.py
+#PY_PERTURBATION_DEFINE USE_PERTURBATION
 
-#ifdef USE_DOUBLE_PRECISION
+// Fractal math is written with the FLOAT (f_*) and VEC2 (cx_*) functions below, so it works in every precision.
+// REAL is the type approximate values (comparisons, thresholds) are computed in.
+#if defined(USE_DOUBLE_DOUBLE)
+    // Double-double: a FLOAT is the unevaluated sum hi + lo of two doubles (x, y),
+    // a VEC2 is (re.hi, re.lo, im.hi, im.lo), see double_double.py
+    #define FLOAT dvec2
+    #define VEC2 dvec4
+    #define REAL double
+#elif defined(USE_DOUBLE_PRECISION)
     #define FLOAT double
     #define VEC2 dvec2
-    #define VEC3 dvec3
+    #define REAL double
 #else
     #define FLOAT float
     #define VEC2 vec2
-    #define VEC3 vec3
+    #define REAL float
 #endif
 
 uniform float uAspectRatio;
-uniform FLOAT uScale;
-uniform VEC2 uTranslation;
+uniform REAL uScale;
+uniform VEC2 uTranslation;  // (x.hi, x.lo, y.hi, y.lo) in double-double precision, from the reference orbit's c in perturbation
 
-uniform sampler2D uLastFrame;
+uniform sampler2D uLastAntiAliased;  // fragAntiAliased of the last frame
+uniform bool uUseAntiAliased;  // false if it was made with other colors
 uniform float uOldFramesMixFactor;
 uniform int uHashSeed;
 uniform double uSwizzleMultiplier;
@@ -35,145 +63,290 @@ uniform sampler2D uColorPalette;
 uniform float uColorChangeSpeed;
 uniform int uIters;
 uniform float uEscapeThreshold;
+uniform REAL uPeriodicityThreshold;
 
 uniform int uSamples;
 
-#ifdef USE_DOUBLE_PRECISION
-    FLOAT sinF(FLOAT a) { return FLOAT(sin(float(a))); }
-    FLOAT cosF(FLOAT a) { return FLOAT(cos(float(a))); }
-    FLOAT tanF(FLOAT a) { return FLOAT(tan(float(a))); }
-    FLOAT sinhF(FLOAT a) { return FLOAT(sinh(float(a))); }
-    FLOAT coshF(FLOAT a) { return FLOAT(cosh(float(a))); }
-    FLOAT expF(FLOAT a) { return FLOAT(exp(float(a))); }
+// A frame can be rendered over several submissions, every pixel runs at most uPassIters iterations per submission
+uniform int uPassIters;
+uniform bool uAntiAliasingPass;  // render jittered samples and mix them into the image, otherwise render pixel centers
+uniform bool uContinuePass;  // continue the anti-aliasing samples of the last frame
+
+// Reprojection: reuse the iteration data of the last frame where the pixel was already on screen
+uniform bool uReproject;
+uniform sampler2D uCache;  // fragData of the last frame
+uniform usampler2D uCacheZ;
+uniform sampler2D uCacheSamples;
+uniform usampler2D uCacheSampleZ;
+uniform usampler2D uCacheZLow;
+uniform usampler2D uCacheSampleZLow;
+uniform vec2 uCacheFactor;  // maps gl_FragCoord to texel coordinates in uCache
+uniform vec2 uCacheOffset;
+uniform bool uCacheExact;  // pixel centers map exactly onto pixel centers of the last frame (panned by whole pixels)
+uniform float uRefineFraction;  // fraction of the reprojected pixels that are computed again, picked in blocks
+#define REFINE_BLOCK_SIZE 8
+
+#if defined(USE_PERTURBATION)
+    uniform usampler2D uReferenceOrbit;  // iterate m at texel (m % REFERENCE_ORBIT_WIDTH, m / REFERENCE_ORBIT_WIDTH), as packed doubles
+    uniform int uReferenceLength;  // iterates in uReferenceOrbit
+    #define REFERENCE_ORBIT_WIDTH 1024
+#endif
+
+#if defined(USE_DOUBLE_DOUBLE)
+    // Error-free transformations, 'precise' keeps the compiler from reassociating or contracting them
+    dvec2 dd_two_sum(double a, double b) {
+        precise double s = a + b;
+        precise double v = s - a;
+        precise double e = (a - (s - v)) + (b - v);
+        return dvec2(s, e);
+    }
+    dvec2 dd_quick_two_sum(double a, double b) {  // |a| >= |b|
+        precise double s = a + b;
+        precise double e = b - (s - a);
+        return dvec2(s, e);
+    }
+    dvec2 dd_split(double a) {
+        // Dekker's split into two halves of 26 bits, fma() isn't exact for doubles on every driver
+        precise double t = 134217729.0LF * a;  // 2^27 + 1
+        precise double hi = t - (t - a);
+        return dvec2(hi, a - hi);
+    }
+    dvec2 dd_two_prod(double a, double b) {
+        precise double p = a * b;
+        dvec2 as = dd_split(a);
+        dvec2 bs = dd_split(b);
+        precise double e = ((as.x*bs.x - p) + as.x*bs.y + as.y*bs.x) + as.y*bs.y;
+        return dvec2(p, e);
+    }
+
+    FLOAT F(double a) { return dvec2(a, 0.); }
+    REAL f_approx(FLOAT a) { return a.x; }
+    FLOAT f_add(FLOAT a, FLOAT b) {
+        dvec2 s = dd_two_sum(a.x, b.x);
+        dvec2 t = dd_two_sum(a.y, b.y);
+        s = dd_quick_two_sum(s.x, s.y + t.x);
+        return dd_quick_two_sum(s.x, s.y + t.y);
+    }
+    FLOAT f_neg(FLOAT a) { return -a; }
+    FLOAT f_sub(FLOAT a, FLOAT b) { return f_add(a, -b); }
+    FLOAT f_mul(FLOAT a, FLOAT b) {
+        dvec2 p = dd_two_prod(a.x, b.x);
+        return dd_quick_two_sum(p.x, p.y + (a.x*b.y + a.y*b.x));
+    }
+    FLOAT f_sqr(FLOAT a) {
+        dvec2 p = dd_two_prod(a.x, a.x);
+        return dd_quick_two_sum(p.x, p.y + 2.*a.x*a.y);
+    }
+    FLOAT f_div(FLOAT a, FLOAT b) {
+        // Long division, every step gets about 53 more bits
+        double q1 = a.x / b.x;
+        FLOAT r = f_sub(a, f_mul(b, F(q1)));
+        double q2 = r.x / b.x;
+        r = f_sub(r, f_mul(b, F(q2)));
+        double q3 = r.x / b.x;
+        return f_add(dd_quick_two_sum(q1, q2), F(q3));
+    }
+    FLOAT f_abs(FLOAT a) { return a.x < 0. ? -a : a; }
+
+    // Transcendental functions are only computed in single precision
+    FLOAT sinF(FLOAT a) { return F(sin(float(a.x))); }
+    FLOAT cosF(FLOAT a) { return F(cos(float(a.x))); }
+    FLOAT tanF(FLOAT a) { return F(tan(float(a.x))); }
+    FLOAT sinhF(FLOAT a) { return F(sinh(float(a.x))); }
+    FLOAT coshF(FLOAT a) { return F(cosh(float(a.x))); }
+    FLOAT expF(FLOAT a) { return F(exp(float(a.x))); }
+    FLOAT f_pow(FLOAT a, FLOAT b) { return F(pow(float(a.x), float(b.x))); }
+    FLOAT f_mod(FLOAT a, FLOAT b) { return f_sub(a, f_mul(b, F(floor(f_div(a, b).x)))); }
+
+    VEC2 cx(FLOAT x, FLOAT y) { return dvec4(x, y); }
+    FLOAT cx_re(VEC2 a) { return a.xy; }
+    FLOAT cx_im(VEC2 a) { return a.zw; }
+    REAL cx_abs_sqr(VEC2 a) { return a.x*a.x + a.z*a.z; }
 #else
-    #define sinF sin
-    #define cosF cos
-    #define tanF tan
-    #define sinhF sinh
-    #define coshF cosh
-    #define expF exp
+    FLOAT F(REAL a) { return a; }
+    REAL f_approx(FLOAT a) { return a; }
+    FLOAT f_add(FLOAT a, FLOAT b) { return a + b; }
+    FLOAT f_neg(FLOAT a) { return -a; }
+    FLOAT f_sub(FLOAT a, FLOAT b) { return a - b; }
+    FLOAT f_mul(FLOAT a, FLOAT b) { return a * b; }
+    FLOAT f_sqr(FLOAT a) { return a * a; }
+    FLOAT f_div(FLOAT a, FLOAT b) { return a / b; }
+    FLOAT f_abs(FLOAT a) { return abs(a); }
+
+    #ifdef USE_DOUBLE_PRECISION
+        FLOAT sinF(FLOAT a) { return FLOAT(sin(float(a))); }
+        FLOAT cosF(FLOAT a) { return FLOAT(cos(float(a))); }
+        FLOAT tanF(FLOAT a) { return FLOAT(tan(float(a))); }
+        FLOAT sinhF(FLOAT a) { return FLOAT(sinh(float(a))); }
+        FLOAT coshF(FLOAT a) { return FLOAT(cosh(float(a))); }
+        FLOAT expF(FLOAT a) { return FLOAT(exp(float(a))); }
+        FLOAT f_pow(FLOAT a, FLOAT b) { return FLOAT(pow(float(a), float(b))); }
+    #else
+        #define sinF sin
+        #define cosF cos
+        #define tanF tan
+        #define sinhF sinh
+        #define coshF cosh
+        #define expF exp
+        #define f_pow pow
+    #endif
+    FLOAT f_mod(FLOAT a, FLOAT b) { return mod(a, b); }
+
+    VEC2 cx(FLOAT x, FLOAT y) { return VEC2(x, y); }
+    FLOAT cx_re(VEC2 a) { return a.x; }
+    FLOAT cx_im(VEC2 a) { return a.y; }
+    REAL cx_abs_sqr(VEC2 a) { return dot(a, a); }
 #endif
 
-#define cx_one VEC2(1.0, 0.0)
-VEC2 cx_mul(VEC2 a, VEC2 b) {
-    return VEC2(a.x*b.x - a.y*b.y, a.x*b.y + a.y*b.x);
+VEC2 cx_real(FLOAT x) { return cx(x, F(0.)); }
+#define cx_one cx_real(F(1.))
+VEC2 cx_neg(VEC2 a) { return -a; }
+VEC2 cx_add(VEC2 a, VEC2 b) {
+    return cx(f_add(cx_re(a), cx_re(b)), f_add(cx_im(a), cx_im(b)));
 }
-VEC2 cx_sqr(VEC2 a) {
-    FLOAT x2 = a.x*a.x;
-    FLOAT y2 = a.y*a.y;
-    FLOAT xy = a.x*a.y;
-    return VEC2(x2 - y2, xy + xy);
+VEC2 cx_sub(VEC2 a, VEC2 b) {
+    return cx(f_sub(cx_re(a), cx_re(b)), f_sub(cx_im(a), cx_im(b)));
 }
-VEC2 cx_cube(VEC2 a) {
-    FLOAT x2 = a.x*a.x;
-    FLOAT y2 = a.y*a.y;
-    FLOAT d = x2 - y2;
-    return VEC2(a.x*(d - y2 - y2), a.y*(x2 + x2 + d));
-}
-VEC2 cx_div(VEC2 a, VEC2 b) {
-    FLOAT denom = 1.0 / (b.x*b.x + b.y*b.y);
-    return VEC2(a.x*b.x + a.y*b.y, a.y*b.x - a.x*b.y) * denom;
+VEC2 cx_scale(VEC2 a, FLOAT s) {
+    return cx(f_mul(cx_re(a), s), f_mul(cx_im(a), s));
 }
-VEC2 cx_sin(VEC2 a) {
-    return VEC2(sinF(a.x) * coshF(a.y), cosF(a.x) * sinhF(a.y));
-}
-VEC2 cx_cos(VEC2 a) {
-    return VEC2(cosF(a.x) * coshF(a.y), -sinF(a.x) * sinhF(a.y));
-}
-//TODO: cx_tan(VEC2 a, VEC2 b)
-VEC2 cx_exp(VEC2 a) {
-    return expF(a.x) * VEC2(cosF(a.y), sinF(a.y));
-}
-//TODO: cx_pow(VEC2 a, VEC2 b)
-//TODO: cx_log(VEC2 a, VEC2 b)
-//TODO: cx_sqrt(VEC2 a)
-
-// ---------- Fractals Begin ---------
-VEC2 mandelbrot(VEC2 z, VEC2 c) {
-    return cx_sqr(z) + c;
+FLOAT cx_dot(VEC2 a, VEC2 b) {
+    return f_add(f_mul(cx_re(a), cx_re(b)), f_mul(cx_im(a), cx_im(b)));
 }
-VEC2 burning_ship(VEC2 z, VEC2 c) {
-    return VEC2(z.x*z.x - z.y*z.y, 2.0*abs(z.x * z.y)) + c;
+VEC2 cx_cir_dot(VEC2 a, VEC2 b) {
+    return cx(f_mul(cx_re(a), cx_re(b)), f_mul(cx_im(a), cx_im(b)));
 }
-VEC2 feather(VEC2 z, VEC2 c) {
-    return cx_div(cx_cube(z), cx_one + z*z) + c;
-}
-VEC2 sfx(VEC2 z, VEC2 c) {
-    return z * dot(z,z) - cx_mul(z, c*c);
+VEC2 cx_mul(VEC2 a, VEC2 b) {
+    return cx(f_sub(f_mul(cx_re(a), cx_re(b)), f_mul(cx_im(a), cx_im(b))),
+              f_add(f_mul(cx_re(a), cx_im(b)), f_mul(cx_im(a), cx_re(b))));
 }
-VEC2 henon(VEC2 z, VEC2 c) {
-    return VEC2(1.0 - c.x*z.x*z.x + z.y, c.y * z.x);
+VEC2 cx_sqr(VEC2 a) {
+    FLOAT x2 = f_sqr(cx_re(a));
+    FLOAT y2 = f_sqr(cx_im(a));
+    FLOAT xy = f_mul(cx_re(a), cx_im(a));
+    return cx(f_sub(x2, y2), f_add(xy, xy));
 }
-VEC2 duffing(VEC2 z, VEC2 c) {
-    return VEC2(z.y, -c.y*z.x + c.x*z.y - z.y*z.y*z.y);
+VEC2 cx_cube(VEC2 a) {
+    FLOAT x2 = f_sqr(cx_re(a));
+    FLOAT y2 = f_sqr(cx_im(a));
+    FLOAT d = f_sub(x2, y2);
+    return cx(f_mul(cx_re(a), f_sub(f_sub(d, y2), y2)), f_mul(cx_im(a), f_add(f_add(x2, x2), d)));
 }
-VEC2 ikeda(VEC2 z, VEC2 c) {
-    FLOAT t = 0.4 - 6.0/(1.0 + dot(z,z));
-    FLOAT st = sinF(t);
-    FLOAT ct = cosF(t);
-    return VEC2(1.0 + c.x*(z.x*ct - z.y*st), c.y*(z.x*st + z.y*ct));
+VEC2 cx_div(VEC2 a, VEC2 b) {
+    FLOAT denom = f_div(F(1.), f_add(f_sqr(cx_re(b)), f_sqr(cx_im(b))));
+    return cx_scale(cx(cx_dot(a, b), f_sub(f_mul(cx_im(a), cx_re(b)), f_mul(cx_re(a), cx_im(b)))), denom);
 }
-VEC2 chirikov(VEC2 z, VEC2 c) {
-    z.y += c.y*sinF(z.x);
-    z.x += c.x*z.y;
-    return z;
+// ---------- Modules ---------
+// The fractal function, the interior test and the functions they call, from shaders/fractals.glsl or generated
+// (see shader_modules.py), PY_FRACTAL_FUNC and PY_INTERIOR_FUNC are replaced with the names of the ones in use
+PY_LINKED_MODULES;
+
+// z is stored bit-exactly in two RGBA32UI textures, the second one only holds the lo parts in double-double precision.
+// ZSTATE is what is iterated: z, or in perturbation (dz, m), z's offset from iterate m of the reference orbit
+#if defined(USE_PERTURBATION)
+    #define ZSTATE dvec3
+    void packZ(ZSTATE z, out uvec4 high, out uvec4 low) {
+        high = uvec4(unpackDouble2x32(z.x), unpackDouble2x32(z.y));
+        low = uvec4(uint(z.z), 0U, 0U, 0U);
+    }
+    ZSTATE unpackZ(uvec4 high, uvec4 low) {
+        return dvec3(packDouble2x32(high.xy), packDouble2x32(high.zw), double(low.x));
+    }
+    // The 1st iterate is c, the reference orbit's 1st iterate plus the pixel's offset
+    ZSTATE startZ(VEC2 c) { return dvec3(c, 1.); }
+#elif defined(USE_DOUBLE_DOUBLE)
+    void packZ(VEC2 z, out uvec4 high, out uvec4 low) {
+        high = uvec4(unpackDouble2x32(z.x), unpackDouble2x32(z.z));
+        low = uvec4(unpackDouble2x32(z.y), unpackDouble2x32(z.w));
+    }
+    VEC2 unpackZ(uvec4 high, uvec4 low) {
+        return dvec4(packDouble2x32(high.xy), packDouble2x32(low.xy), packDouble2x32(high.zw), packDouble2x32(low.zw));
+    }
+#elif defined(USE_DOUBLE_PRECISION)
+    void packZ(VEC2 z, out uvec4 high, out uvec4 low) {
+        high = uvec4(unpackDouble2x32(z.x), unpackDouble2x32(z.y));
+        low = uvec4(0U);
+    }
+    VEC2 unpackZ(uvec4 high, uvec4 low) { return VEC2(packDouble2x32(high.xy), packDouble2x32(high.zw)); }
+#else
+    void packZ(VEC2 z, out uvec4 high, out uvec4 low) {
+        high = uvec4(floatBitsToUint(z), 0U, 0U);
+        low = uvec4(0U);
+    }
+    VEC2 unpackZ(uvec4 high, uvec4 low) { return uintBitsToFloat(high.xy); }
+#endif
+#if !defined(USE_PERTURBATION)
+    #define ZSTATE VEC2
+    ZSTATE startZ(VEC2 c) { return c; }
+#endif
+
+vec3 iterationColor(int it) {
+    float palettePos = float(it) * uColorChangeSpeed;
+    return texture(uColorPalette, vec2(palettePos, .5)).rgb;
 }
-VEC2 chirikov_mutate(VEC2 z, VEC2 c) {
-    return VEC2(z.x + c.x*z.y, z.y + c.y*sinF(z.x));
+
+vec3 stateColor(int it, int state) {
+    // Escaping at or after the limit counts as not escaping, the limit may have been lowered since
+    return state == STATE_ESCAPED && it < uIters ? iterationColor(it) : vec3(0.);
 }
-PY_INSERT_RANDOMLY_GENERATED_FUNCTIONS;
-// ---------- Fractals End ---------
 
-bool cx_isclose(VEC2 a, VEC2 b) {
-    FLOAT epsX = 1e-4;
-    FLOAT epsY = 1e-4;
-    return abs(a.x - b.x) < epsX && abs(a.y - b.y) < epsY;
+#if defined(USE_PERTURBATION)
+VEC2 referenceZ(int m) {
+    uvec4 texel = texelFetch(uReferenceOrbit, ivec2(m % REFERENCE_ORBIT_WIDTH, m / REFERENCE_ORBIT_WIDTH), 0);
+    return dvec2(packDouble2x32(texel.xy), packDouble2x32(texel.zw));
 }
 
-#define FLAG_USE_COLOR false
-vec3 fractal(VEC2 z, VEC2 c) {
-    VEC2 pz = z;
-    VEC3 sumz = VEC3(0.0, 0.0, 0.0);
-    int it;
+// The one below for z^2 + c, iterating z's offset dz from the reference orbit, c is the pixel's offset from the
+// reference's c (same as deep_zoom.perturbationEscapeTime without BLA). There is no periodicity check, orbits are
+// only known relative to the reference.
+int fractal(inout ZSTATE state, VEC2 dc, inout int it, int end) {
+    VEC2 dz = state.xy;
+    int m = int(state.z);
+    int result = STATE_RUNNING;
+    for (; it < end; ++it) {
+        dz = cx_add(cx_mul(cx_add(cx_scale(referenceZ(m), F(2.)), dz), dz), dc);
+        ++m;
+        VEC2 z = cx_add(referenceZ(m), dz);
 
-//    VEC2 history[3];
-//    int hist_write_index = 0;
+        if (cx_abs_sqr(z) > uEscapeThreshold) {
+            result = STATE_ESCAPED;
+            break;
+        }
 
-    for (it = 0; it < uIters; ++it) {
-        VEC2 ppz = pz;
-        pz = z;
+        // Rebase: continue from the start of the reference orbit when z gets closer to 0 than to the reference
+        // (dz would lose precision), or when the reference orbit ends
+        if (cx_abs_sqr(z) < cx_abs_sqr(dz) || m >= uReferenceLength - 1) {
+            dz = z;
+            m = 0;
+        }
+    }
+    state = dvec3(dz, double(m));
+    return result;
+}
+#else
+// Iterate z from iteration it until it escapes, is found to be periodic or it reaches end, returns the new state
+int fractal(inout VEC2 z, VEC2 c, inout int it, int end) {
+    // Periodicity check (Brent): z is compared to a saved point, which moves to z after 1, 2, 4, 8... iterations
+    VEC2 period_z = z;
+    int period_length = 1;
+    int period_steps = 0;
 
+    for (; it < end; ++it) {
         // FRACTAL_FUNC would be replaced with one of the fractal functions
         z = PY_FRACTAL_FUNC(z, c);
 
-//        for (int hi = 0; hi < history.length(); hi++) {
-//            VEC2 h = history[hi];
-//            if (cx_isclose(z, h)) { return vec3(0., 1., 0.); }
-//        }
-//        history[hist_write_index % history.length()] = z;
-//        hist_write_index ++;
-
-
-        if (dot(z, z) > uEscapeThreshold) { break; }
-        sumz.x += dot(z - pz, pz - ppz);
-        sumz.y += dot(z - pz, z - pz);
-        sumz.z += dot(z - ppz, z - ppz);
-    }
-
-    if (it != uIters) {
-//        float k = 2.3;
-//        float sit = it - log2(log2(dot(z,z))/(log2(uEscapeThreshold)))/log2(k);
-        float palettePos = float(it) * uColorChangeSpeed;
-        vec3 paletteColor = texture(uColorPalette, vec2(palettePos, .5)).rgb;
-        return paletteColor * (1.0 - float(FLAG_USE_COLOR)*0.85);
-    } else if (FLAG_USE_COLOR) {
-        sumz = abs(sumz) / FLOAT(uIters);
-        vec3 n1 = sin(vec3(abs(sumz * 5.0))) * 0.45 + 0.5;
-        return n1;
-    } else {
-        return vec3(0.);
+        if (cx_abs_sqr(z) > uEscapeThreshold) { return STATE_ESCAPED; }
+
+        if (cx_abs_sqr(cx_sub(z, period_z)) < uPeriodicityThreshold) { return STATE_INTERIOR; }
+        if (++period_steps == period_length) {
+            period_z = z;
+            period_length *= 2;
+            period_steps = 0;
+        }
     }
+    return STATE_RUNNING;
 }
+#endif
 
 vec2 hash2(uint n) {
     // integer hash copied from Hugo Elias
@@ -183,25 +356,105 @@ vec2 hash2(uint n) {
     return vec2( k & uvec2(0x7fffffffU))/float(0x7fffffff);
 }
 
-void main() {
+VEC2 pixelPosition() {
     vec2 ndr = (fragCoord * 2.) - 1.;
     ndr.y *= -1;
-    VEC2 position = VEC2(ndr.x * uAspectRatio, ndr.y) * FLOAT(uScale) + VEC2(uTranslation);
+    return cx_add(cx(F(REAL(ndr.x * uAspectRatio) * uScale), F(REAL(ndr.y) * uScale)), uTranslation);
+}
 
-    vec3 color = vec3(0.);
-    for (int smp = 0; smp < uSamples; smp++) {
-        int seed = int(fragCoord.x * 2000.) + int(fragCoord.y * 1000. * 2000.) + smp * 2000 * 1000 * 1000 + uHashSeed;
-        VEC2 swizzle = VEC2(hash2(seed) - vec2(.5)) * FLOAT(uSwizzleMultiplier);
-        VEC2 fractPos = position + swizzle;
-        //TODO: starting pos is either fractPos or VEC2(0.), should be determained for indivisual fractals (by the user)
-        color += fractal(fractPos, fractPos);
+void centerPass() {
+    //TODO: starting pos is either fractPos or VEC2(0.), should be determained for indivisual fractals (by the user)
+    VEC2 c = pixelPosition();
+    ZSTATE z = startZ(c);
+    int it = 0;
+    int state = PY_INTERIOR_FUNC(c) ? STATE_INTERIOR : STATE_RUNNING;
+    bool exact = true;  // the state belongs to this pixel's center
+
+    if (uReproject && state == STATE_RUNNING) {
+        vec2 cache_coord = gl_FragCoord.xy * uCacheFactor + uCacheOffset;
+        ivec2 texel = ivec2(floor(cache_coord));
+        // Outside means newly exposed
+        if (all(greaterThanEqual(texel, ivec2(0))) && all(lessThan(texel, textureSize(uCache, 0)))) {
+            vec4 data = texelFetch(uCache, texel, 0);
+            exact = uCacheExact && data.y > 0.;
+            // Whole blocks are refined, single pixels wouldn't save anything when their neighbours are iterated anyway
+            ivec2 block = ivec2(gl_FragCoord.xy) / REFINE_BLOCK_SIZE;
+            if (exact || hash2(block.x + block.y * 2000 + uHashSeed).x >= uRefineFraction) {
+                it = int(data.x);
+                state = int(data.z);
+                z = unpackZ(texelFetch(uCacheZ, texel, 0), texelFetch(uCacheZLow, texel, 0));
+            } else {
+                exact = true;  // refined
+            }
+        }
+    }
+
+    // Continue where the last frame stopped (more iterations, or the limit was raised)
+    if (exact && state == STATE_RUNNING && it < uIters) {
+        state = fractal(z, c, it, min(uIters, it + uPassIters));
     }
-    color /= uSamples;
 
-    color = clamp(color, 0., 1.);
+    fragAntiAliased = vec4(0.);
+    fragData = vec4(float(it), exact ? 1. : 0., float(state), 0.);
+    packZ(z, fragZ, fragZLow);
+    fragSamples = vec4(0.);
+    fragSampleZ = uvec4(0U);
+    fragSampleZLow = uvec4(0U);
+}
+
+void antiAliasingPass() {
+    ivec2 texel = ivec2(gl_FragCoord.xy);
 
-    vec3 lastFrameColor = texture(uLastFrame, vec2(fragCoord.x, -fragCoord.y)).rgb;
-    color = mix(color, lastFrameColor, uOldFramesMixFactor);
+    // The pixel center's state is kept for reprojection
+    vec4 data = texelFetch(uCache, texel, 0);
+    vec4 last_anti_aliased = uUseAntiAliased ? texelFetch(uLastAntiAliased, texel, 0) : vec4(0.);
+    vec3 last_color = last_anti_aliased.a > 0. ? last_anti_aliased.rgb : stateColor(int(data.x), int(data.z));
+    fragZ = texelFetch(uCacheZ, texel, 0);
+    fragZLow = texelFetch(uCacheZLow, texel, 0);
 
-    fragColor = vec4(color, 1.);
+    vec4 samples = uContinuePass ? texelFetch(uCacheSamples, texel, 0) : vec4(0.);
+    int it = uContinuePass ? int(data.w) : 0;
+    ZSTATE z = unpackZ(texelFetch(uCacheSampleZ, texel, 0), texelFetch(uCacheSampleZLow, texel, 0));
+    VEC2 position = pixelPosition();
+
+    bool finished = int(samples.w) >= uSamples;
+    int budget = uPassIters;
+    while (int(samples.w) < uSamples && budget > 0) {
+        int seed = int(fragCoord.x * 2000.) + int(fragCoord.y * 1000. * 2000.) + int(samples.w) * 2000 * 1000 * 1000 + uHashSeed;
+        vec2 swizzle = hash2(seed) - vec2(.5);
+        VEC2 c = cx_add(position, cx(F(REAL(swizzle.x) * REAL(uSwizzleMultiplier)), F(REAL(swizzle.y) * REAL(uSwizzleMultiplier))));
+
+        int state = STATE_RUNNING;
+        if (it == 0) {
+            z = startZ(c);
+            state = PY_INTERIOR_FUNC(c) ? STATE_INTERIOR : STATE_RUNNING;
+        }
+        int start = it;
+        if (state == STATE_RUNNING) {
+            state = fractal(z, c, it, min(uIters, it + budget));
+        }
+        budget -= max(1, it - start);
+        if (state == STATE_RUNNING && it < uIters) { break; }  // out of budget, continued in the next submission
+
+        samples += vec4(stateColor(it, state), 1.);
+        it = 0;
+    }
+
+    fragAntiAliased = last_anti_aliased;
+    if (!finished && int(samples.w) >= uSamples) {
+        // Finished in this submission
+        fragAntiAliased = vec4(mix(clamp(samples.rgb / float(uSamples), 0., 1.), last_color, uOldFramesMixFactor), 1.);
+    }
+
+    fragData = vec4(data.xyz, float(it));
+    fragSamples = samples;
+    packZ(z, fragSampleZ, fragSampleZLow);
+}
+
+void main() {
+    if (uAntiAliasingPass) {
+        antiAliasingPass();
+    } else {
+        centerPass();
+    }
 }
\ No newline at end of file
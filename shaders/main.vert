@@ -1,4 +1,4 @@
-#version 400 compatibility
+#version 400 core
 
 in vec2 vert;
 in vec2 texCoord;
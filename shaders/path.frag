@@ -1,4 +1,4 @@
-#version 400 compatibility
+#version 400 core
 
 /*
 This is a port to ModernGL of code by Nicolas P. Rougier from his "Python & OpenGL
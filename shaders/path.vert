@@ -1,4 +1,4 @@
-#version 400 compatibility
+#version 400 core
 
 uniform float uAspectRatio;
 uniform float uScale;
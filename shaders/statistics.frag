@@ -0,0 +1,13 @@
+#version 400 core
+
+// Statistics pass: samples the iteration state of a frame on a small grid, so it can be read back cheaply
+
+out vec2 fragState;  // x: iteration count, y: STATE_* (see main.frag)
+
+uniform sampler2D uData;  // fragData of main.frag
+uniform vec2 uGridSize;
+
+void main() {
+    ivec2 texel = ivec2(gl_FragCoord.xy * vec2(textureSize(uData, 0)) / uGridSize);
+    fragState = texelFetch(uData, texel, 0).xz;
+}
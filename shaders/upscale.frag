@@ -0,0 +1,10 @@
+#version 400 core
+
+in vec2 fragCoord;
+out vec4 fragColor;
+
+uniform sampler2D uImage;
+
+void main() {
+    fragColor = vec4(texture(uImage, vec2(fragCoord.x, 1. - fragCoord.y)).rgb, 1.);
+}
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from utils import color_utils
+from utils.color_utils import GradientInterpolations
+
+GRADIENT = [(.5, (0., 1., 0.)), (0., (1., 0., 0.)), (.75, (0., 0., 1.))]  # marks don't have to be sorted
+
+
+def _sample(pos, repeating=False, interpolation=GradientInterpolations.Linear) -> np.ndarray:
+    return color_utils.sampleGradient(GRADIENT, np.array(pos), repeating, interpolation)[..., :3]
+
+
+def test_linear_interpolates_between_marks():
+    np.testing.assert_allclose(_sample([0, .25, .5, .625, .75]),
+                               [(1, 0, 0), (.5, .5, 0), (0, 1, 0), (0, .5, .5), (0, 0, 1)])
+    # Every position against the scalar lerp of its two marks
+    rng = np.random.default_rng(0)
+    for pos in rng.uniform(0, .75, 50):
+        a, b = (GRADIENT[1], GRADIENT[0]) if pos < .5 else (GRADIENT[0], GRADIENT[2])
+        expected = color_utils.lerpColor(a[1], b[1], (pos - a[0]) / (b[0] - a[0]))
+        np.testing.assert_allclose(_sample(pos), expected)
+
+
+def test_constant_keeps_the_left_mark():
+    np.testing.assert_allclose(_sample([0, .49, .5, .74, .75], interpolation=GradientInterpolations.Constant),
+                               [(1, 0, 0), (1, 0, 0), (0, 1, 0), (0, 1, 0), (0, 0, 1)])
+
+
+def test_smooth_uses_smoothstep():
+    t = .25
+    smooth = t * t * (3 - 2 * t)
+    np.testing.assert_allclose(_sample(.125, interpolation=GradientInterpolations.Smooth), (1 - smooth, smooth, 0))
+    np.testing.assert_allclose(_sample([0, .5], interpolation=GradientInterpolations.Smooth), [(1, 0, 0), (0, 1, 0)])
+
+
+def test_positions_outside_wrap_or_clamp():
+    # Repeating, the last mark blends into the first one again
+    np.testing.assert_allclose(_sample([.875, 1.875, -.125, 1.25], repeating=True),
+                               [(.5, 0, .5), (.5, 0, .5), (.5, 0, .5), (.5, .5, 0)])
+    np.testing.assert_allclose(_sample([-1, .9, 2]), [(1, 0, 0), (0, 0, 1), (0, 0, 1)])
+
+
+def test_alpha_defaults_to_opaque_and_single_marks_fill():
+    colors = color_utils.sampleGradient([(.3, (.1, .2, .3))], np.zeros((2, 3)), True)
+    assert colors.shape == (2, 3, 4)
+    np.testing.assert_allclose(colors, np.broadcast_to((.1, .2, .3, 1), (2, 3, 4)))
+
+
+def test_get_color_in_gradient_matches_sample_gradient():
+    assert color_utils.getColorInGradient(GRADIENT, .625, False) == pytest.approx((0, .5, .5))
+    with pytest.raises(ValueError):
+        color_utils.getColorInGradient(GRADIENT, 1.5, False)
+
+
+def test_palette_cache_key_is_the_gradient_content():
+    palette = color_utils.gradientToPalette(GRADIENT)
+    assert palette.shape == (color_utils.COLOR_PALETTE_SAMPLES, 4) and palette.dtype == np.uint8
+    assert not palette.flags.writeable
+    assert (palette[:, 3] == 255).all()
+    # Equal content in other containers and number types is the same entry
+    same = [(pos, list(color)) for pos, color in GRADIENT]
+    same[1] = (0, (1, 0, 0))
+    assert color_utils.gradientToPalette(same) is palette
+    # Anything that changes the colors is another entry
+    changed = list(GRADIENT)
+    changed[0] = (.5, (0., .9, 0.))
+    assert color_utils.gradientToPalette(changed) is not palette
+    assert color_utils.gradientToPalette(GRADIENT, interpolation=GradientInterpolations.Smooth) is not palette
+    assert color_utils.gradientToPalette(GRADIENT, repeating=False) is not palette
+    assert color_utils.gradientToPalette(GRADIENT, 256).shape == (256, 4)
+
+
+def test_palette_matches_sampled_gradient():
+    samples = 64
+    palette = color_utils.gradientToPalette(GRADIENT, samples, True, GradientInterpolations.Linear)
+    expected = np.floor(color_utils.sampleGradient(GRADIENT, np.arange(samples) / samples, True)[:, :3] * 255)
+    np.testing.assert_array_equal(palette[:, :3], expected)
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+import cpu_render
+import fractals
+from fractal.transformation import Transformation
+
+VIEW = Transformation((-.5, 0.), 1.5)
+SIZE = (48, 27)
+ESCAPE_THRESHOLD = 100.
+# The array functions may round differently from py_func in the last bit, which chaotic orbits amplify over many iterations
+ITERATIONS = 24
+
+
+def _scalarEscapeTime(func, c: complex) -> int:
+    """The iteration count of a pixel, the way fractal() in main.frag counts them (z starts at c)."""
+    z = c
+    for it in range(ITERATIONS):
+        z = func(z, c)
+        if z.real*z.real + z.imag*z.imag > ESCAPE_THRESHOLD ** 2:
+            return it
+    return ITERATIONS
+
+
+@pytest.mark.parametrize("fractal", fractals.FRACTALS, ids=lambda f: f.name)
+def test_np_func_step_matches_py_func(fractal):
+    rng = np.random.default_rng(0)
+    z = rng.uniform(-2, 2, 200) + 1j * rng.uniform(-2, 2, 200)
+    c = rng.uniform(-2, 2, 200) + 1j * rng.uniform(-2, 2, 200)
+    expected = np.array([fractal.py_func(complex(a), complex(b)) for a, b in zip(z, c)])
+    np.testing.assert_allclose(fractal.np_func(z, c), expected, rtol=1e-12, atol=1e-12)
+
+
+@pytest.mark.parametrize("fractal", fractals.FRACTALS, ids=lambda f: f.name)
+def test_escape_time_matches_py_func(fractal):
+    c = cpu_render.pixelPositions(VIEW, SIZE)
+    iters, _ = cpu_render.escapeTime(fractal.np_func, c, ITERATIONS, ESCAPE_THRESHOLD)
+    expected = np.array([[_scalarEscapeTime(fractal.py_func, complex(p)) for p in row] for row in c])
+    np.testing.assert_array_equal(iters, expected)
+
+
+
+@pytest.mark.parametrize("fractal", [f for f in fractals.FRACTALS if f.simply_connected], ids=lambda f: f.name)
+def test_subdivision_matches_full_render(fractal):
+    size = (160, 90)
+    full = cpu_render.render(fractal, VIEW, size, ITERATIONS, ESCAPE_THRESHOLD, interior_detection=False)
+    subdivided = cpu_render.render(fractal, VIEW, size, ITERATIONS, ESCAPE_THRESHOLD, subdivide=True, interior_detection=False)
+    assert subdivided.skipped_pixels > 0
+    np.testing.assert_array_equal(subdivided.iterations, full.iterations)
@@ -0,0 +1,52 @@
+from decimal import Decimal, localcontext
+
+import numpy as np
+
+import cpu_render
+import deep_zoom
+from fractal.transformation import Transformation
+from settings import Precisions
+
+# A view where BLA with too large an epsilon skipped into the wrong iteration counts
+CENTER = ("-0.743643887037158704752191506114774", "0.131825904205311970493132056385139")
+SCALE = 1e-10
+SIZE = (64, 36)
+ITERATIONS = 2000
+ESCAPE_THRESHOLD = 1000.
+
+
+def _escapeTime(orbit: deep_zoom.ReferenceOrbit, epsilon: float) -> np.ndarray:
+    max_dc = SCALE * np.hypot(SIZE[0] / SIZE[1], 1)
+    dc = cpu_render.pixelPositions(Transformation((0, 0), SCALE), SIZE, Precisions.Double)
+    table = deep_zoom.BLATable(orbit, max_dc, epsilon)
+    return deep_zoom.perturbationEscapeTime(orbit, table, dc, ITERATIONS, ESCAPE_THRESHOLD)[0]
+
+
+def _decimalEscapeTime(c: tuple[Decimal, Decimal]) -> int:
+    """Iteration count of a single pixel, computed directly at arbitrary precision."""
+    threshold = Decimal(ESCAPE_THRESHOLD) ** 2
+    with localcontext() as ctx:
+        ctx.prec = deep_zoom.digitsForScale(SCALE)
+        zr = zi = Decimal(0)
+        for n in range(1, ITERATIONS + 2):
+            zr, zi = zr*zr - zi*zi + c[0], 2*zr*zi + c[1]
+            if n >= 2 and zr*zr + zi*zi > threshold:
+                return n - 2
+    return ITERATIONS
+
+
+def test_bla_matches_perturbation_without_bla():
+    orbit = deep_zoom.ReferenceOrbit(CENTER, ITERATIONS + 1, ESCAPE_THRESHOLD, deep_zoom.digitsForScale(SCALE))
+    exact = _escapeTime(orbit, 0.)  # no skip is ever usable
+    np.testing.assert_array_equal(_escapeTime(orbit, deep_zoom.BLA_EPSILON), exact)
+
+
+def test_perturbation_matches_decimal_orbit():
+    result = deep_zoom.render(CENTER, SCALE, SIZE, ITERATIONS, ESCAPE_THRESHOLD)
+    width, height = SIZE
+    pixel_size = Decimal(2 * SCALE) / height
+    for x, y in [(0, 0), (5, 30), (20, 11), (32, 18), (47, 3), (63, 35)]:
+        # Pixel centers, same as cpu_render.pixelPositions
+        c = (Decimal(CENTER[0]) + (x + Decimal("0.5") - Decimal(width) / 2) * pixel_size,
+             Decimal(CENTER[1]) - (y + Decimal("0.5") - Decimal(height) / 2) * pixel_size)
+        assert result.iterations[y, x] == _decimalEscapeTime(c), (x, y)
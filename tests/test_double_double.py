@@ -0,0 +1,90 @@
+from decimal import Decimal, localcontext
+import operator
+import random
+
+import numpy as np
+import pytest
+
+from double_double import DoubleDouble, ComplexDoubleDouble, splitDecimal
+
+# Double-double has about 106 bits, a few units of 2^-104 are allowed
+TOLERANCE = Decimal("1e-30")
+COUNT = 100
+
+# The complex operations on (real, imag) tuples of Decimals
+_COMPLEX_OPS = {
+    "add": lambda p, q: (p[0] + q[0], p[1] + q[1]),
+    "sub": lambda p, q: (p[0] - q[0], p[1] - q[1]),
+    "mul": lambda p, q: (p[0]*q[0] - p[1]*q[1], p[0]*q[1] + p[1]*q[0]),
+    "truediv": lambda p, q: ((p[0]*q[0] + p[1]*q[1]) / (q[0]*q[0] + q[1]*q[1]), (p[1]*q[0] - p[0]*q[1]) / (q[0]*q[0] + q[1]*q[1])),
+    "square": lambda p, q: (p[0]*p[0] - p[1]*p[1], 2*p[0]*p[1]),
+}
+
+
+def _randomDecimals(seed: int) -> list[Decimal]:
+    rng = random.Random(seed)
+    # 30 significant digits, more than a double holds, and magnitudes from 1e-5 to 1e5
+    return [Decimal(f"{rng.choice('+-')}{rng.randrange(10 ** 29, 10 ** 30)}e{rng.randint(-34, -24)}") for _ in range(COUNT)]
+
+
+def _toDoubleDouble(values: list[Decimal]) -> DoubleDouble:
+    hi, lo = zip(*map(splitDecimal, values))
+    return DoubleDouble(hi, lo)
+
+
+def _toDecimals(value: DoubleDouble) -> list[Decimal]:
+    with localcontext() as ctx:
+        ctx.prec = 80  # hi + lo is exact
+        return [Decimal(hi) + Decimal(lo) for hi, lo in zip(value.hi.tolist(), value.lo.tolist())]
+
+
+def _assertClose(actual: list[Decimal], expected: list[Decimal], scale: list[Decimal] = None):
+    """Relative to expected, or to scale where cancellation can make expected arbitrarily small."""
+    for i, (a, e) in enumerate(zip(actual, expected)):
+        reference = abs(e) if scale is None else scale[i]
+        assert abs(a - e) <= TOLERANCE * reference, f"{a} != {e}"
+
+
+@pytest.mark.parametrize("op", [operator.add, operator.sub, operator.mul, operator.truediv], ids=lambda op: op.__name__)
+def test_real_arithmetic_matches_decimal(op):
+    a, b = _randomDecimals(1), _randomDecimals(2)
+    with localcontext() as ctx:
+        ctx.prec = 80
+        expected = [op(x, y) for x, y in zip(a, b)]
+        # Adding numbers of opposite signs cancels, the error is relative to the operands then
+        scale = [abs(x) + abs(y) for x, y in zip(a, b)] if op in (operator.add, operator.sub) else None
+        _assertClose(_toDecimals(op(_toDoubleDouble(a), _toDoubleDouble(b))), expected, scale)
+
+
+def test_real_square_matches_decimal():
+    a = _randomDecimals(3)
+    with localcontext() as ctx:
+        ctx.prec = 80
+        _assertClose(_toDecimals(_toDoubleDouble(a).square()), [x * x for x in a])
+
+
+@pytest.mark.parametrize("name", _COMPLEX_OPS)
+def test_complex_arithmetic_matches_decimal(name):
+    a = list(zip(_randomDecimals(4), _randomDecimals(5)))
+    b = list(zip(_randomDecimals(6), _randomDecimals(7)))
+    x = ComplexDoubleDouble(_toDoubleDouble([re for re, _ in a]), _toDoubleDouble([im for _, im in a]))
+    y = ComplexDoubleDouble(_toDoubleDouble([re for re, _ in b]), _toDoubleDouble([im for _, im in b]))
+    result = x.square() if name == "square" else getattr(operator, name)(x, y)
+    with localcontext() as ctx:
+        ctx.prec = 80
+        expected = [_COMPLEX_OPS[name](p, q) for p, q in zip(a, b)]
+        # Relative to the magnitude of the result (of the operands for add and sub), one component alone may have cancelled
+        if name in ("add", "sub"):
+            scale = [abs(p[0]) + abs(p[1]) + abs(q[0]) + abs(q[1]) for p, q in zip(a, b)]
+        else:
+            scale = [abs(re) + abs(im) for re, im in expected]
+        _assertClose(_toDecimals(result.real), [re for re, _ in expected], scale)
+        _assertClose(_toDecimals(result.imag), [im for _, im in expected], scale)
+
+
+def test_split_decimal_keeps_digits_beyond_double():
+    value = Decimal("0.1234567890123456789012345678901")
+    hi, lo = splitDecimal(value)
+    assert hi == float(value)
+    assert abs(_toDecimals(DoubleDouble([hi], [lo]))[0] - value) < Decimal("1e-32")
+    np.testing.assert_array_equal(ComplexDoubleDouble.fromDecimal(value, -value).toComplex(), complex(hi, -hi))
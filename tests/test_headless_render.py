@@ -0,0 +1,43 @@
+import pytest
+
+import fractals
+from fractal.transformation import Transformation
+from settings import Settings, Precisions
+
+headless_render = pytest.importorskip("headless_render")
+
+SIZE = (32, 24)
+
+
+@pytest.fixture(scope="module")
+def renderer():
+    try:
+        renderer = headless_render.HeadlessRenderer(SIZE, Settings(), backend="egl")
+    except Exception as e:
+        pytest.skip(f"no standalone GL context: {e}")
+    yield renderer
+    renderer.close()
+
+
+def test_view_deeper_than_the_fixed_precision_is_refused(renderer):
+    renderer.settings.auto_precision = False
+    renderer.settings.precision = Precisions.Double
+    try:
+        with pytest.raises(ValueError, match="deeper"):
+            renderer.render(Transformation((-1.5, 0), 1e-20))
+        # The renderer itself keeps views it is given above what it can render
+        renderer.renderer.setView(Transformation((-1.5, 0), 1e-20))
+        assert renderer.renderer.scale == renderer.renderer.target_scale == Precisions.Double.min_scale
+    finally:
+        renderer.settings.auto_precision = True
+
+
+def test_view_deeper_than_the_fractal_allows_is_refused(renderer):
+    with pytest.raises(ValueError, match="Burning Ship"):
+        renderer.render(Transformation((-1.75, -.03), 1e-40), fractals.byName("Burning Ship"))
+
+
+def test_deep_view_finishes(renderer):
+    result = renderer.render(Transformation((-1.5, 0), 1e-20), fractals.byName("Mandelbrot"), max_frames=200)
+    assert result.finished
+    assert result.precision is Precisions.DoubleDouble
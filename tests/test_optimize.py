@@ -0,0 +1,55 @@
+import cmath
+import random
+import warnings
+
+import numpy as np
+import pytest
+
+import random_fractal_expression_generator
+from fractal.func import FractalFunction
+
+SEEDS = range(100)
+POINTS = 50
+
+
+def _generatedExpression(seed: int) -> str:
+    random.seed(seed)
+    random_fractal_expression_generator.DEBUG_PRINT = False
+    return random_fractal_expression_generator.genFractalExpression(1, .8)[0]
+
+
+def _unoptimized(expression: str, z: complex, c: complex) -> complex:
+    """The expression as written, in the namespace of the generated python function."""
+    namespace = FractalFunction._generateNameSpaceForExec()
+    return complex(eval(expression, namespace, {"z": z, "c": c}))
+
+
+def _close(a: complex, b: complex) -> bool:
+    return cmath.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_optimized_function_matches_expression(seed):
+    expression = _generatedExpression(seed)
+    function = FractalFunction(f"return {expression}")
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        function.resolve(compile_glsl=False)
+
+    rng = np.random.default_rng(seed)
+    z = rng.uniform(-2, 2, POINTS) + 1j * rng.uniform(-2, 2, POINTS)
+    c = rng.uniform(-2, 2, POINTS) + 1j * rng.uniform(-2, 2, POINTS)
+    with np.errstate(all="ignore"):
+        arrays = function.callArrays(z, c)
+    compared = 0
+    for i in range(POINTS):
+        try:
+            expected = _unoptimized(expression, complex(z[i]), complex(c[i]))
+        except (ArithmeticError, ValueError):
+            continue  # a pole, the optimized function may fail differently
+        if not cmath.isfinite(expected) or abs(expected) > 1e12:
+            continue  # near a pole, any rounding difference is amplified
+        compared += 1
+        assert _close(complex(function(complex(z[i]), complex(c[i]))), expected), expression
+        assert _close(complex(arrays[i]), expected), expression
+    assert compared > 0, expression
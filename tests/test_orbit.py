@@ -0,0 +1,115 @@
+import cmath
+import random
+from typing import Optional
+import warnings
+
+import numpy as np
+import pytest
+
+import fractals
+import random_fractal_expression_generator
+from fractal.func import FractalFunction
+from fractal.orbit import ORBIT_KERNEL_NAME, orbitKernel
+
+COUNT = 20
+ESCAPE_SQ = 1e4
+CONVERGE_SQ = 1e-20
+# Starting points, escaping ones and bounded ones
+POINTS = [complex(x, y) for x in np.linspace(-2, 1, 7) for y in np.linspace(-1.2, 1.2, 5)]
+
+
+def _steppedOrbit(step, c: complex) -> tuple[list[complex], Optional[Exception]]:
+    """step applied repeatedly from z = c, with the stopping rules of OrbitKernel, and the error that ended it."""
+    orbit = []
+    z = c
+    while len(orbit) < COUNT:
+        try:
+            new_z = step(z, c)
+        except (ArithmeticError, ValueError) as err:
+            return orbit, err
+        delta = new_z - z
+        # Written like the kernel's test, so NaN orbits don't stop either
+        if delta.real*delta.real + delta.imag*delta.imag < CONVERGE_SQ or new_z.real*new_z.real + new_z.imag*new_z.imag > ESCAPE_SQ:
+            break
+        z = new_z
+        orbit.append(z)
+    return orbit, None
+
+
+def _assertOrbitsMatch(kernel, func, **kwargs):
+    step_out = np.empty(1, dtype=np.complex128)
+
+    def kernelStep(z: complex, c: complex) -> complex:
+        n, error = kernel(z, c, step_out, 1, ESCAPE_SQ, CONVERGE_SQ, **kwargs)
+        if error is not None:
+            raise error
+        if n == 0:
+            return z  # stopped, so does _steppedOrbit
+        return complex(step_out[0])
+
+    out = np.empty(COUNT, dtype=np.complex128)
+    for c in POINTS:
+        # Every step of func's orbit is the same as func, up to rounding (z**3 isn't computed as z*z*z by python)
+        expected, error = _steppedOrbit(func, c)
+        for z, new_z in zip([c] + expected, expected):
+            try:
+                actual = kernelStep(z, c)
+            except OverflowError:
+                break  # beyond the float range, where complex and float arithmetic fail differently
+            if not (cmath.isfinite(actual) and cmath.isfinite(new_z)):
+                break
+            assert actual == pytest.approx(new_z, rel=1e-9, abs=1e-12), (c, z)
+        else:
+            if error is not None and not isinstance(error, OverflowError):
+                # A pole, the kernel fails there too
+                with pytest.raises((ArithmeticError, ValueError)):
+                    kernelStep(expected[-1] if expected else c, c)
+
+        # The whole orbit is the kernel's steps one after another, exactly (comparing it to func's orbit
+        # would amplify the rounding differences of chaotic orbits)
+        steps, step_error = _steppedOrbit(kernelStep, c)
+        if step_error is not None and not isinstance(step_error, ArithmeticError):
+            with pytest.raises(type(step_error)):
+                kernel(c, c, out, COUNT, ESCAPE_SQ, CONVERGE_SQ, **kwargs)
+            continue
+        n, error = kernel(c, c, out, COUNT, ESCAPE_SQ, CONVERGE_SQ, **kwargs)
+        # ArithmeticErrors are returned, with the iterations before them
+        assert type(error) is type(step_error)
+        np.testing.assert_array_equal(out[:n], steps)
+
+
+@pytest.mark.parametrize("fractal", fractals.FRACTALS, ids=lambda f: f.name)
+def test_orbit_kernel_matches_py_func(fractal):
+    # The built-in expressions are all lowered to float arithmetic
+    assert fractal.orbit_func.__name__ == ORBIT_KERNEL_NAME
+    _assertOrbitsMatch(fractal.orbit_func, fractal.py_func)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_generated_orbit_kernel_matches_func(seed):
+    random.seed(seed)
+    random_fractal_expression_generator.DEBUG_PRINT = False
+    expression = random_fractal_expression_generator.genFractalExpression(1, .8)[0]
+    function = FractalFunction(f"return {expression}")
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        function.resolve(compile_glsl=False)
+    _assertOrbitsMatch(function.orbit_func, function.func)
+
+
+def test_unsupported_expression_falls_back_to_step():
+    step = lambda z, c: z * z + c
+    kernel = orbitKernel("undefined_function(z) + c", step)
+    assert kernel.__name__ != ORBIT_KERNEL_NAME
+    _assertOrbitsMatch(kernel, step)
+
+
+
+@pytest.mark.parametrize("expression", ["1 / z + c", None], ids=["generated", "step"])
+def test_arithmetic_error_keeps_earlier_iterations(expression):
+    kernel = orbitKernel(expression, lambda z, c: 1 / z + c)
+    out = np.empty(COUNT, dtype=np.complex128)
+    # From z = 0.5 with c = -1: 1, then 0, then 1 / 0 fails
+    n, error = kernel(.5 + 0j, -1 + 0j, out, COUNT, ESCAPE_SQ, CONVERGE_SQ)
+    assert isinstance(error, ZeroDivisionError)
+    np.testing.assert_array_equal(out[:n], [1, 0])
@@ -0,0 +1,90 @@
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+import cpu_render
+import poster_render
+from fractal.transformation import Transformation
+from settings import Settings
+
+
+def _readPNG(data: bytes) -> np.ndarray:
+    """The pixels of an 8 bit RGB PNG without filters (what PNGWriter writes), checking every chunk's CRC."""
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    pos, chunks = 8, []
+    while pos < len(data):
+        length, chunk_type = struct.unpack(">I4s", data[pos:pos + 8])
+        chunk = data[pos + 8:pos + 8 + length]
+        assert struct.unpack(">I", data[pos + 8 + length:pos + 12 + length])[0] == zlib.crc32(chunk_type + chunk)
+        chunks.append((chunk_type, chunk))
+        pos += 12 + length
+    assert chunks[0][0] == b"IHDR" and chunks[-1] == (b"IEND", b"")
+    width, height, depth, color_type, compression, filtering, interlace = struct.unpack(">IIBBBBB", chunks[0][1])
+    assert (depth, color_type, compression, filtering, interlace) == (8, 2, 0, 0, 0)
+    rows = np.frombuffer(zlib.decompress(b"".join(c for t, c in chunks if t == b"IDAT")), dtype=np.uint8)
+    rows = rows.reshape(height, width * 3 + 1)
+    assert (rows[:, 0] == 0).all()
+    return rows[:, 1:].reshape(height, width, 3)
+
+
+def test_deep_poster_uses_double_double(tmp_path):
+    # Left of -2 pixels escape after a few dozen iterations, the real axis right of it is in the set,
+    # at this scale doubles can't tell the pixels apart
+    settings = Settings()
+    settings.iterations = 200
+    view = Transformation(("-2.000000000000000000005", "0"), 1e-20)
+    path = str(tmp_path / "deep.png")
+    poster_render.renderPoster(path, settings, view, (24, 16), workers=1, progress=False)
+    with open(path, "rb") as file:
+        image = _readPNG(file.read())
+    assert len(np.unique(image.reshape(-1, 3), axis=0)) > 2
+    np.testing.assert_array_equal(image, cpu_render.renderImage(settings, view, (24, 16)))
+
+
+def test_poster_deeper_than_double_double_is_refused(tmp_path):
+    path = tmp_path / "too_deep.png"
+    with pytest.raises(ValueError, match="scales below"):
+        poster_render.renderPoster(str(path), Settings(), Transformation(("-1.5", "0"), 1e-35), (8, 8), progress=False)
+    assert not path.exists()
+
+
+def _readTIFF(data: bytes) -> np.ndarray:
+    """The pixels of an uncompressed 8 bit RGB TIFF, following its strip offsets."""
+    assert data[:4] == b"II*\0"
+    ifd_offset = struct.unpack("<I", data[4:8])[0]
+    count = struct.unpack("<H", data[ifd_offset:ifd_offset + 2])[0]
+    tags = {}
+    for i in range(count):
+        entry = data[ifd_offset + 2 + i * 12:ifd_offset + 14 + i * 12]
+        tag, value_type, n = struct.unpack("<HHI", entry[:8])
+        fmt = {3: "H", 4: "I", 5: "I"}[value_type]
+        n_values = n * 2 if value_type == 5 else n
+        size = n_values * struct.calcsize(fmt)
+        values = entry[8:8 + size] if size <= 4 else data[struct.unpack("<I", entry[8:])[0]:][:size]
+        tags[tag] = struct.unpack(f"<{n_values}{fmt}", values)
+    width, height = tags[256][0], tags[257][0]
+    assert tags[258] == (8, 8, 8) and tags[259] == (1,) and tags[262] == (2,) and tags[277] == (3,)
+    strips = [data[offset:offset + length] for offset, length in zip(tags[273], tags[279])]
+    return np.frombuffer(b"".join(strips), dtype=np.uint8).reshape(height, width, 3)
+
+
+@pytest.mark.parametrize("writer_type, reader", [(poster_render.PNGWriter, _readPNG), (poster_render.TIFFWriter, _readTIFF)],
+                         ids=["png", "tiff"])
+@pytest.mark.parametrize("size", [(37, 23), (5, 1)])
+def test_writer_round_trips_pixels(tmp_path, writer_type, reader, size):
+    image = np.random.default_rng(0).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    path = tmp_path / "image"
+    with open(path, "wb") as file:
+        writer = writer_type(file, size)
+        # Written in uneven batches of rows, like the strips of a poster
+        for y in range(0, size[1], 7):
+            writer.writeRows(image[y:y + 7])
+        writer.close()
+    np.testing.assert_array_equal(reader(path.read_bytes()), image)
+
+
+def test_tiff_writer_refuses_images_over_4gb(tmp_path):
+    with open(tmp_path / "huge.tif", "wb") as file, pytest.raises(ValueError, match="4GB"):
+        poster_render.TIFFWriter(file, (40000, 40000))
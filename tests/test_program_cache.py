@@ -0,0 +1,64 @@
+import pytest
+
+from settings import Precisions
+
+fractal_render = pytest.importorskip("fractal_render")
+
+VERTEX = "void main() {}"
+
+
+class _Program:
+    def __init__(self, fragment_shader: str):
+        self.fragment_shader = fragment_shader
+        self.released = False
+
+    def release(self):
+        self.released = True
+
+
+class _Context:
+    """Only what ProgramCache uses of a moderngl context, counting the compiled programs."""
+    def __init__(self):
+        self.compiled = []
+
+    def program(self, vertex_shader: str, fragment_shader: str) -> _Program:
+        self.compiled.append(_Program(fragment_shader))
+        return self.compiled[-1]
+
+
+def test_programs_are_reused_by_key():
+    ctx = _Context()
+    cache = fractal_render.ProgramCache(ctx, capacity=4)
+    program = cache.program("mandelbrot", Precisions.Single, VERTEX, "a")
+    assert cache.program("mandelbrot", Precisions.Single, VERTEX, "a") is program
+    # Every part of the key makes another program
+    cache.program("burning_ship", Precisions.Single, VERTEX, "a")
+    cache.program("mandelbrot", Precisions.Double, VERTEX, "a")
+    cache.program("mandelbrot", Precisions.Single, VERTEX, "b")
+    assert len(ctx.compiled) == len(cache) == 4
+    assert (cache.hits, cache.misses) == (1, 4)
+
+
+def test_least_recently_used_program_is_released():
+    ctx = _Context()
+    cache = fractal_render.ProgramCache(ctx, capacity=2)
+    a = cache.program("a", Precisions.Single, VERTEX, "a")
+    b = cache.program("b", Precisions.Single, VERTEX, "b")
+    cache.program("a", Precisions.Single, VERTEX, "a")  # a is now the most recently used one
+    c = cache.program("c", Precisions.Single, VERTEX, "c")
+    assert b.released and not a.released and not c.released
+    assert len(cache) == 2
+    # b was evicted, so it is compiled again, which evicts a
+    assert cache.program("b", Precisions.Single, VERTEX, "b") is not b
+    assert a.released and not c.released
+    assert len(ctx.compiled) == 4
+
+
+def test_release_releases_every_program():
+    ctx = _Context()
+    cache = fractal_render.ProgramCache(ctx, capacity=3)
+    for name in "abc":
+        cache.program(name, Precisions.Single, VERTEX, name)
+    cache.release()
+    assert len(cache) == 0
+    assert all(program.released for program in ctx.compiled)
@@ -0,0 +1,93 @@
+import pytest
+
+from shader_modules import ShaderModules, ShaderModuleError
+
+MODULE_FILE = """\
+// Text before the first module is ignored
+#define NOT_A_MODULE
+
+// module: cx_sqr
+VEC2 cx_sqr(VEC2 z) { return cx_mul(z, z); }
+
+// module: cx_mul
+VEC2 cx_mul(VEC2 a, VEC2 b) { return VEC2(a.x*b.x - a.y*b.y, a.x*b.y + a.y*b.x); }
+
+// module: mandelbrot
+VEC2 mandelbrot(VEC2 z, VEC2 c) {
+    // cx_cube(z) isn't called, it's in a comment
+    return cx_add(cx_sqr(z), c);
+}
+
+// module: cx_add
+VEC2 cx_add(VEC2 a, VEC2 b) { return a + b; }
+
+// module: cx_cube
+VEC2 cx_cube(VEC2 z) { return cx_mul(cx_sqr(z), z); }
+"""
+
+
+def _modules() -> ShaderModules:
+    modules = ShaderModules()
+    modules.load(MODULE_FILE)
+    return modules
+
+
+def test_load_splits_module_file():
+    modules = _modules()
+    assert len(modules) == 5
+    assert "NOT_A_MODULE" not in modules.link(["cx_add"])
+    assert modules.link(["cx_add"]) == "VEC2 cx_add(VEC2 a, VEC2 b) { return a + b; }\n"
+
+
+def test_dependencies_ignore_comments_and_unknown_calls():
+    modules = _modules()
+    assert modules.dependencies("mandelbrot") == ["cx_add", "cx_sqr"]  # VEC2(...) and cx_cube in the comment aren't
+    assert modules.dependencies("cx_mul") == []
+
+
+def test_resolve_puts_dependencies_first():
+    modules = _modules()
+    order = modules.resolve(["mandelbrot"])
+    assert sorted(order) == ["cx_add", "cx_mul", "cx_sqr", "mandelbrot"]  # only the modules that are needed
+    for name in order:
+        for dependency in modules.dependencies(name):
+            assert order.index(dependency) < order.index(name)
+
+
+def test_resolve_includes_shared_dependencies_once():
+    order = _modules().resolve(["mandelbrot", "cx_cube", "cx_sqr"])
+    assert len(order) == len(set(order)) == 5
+    assert order.index("cx_mul") < order.index("cx_sqr") < order.index("cx_cube")
+
+
+def test_linked_source_follows_resolve_order():
+    modules = _modules()
+    source = modules.link(["cx_cube"])
+    positions = [source.index(f" {name}(") for name in modules.resolve(["cx_cube"])]
+    assert positions == sorted(positions)
+
+
+def test_circular_dependency_raises():
+    modules = _modules()
+    modules.add("cx_mul", "VEC2 cx_mul(VEC2 a, VEC2 b) { return cx_sqr(a) * b; }")
+    with pytest.raises(ShaderModuleError, match="cx_sqr -> cx_mul -> cx_sqr"):
+        modules.resolve(["mandelbrot"])
+
+
+def test_unknown_root_raises():
+    with pytest.raises(ShaderModuleError, match="Unknown shader module 'julia'"):
+        _modules().resolve(["julia"])
+
+
+def test_replaced_module_is_rescanned():
+    modules = _modules()
+    modules.resolve(["mandelbrot"])  # caches the calls
+    modules.add("mandelbrot", "VEC2 mandelbrot(VEC2 z, VEC2 c) { return cx_cube(z) + c; }")
+    assert modules.resolve(["mandelbrot"]) == ["cx_mul", "cx_sqr", "cx_cube", "mandelbrot"]
+
+
+def test_copy_is_independent():
+    modules = _modules()
+    copy = modules.copy()
+    copy.add("julia", "VEC2 julia(VEC2 z, VEC2 c) { return mandelbrot(z, c); }")
+    assert "julia" in copy and "julia" not in modules
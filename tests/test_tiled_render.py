@@ -0,0 +1,32 @@
+import numpy as np
+
+import cpu_render
+import fractals
+from fractal.transformation import Transformation
+from tiled_render import TiledRenderer
+
+VIEW = Transformation((-.5, 0.), 1.5)
+SIZE = (70, 45)  # not a multiple of the tile size
+ITERATIONS = 100
+ESCAPE_THRESHOLD = 100.
+
+
+def test_tiled_matches_single_process():
+    fractal = fractals.byName("Burning Ship")
+    expected = cpu_render.render(fractal, VIEW, SIZE, ITERATIONS, ESCAPE_THRESHOLD)
+    with TiledRenderer(2, tile_size=16) as renderer:
+        # Twice, so the second render reuses the workers and buffers of the first
+        for _ in range(2):
+            result = renderer.render(fractal, VIEW, SIZE, ITERATIONS, ESCAPE_THRESHOLD)
+            np.testing.assert_array_equal(result.iterations, expected.iterations)
+            escaped = expected.escaped
+            np.testing.assert_array_equal(result.z[escaped], expected.z[escaped])
+
+
+def test_tiled_subdivision_matches_single_process():
+    fractal = fractals.byName("Mandelbrot")
+    expected = cpu_render.render(fractal, VIEW, SIZE, ITERATIONS, ESCAPE_THRESHOLD, interior_detection=False)
+    with TiledRenderer(2, tile_size=16) as renderer:
+        result = renderer.render(fractal, VIEW, SIZE, ITERATIONS, ESCAPE_THRESHOLD, subdivide=True, interior_detection=False)
+    assert result.skipped_pixels > 0
+    np.testing.assert_array_equal(result.iterations, expected.iterations)
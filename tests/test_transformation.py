@@ -0,0 +1,46 @@
+import json
+import random
+from decimal import Decimal
+
+import pytest
+
+from fractal.transformation import Transformation
+
+DEEP_CENTER = ("-1.768610493014677074503175653270226520239677907588665494812",
+               "-0.002318262964184883214648046052337579154222143426214965112")
+
+
+def _roundTrip(view: Transformation) -> Transformation:
+    return Transformation.loadJson(json.loads(json.dumps(view.dumpJson())))
+
+
+@pytest.mark.parametrize("log_scale", [-55.3, -300.25, 0.1])
+def test_deep_view_round_trips_exactly(log_scale):
+    view = Transformation(DEEP_CENTER, log_scale=log_scale)
+    loaded = _roundTrip(view)
+    assert loaded.center == (Decimal(DEEP_CENTER[0]), Decimal(DEEP_CENTER[1]))
+    assert loaded.log_scale == log_scale
+    assert _roundTrip(loaded).dumpJson() == view.dumpJson()
+
+
+def test_float_scale_is_kept_exactly():
+    rng = random.Random(0)
+    for scale in [.3, 1.5, .1, 1e-12] + [rng.uniform(1e-15, 10) for _ in range(200)]:
+        view = Transformation.loadJson({"translation": [-0.5, 0.1], "scale": scale})  # a bookmark of before log_scale
+        assert view.scale == scale
+        assert _roundTrip(view).scale == scale
+        assert _roundTrip(view).center == (Decimal("-0.5"), Decimal("0.1"))
+
+
+def test_numeric_translations_are_read_from_their_repr():
+    view = Transformation.loadJson({"translation": [0.1, -0.7436438870371587], "log_scale": -3})
+    assert view.center == (Decimal("0.1"), Decimal("-0.7436438870371587"))
+    assert view.scale == pytest.approx(1e-3)
+
+
+def test_offset_between_deep_views_is_exact():
+    a = Transformation(DEEP_CENTER, log_scale=-50)
+    offset = (3e-51, -7.25e-52)
+    b = Transformation(a.offsetCenter(offset), log_scale=-50)
+    assert a.offsetTo(b) == offset
+    assert b.offsetTo(a) == (-offset[0], -offset[1])
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+import zoom_video
+from fractal.transformation import Transformation
+
+CENTER = ["-0.743643887037158704752191506114774", "0.131825904205311970493132056385139"]
+
+
+def _jobJson(fractal: str = "Mandelbrot", log_scale: float = -30, iterations: int = 30000) -> dict:
+    return {
+        "size": [24, 18], "fps": 1, "fractal": fractal, "settings": {"iterations": iterations},
+        "keyframes": [
+            {"time": 0, "translation": [-0.5, 0], "scale": 1.5},
+            {"time": 4, "translation": CENTER, "log_scale": log_scale},
+        ]
+    }
+
+
+def test_deep_frame_is_not_uniform():
+    # Far below what doubles (and double-double) resolve, rendered with perturbation
+    job = zoom_video.VideoJob.loadJson(_jobJson())
+    zoom_video._workerInit(job)
+    frame, data = zoom_video._renderFrame(job.frame_count - 1)
+    assert frame == job.frame_count - 1
+    pixels = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+    assert len(np.unique(pixels, axis=0)) > 10
+
+
+def test_keyframes_deeper_than_the_fractal_allows_are_rejected():
+    with pytest.raises(ValueError, match="Burning Ship"):
+        zoom_video.VideoJob.loadJson(_jobJson("Burning Ship", log_scale=-40))
+    zoom_video.VideoJob.loadJson(_jobJson("Burning Ship", log_scale=-20))
+
+
+def _keyframes(*views) -> list:
+    return [zoom_video.Keyframe(time, Transformation(translation, scale)) for time, translation, scale in views]
+
+
+def test_interpolate_view_keeps_the_zoom_point_fixed():
+    keyframes = _keyframes((0, (0, 0), 1), (10, (1, 0), .1))
+    # The point that is at the same place of the screen in both keyframes
+    fixed_x = 10 / 9
+    for t in (2.5, 5, 7.5):
+        view = zoom_video.interpolateView(keyframes, t)
+        assert view.log_scale == pytest.approx(-t / 10)
+        assert (fixed_x - float(view.center[0])) / view.scale == pytest.approx(fixed_x)
+        assert view.center[1] == 0
+
+
+def test_interpolate_view_between_equal_scales_is_linear():
+    keyframes = _keyframes((0, (0, 0), 1), (4, (2, -4), 1))
+    view = zoom_video.interpolateView(keyframes, 1)
+    assert (float(view.center[0]), float(view.center[1])) == pytest.approx((.5, -1))
+    assert view.log_scale == 0
+
+
+def test_interpolate_view_holds_the_first_and_last_keyframe():
+    keyframes = _keyframes((1, (0, 0), 1), (2, ("0.1234567890123456789012345678901", 0), 1e-25))
+    assert zoom_video.interpolateView(keyframes, 0) is keyframes[0].view
+    assert zoom_video.interpolateView(keyframes, 3) is keyframes[1].view
+    # Keyframe centers are kept at their precision
+    assert zoom_video.interpolateView(keyframes, 2).center == keyframes[1].view.center
+
+
+def test_completed_frames_stops_at_the_first_missing_frame(tmp_path):
+    for frame in (0, 1, 3):
+        (tmp_path / zoom_video.FRAME_NAME_FORMAT.format(frame)).touch()
+    (tmp_path / (zoom_video.FRAME_NAME_FORMAT.format(2) + ".tmp")).touch()  # interrupted while writing
+    assert zoom_video.completedFrames(str(tmp_path)) == 2
+
+
+def test_resume_only_continues_the_same_job(tmp_path):
+    dat = _jobJson(log_scale=-1, iterations=64)
+    dat["size"] = [8, 6]
+    job = zoom_video.VideoJob.loadJson(dat)
+    zoom_video.renderVideo(job, str(tmp_path), workers=1, progress=False)
+    assert zoom_video.completedFrames(str(tmp_path)) == job.frame_count == 5
+
+    last = tmp_path / zoom_video.FRAME_NAME_FORMAT.format(4)
+    data = last.read_bytes()
+    last.unlink()
+    zoom_video.renderVideo(zoom_video.VideoJob.loadJson(dat), str(tmp_path), workers=1, progress=False)
+    assert last.read_bytes() == data
+
+    dat["settings"]["iterations"] = 65
+    last.unlink()
+    with pytest.raises(ValueError, match="weren't rendered by this job"):
+        zoom_video.renderVideo(zoom_video.VideoJob.loadJson(dat), str(tmp_path), workers=1, progress=False)
+    assert not last.exists()
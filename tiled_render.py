@@ -0,0 +1,292 @@
+"""
+Multi-process tiled CPU renderer.
+
+Worker processes write their results straight into shared memory buffers, nothing but small task tuples is pickled.
+Tiles are handed out from one shared queue, and a worker that is still busy with a tile while other workers are idle
+splits the rest of its tile off for them, so slow (interior / boundary) tiles don't leave cores waiting.
+"""
+import multiprocessing as mp
+import os
+import time
+import traceback
+from dataclasses import dataclass
+from multiprocessing import shared_memory, resource_tracker
+from typing import Tuple, Optional, List
+
+import numpy as np
+
+import cpu_render
+import fractals
+from fractal.transformation import Transformation
+from settings import Precisions
+
+DEFAULT_TILE_SIZE = 64
+# Rows computed at once inside a tile, the split check is done between these
+BAND_ROWS = 8
+# Tiles are never split to be shorter than this
+MIN_SPLIT_ROWS = 16
+
+Rect = Tuple[int, int, int, int]  # x, y, width, height
+
+
+@dataclass(frozen=True)
+class _TileJob:
+    job_id: int
+    iterations_shm: str
+    z_shm: str
+    size: Tuple[int, int]
+    fractal: fractals.FractalType
+    view: Transformation
+    iterations: int
+    escape_threshold: float
+    precision: Precisions
+    subdivide: bool
+    periodicity_threshold: float
+    interior_detection: bool
+
+    @property
+    def z_dtype(self):
+        return np.complex128 if self.precision.uses_doubles else np.complex64
+
+
+class _SharedState:
+    """Everything shared between the renderer and its workers."""
+    def __init__(self, mp_ctx):
+        self.tasks = mp_ctx.Queue()
+        self.results = mp_ctx.Queue()
+        # Number of workers waiting for a task
+        self.idle = mp_ctx.Value("i", 0)
+        # Pixels filled in by rectangle subdivision in the current job
+        self.skipped = mp_ctx.Value("q", 0)
+
+    def pushTask(self, job: _TileJob, rect: Rect):
+        self.tasks.put((job, rect))
+
+
+class _AttachedJob:
+    def __init__(self, job: _TileJob):
+        self.job = job
+        self.view = job.view
+        self.kernel = cpu_render.resolveKernel(job.fractal)
+        self.interior_func = cpu_render.resolveInteriorFunc(job.fractal) if job.interior_detection else None
+        self.split_tasks = 0  # pushed while working on the current task, reported with its result
+        self._iterations_shm = shared_memory.SharedMemory(name=job.iterations_shm)
+        self._z_shm = shared_memory.SharedMemory(name=job.z_shm)
+        width, height = job.size
+        self.iterations = np.ndarray((height, width), dtype=np.int32, buffer=self._iterations_shm.buf)
+        self.z = np.ndarray((height, width), dtype=job.z_dtype, buffer=self._z_shm.buf)
+
+    def close(self):
+        del self.iterations, self.z
+        self._iterations_shm.close()
+        self._z_shm.close()
+
+
+def _renderTile(job: _AttachedJob, rect: Rect, shared: _SharedState):
+    x, y, width, height = rect
+    row, end_row = y, y + height
+    while row < end_row:
+        remaining = end_row - row
+        # Give the bottom half of what is left to the idle workers
+        if remaining >= MIN_SPLIT_ROWS * 2 and shared.idle.value > 0:
+            split_rows = remaining // 2
+            end_row -= split_rows
+            shared.pushTask(job.job, (x, end_row, width, split_rows))
+            job.split_tasks += 1
+            continue
+
+        # Subdivision works on the whole rectangle, so there is no splitting after it started
+        band = remaining if job.job.subdivide else min(BAND_ROWS, remaining)
+        c = cpu_render.pixelPositions(job.view, job.job.size, job.job.precision, (x, row, width, band))
+        if job.job.subdivide:
+            iters, z, skipped = cpu_render.subdivideEscapeTime(
+                job.kernel, c, job.job.iterations, job.job.escape_threshold, job.job.periodicity_threshold, job.interior_func
+            )
+            with shared.skipped.get_lock():
+                shared.skipped.value += skipped
+        else:
+            iters, z = cpu_render.escapeTime(
+                job.kernel, c, job.job.iterations, job.job.escape_threshold, None, job.job.periodicity_threshold, job.interior_func
+            )
+        job.iterations[row:row + band, x:x + width] = iters
+        job.z[row:row + band, x:x + width] = z
+        row += band
+
+
+def _workerMain(shared: _SharedState):
+    attached: Optional[_AttachedJob] = None
+    try:
+        while True:
+            with shared.idle.get_lock():
+                shared.idle.value += 1
+            task = shared.tasks.get()
+            with shared.idle.get_lock():
+                shared.idle.value -= 1
+            if task is None:
+                return
+
+            job, rect = task
+            error = None
+            split_tasks = 0
+            try:
+                if attached is None or attached.job.job_id != job.job_id:
+                    if attached is not None:
+                        attached.close()
+                        attached = None
+                    attached = _AttachedJob(job)
+                attached.split_tasks = 0
+                _renderTile(attached, rect, shared)
+            except Exception:
+                error = traceback.format_exc()
+            if attached is not None and attached.job.job_id == job.job_id:
+                split_tasks = attached.split_tasks
+            # Every task gets exactly one result, sent after the tasks split off from it were pushed
+            shared.results.put((job.job_id, error, split_tasks))
+    finally:
+        if attached is not None:
+            attached.close()
+
+
+def splitTiles(size: Tuple[int, int], tile_size: int) -> List[Rect]:
+    width, height = size
+    return [
+        (x, y, min(tile_size, width - x), min(tile_size, height - y))
+        for y in range(0, height, tile_size)
+        for x in range(0, width, tile_size)
+    ]
+
+
+class TiledRenderer:
+    """
+    A pool of worker processes rendering escape-time images tile by tile.
+    The workers are kept alive between renders, call close() (or use it as a context manager) when done.
+    """
+    def __init__(self, workers: int = None, tile_size: int = DEFAULT_TILE_SIZE):
+        self.workers = workers or os.cpu_count() or 1
+        self.tile_size = tile_size
+        mp_ctx = mp.get_context()
+        if os.name == "posix":
+            # The workers must share our resource tracker, otherwise attaching to a shared memory block in a worker
+            # starts a tracker for it, which unlinks the block when the worker exits
+            resource_tracker.ensure_running()
+        self._shared = _SharedState(mp_ctx)
+        self._processes = [mp_ctx.Process(target=_workerMain, args=(self._shared,), daemon=True) for _ in range(self.workers)]
+        for p in self._processes:
+            p.start()
+
+        self._job_cnt = 0
+        self._iterations_shm: Optional[shared_memory.SharedMemory] = None
+        self._z_shm: Optional[shared_memory.SharedMemory] = None
+
+    def _ensureBuffers(self, pixels: int):
+        iterations_bytes = pixels * np.dtype(np.int32).itemsize
+        z_bytes = pixels * np.dtype(np.complex128).itemsize
+        if self._iterations_shm is not None and self._iterations_shm.size >= iterations_bytes:
+            return
+        self._releaseBuffers()
+        self._iterations_shm = shared_memory.SharedMemory(create=True, size=iterations_bytes)
+        self._z_shm = shared_memory.SharedMemory(create=True, size=z_bytes)
+
+    def _releaseBuffers(self):
+        for shm in (self._iterations_shm, self._z_shm):
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self._iterations_shm = self._z_shm = None
+
+    def render(self, fractal: fractals.FractalType, view: Transformation, size: Tuple[int, int],
+               iterations: int, escape_threshold: float, precision: Precisions = Precisions.Double, subdivide: bool = False,
+               interior_detection: bool = True) -> cpu_render.EscapeTimeResult:
+        """Same as cpu_render.render, but spread across the worker processes (subdivision is done per tile)."""
+        assert self._processes, "The renderer is closed"
+        if precision is Precisions.Perturbation:
+            raise ValueError("The tiled renderer doesn't support perturbation, use deep_zoom.render")
+        width, height = size
+        self._ensureBuffers(width * height)
+        self._job_cnt += 1
+        job = _TileJob(
+            job_id=self._job_cnt,
+            iterations_shm=self._iterations_shm.name,
+            z_shm=self._z_shm.name,
+            size=(width, height),
+            fractal=fractal,
+            view=view,
+            iterations=iterations,
+            escape_threshold=escape_threshold,
+            precision=precision,
+            subdivide=subdivide and cpu_render.canSubdivide(fractal),
+            periodicity_threshold=fractals.periodicityThreshold(view.scale, height) if interior_detection else 0.,
+            interior_detection=interior_detection
+        )
+        self._shared.skipped.value = 0
+
+        tiles = splitTiles(size, self.tile_size)
+        for rect in tiles:
+            self._shared.pushTask(job, rect)
+
+        # Done once every task of the job has its result, the split off ones included
+        errors = []
+        pending = len(tiles)
+        while pending > 0:
+            job_id, error, split_tasks = self._shared.results.get()
+            if job_id != job.job_id:
+                continue  # left over from an interrupted render
+            pending += split_tasks - 1
+            if error is not None:
+                errors.append(error)
+        if errors:
+            raise RuntimeError(f"Tile rendering failed:\n{errors[0]}")
+
+        iters = np.ndarray((height, width), dtype=np.int32, buffer=self._iterations_shm.buf).copy()
+        z = np.ndarray((height, width), dtype=job.z_dtype, buffer=self._z_shm.buf).copy()
+        return cpu_render.EscapeTimeResult(iters, z, iterations, self._shared.skipped.value)
+
+    def close(self):
+        for _ in self._processes:
+            self._shared.tasks.put(None)
+        for p in self._processes:
+            p.join()
+        self._processes = []
+        self._releaseBuffers()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def benchmarkScaling(max_workers: int = None, size: Tuple[int, int] = (1920, 1080), iterations: int = 1024, repeats: int = 3):
+    """
+    Render the same (interior heavy) Mandelbrot view with 1, 2, 4, ... workers and print the speedup.
+    Only shows the scaling with at least max_workers cores, more workers than cores just share them.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers > (os.cpu_count() or 1):
+        print(f"Warning: {max_workers} workers on {os.cpu_count()} cores, the speedup is limited by the cores")
+    worker_counts = []
+    n = 1
+    while n < max_workers:
+        worker_counts.append(n)
+        n *= 2
+    worker_counts.append(max_workers)
+
+    fractal = fractals.byName("Mandelbrot")
+    view = Transformation((-.5, 0), 1.2)
+    base_time = None
+    print(f"{'workers':>8} {'time (s)':>10} {'speedup':>8} {'efficiency':>10}")
+    for workers in worker_counts:
+        with TiledRenderer(workers) as renderer:
+            renderer.render(fractal, view, (64, 64), 16, 1000.)  # warm up the workers
+            best = float("inf")
+            for _ in range(repeats):
+                start = time.perf_counter()
+                renderer.render(fractal, view, size, iterations, 1000.)
+                best = min(best, time.perf_counter() - start)
+        base_time = base_time or best
+        speedup = base_time / best
+        print(f"{workers:>8} {best:>10.3f} {speedup:>8.2f} {speedup / workers:>10.0%}")
+
+
+if __name__ == "__main__":
+    benchmarkScaling()
@@ -1,35 +1,69 @@
 import colorsys
+from enum import Enum
+from functools import lru_cache
 from typing import Tuple, Sequence, Callable
 
+import numpy as np
+
 # Color = Tuple[float, float, float, float] | Tuple[float, float, float]
 Color = Tuple[float, float, float, float]
 
 ColorGradient = Sequence[Tuple[float, Color]]
 ColorGradient.__doc__ = """List of color \"Key Frames\", which is a tuple of (<position> (0 to 1), <color> (tuple of 3 or 4 floats))."""
 
-#TODO: customizable gradient lerping methods
+COLOR_PALETTE_SAMPLES = 1024
+# Palettes of this many different gradients are kept (gradient edits produce a new one every frame)
+PALETTE_CACHE_SIZE = 32
+
+class GradientInterpolations(Enum):
+    Constant = 0  # the color of the mark on the left
+    Linear = 1
+    Smooth = 2  # smoothstep, no sharp bends at the marks
+
+GRADIENT_INTERP_NAMES = list(i.name for i in GradientInterpolations)
+
 def lerpColor(color_a: Color, color_b: Color, t: float) -> Color:
     t = max(min(t, 1), 0)
     # noinspection PyTypeChecker
     return tuple(a+(b-a)*t for a,b in zip(color_a, color_b))
 
-def getColorInGradient(gradient: ColorGradient, pos: float, repeating: bool) -> Color:
-    if not repeating:
-        if pos < 0 or pos > 1:
-            raise ValueError(f"Position out of range ({pos})")
-    else:
-        pos %= 1
-
-    if len(gradient) == 1:
-        return gradient[0][1]
-
-    last_mark = gradient[0]
-    for m in gradient[1:]:
-        if last_mark[0] <= pos <= m[0]:
-            return lerpColor(last_mark[1], m[1], (pos - last_mark[0]) / (m[0] - last_mark[0]) if m[0] != last_mark[0] else 0)
-        last_mark = m
+def sampleGradient(gradient: ColorGradient, pos: np.ndarray, repeating: bool,
+                   interpolation: GradientInterpolations = GradientInterpolations.Linear) -> np.ndarray:
+    """
+    Get the colors at many positions at once, returns float64 RGBA colors with the shape pos.shape + (4,).
+    Positions outside 0 to 1 wrap around if repeating, otherwise they get the color of the first or last mark.
+    """
+    marks = sorted(gradient, key=lambda m: m[0])
+    xs = np.array([m[0] for m in marks], dtype=np.float64)
+    colors = np.array([(*m[1], 1)[:4] for m in marks], dtype=np.float64)
+    pos = np.asarray(pos, dtype=np.float64)
     if repeating:
-        return lerpColor(last_mark[1], gradient[0][1], (pos - last_mark[0]) / ((gradient[0][0] + 1) - last_mark[0]))
+        # The first mark again after the last one, and everything moved into [first mark, first mark + 1)
+        xs = np.append(xs, xs[0] + 1)
+        colors = np.vstack((colors, colors[:1]))
+        pos = (pos - xs[0]) % 1 + xs[0]
+    if len(xs) == 1:
+        return np.broadcast_to(colors[0], pos.shape + (4,)).copy()
+
+    i = np.clip(np.searchsorted(xs, pos, side="right") - 1, 0, len(xs) - 2)
+    width = xs[i + 1] - xs[i]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(width > 0, (pos - xs[i]) / width, 0)
+    t = np.clip(t, 0, 1)
+    if interpolation == GradientInterpolations.Constant:
+        t = np.where(t < 1, 0., 1.)
+    elif interpolation == GradientInterpolations.Smooth:
+        t = t * t * (3 - 2 * t)
+    t = t[..., np.newaxis]
+    return colors[i] * (1 - t) + colors[i + 1] * t
+
+def getColorInGradient(gradient: ColorGradient, pos: float, repeating: bool,
+                       interpolation: GradientInterpolations = GradientInterpolations.Linear) -> Color:
+    if not repeating and (pos < 0 or pos > 1):
+        raise ValueError(f"Position out of range ({pos})")
+    color = sampleGradient(gradient, np.array(pos), repeating, interpolation)
+    # noinspection PyTypeChecker
+    return tuple(float(v) for v in color[:len(gradient[0][1])])
 
 def generateRainbowGradient(marks: int = 6) -> ColorGradient:
     return [(i/marks, (*colorsys.hsv_to_rgb(i/marks, 1, 1), 1)) for i in range(marks)]
@@ -37,3 +71,21 @@ def generateRainbowGradient(marks: int = 6) -> ColorGradient:
 def gradientFromFunc(marks: int, repeating: bool, func: Callable[[float], Color]):
     div = marks if repeating else (marks - 1)
     return [(i/div, func(i/div)) for i in range(marks)]
+
+def gradientToPalette(gradient: ColorGradient, samples: int = COLOR_PALETTE_SAMPLES, repeating: bool = True,
+                      interpolation: GradientInterpolations = GradientInterpolations.Linear) -> np.ndarray:
+    """
+    Sample the gradient into a (samples, 4) uint8 RGBA table, this is the data of the color palette texture.
+    Alpha is always 255. Results are cached by the gradient's content, the returned array is read-only.
+    """
+    key = tuple((float(pos), tuple(float(v) for v in color)) for pos, color in gradient)
+    return _cachedPalette(key, samples, repeating, interpolation)
+
+@lru_cache(maxsize=PALETTE_CACHE_SIZE)
+def _cachedPalette(gradient: Tuple[Tuple[float, Color], ...], samples: int, repeating: bool,
+                   interpolation: GradientInterpolations) -> np.ndarray:
+    colors = sampleGradient(gradient, np.arange(samples) / samples, repeating, interpolation)
+    data = np.full(shape=(samples, 4), fill_value=255, dtype=np.uint8)
+    data[:, :3] = np.clip(np.floor(colors[:, :3] * 255), 0, 255)
+    data.flags.writeable = False
+    return data
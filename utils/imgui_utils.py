@@ -1,13 +1,14 @@
 from typing import List, Tuple
 from dataclasses import dataclass
 
+import numpy as np
 from imgui_bundle import imgui
 from gdmath import Vec2
 
 if __name__ == '__main__':
-    from color_utils import Color, ColorGradient, getColorInGradient
+    from color_utils import Color, ColorGradient, GradientInterpolations, getColorInGradient, sampleGradient
 else:
-    from utils.color_utils import Color, ColorGradient, getColorInGradient
+    from utils.color_utils import Color, ColorGradient, GradientInterpolations, getColorInGradient, sampleGradient
 
 def colorU32(color: Color):
     if len(color) == 3:
@@ -24,30 +25,27 @@ class _ColorMark:
 
 
 # noinspection PyTypeChecker
-def drawGradient(gradient: ColorGradient, repeating: bool, x0, y0, x1, y1, border: bool = True):
+def drawGradient(gradient: ColorGradient, repeating: bool, x0, y0, x1, y1, border: bool = True,
+                 interpolation: GradientInterpolations = GradientInterpolations.Linear, segment_width: float = 4):
+    """Draw the gradient as horizontal color ramps between samples taken every segment_width pixels (and at the marks)."""
     draw_list = imgui.get_window_draw_list()
     width = x1 - x0
-    last_color = None
-    last_pos = None
-    for mark in gradient:
-        if last_color is not None:
-            # Draw gradient rects
-            col0 = colorU32(last_color)
-            col1 = colorU32(mark[1])
-            draw_list.add_rect_filled_multi_color(
-                (x0 + width * last_pos, y0),
-                (x0 + width * mark[0], y1),
-                col0, col1, col1, col0)
-        last_color = mark[1]
-        last_pos = mark[0]
-
-    # Draw the last part of the gradient
-    col0 = colorU32(last_color)
-    col1 = col0 if not repeating else colorU32(gradient[0][1])
-    draw_list.add_rect_filled_multi_color(
-        (x0 + width * last_pos, y0),
-        (x1, y1),
-        col0, col1, col1, col0)
+    segments = max(1, int(width / segment_width))
+    # Sampling at the marks too keeps sharp edges (constant interpolation) sharp
+    positions = np.unique(np.concatenate((np.linspace(0, 1, segments + 1), [m[0] for m in gradient if 0 <= m[0] <= 1])))
+    colors = sampleGradient(gradient, positions, repeating, interpolation)
+    if interpolation == GradientInterpolations.Constant:
+        # Ramps would blend the steps, every segment gets the color at its start
+        colors_end = colors[:-1]
+    else:
+        colors_end = colors[1:]
+    for i in range(len(positions) - 1):
+        col0 = colorU32(tuple(colors[i]))
+        col1 = colorU32(tuple(colors_end[i]))
+        draw_list.add_rect_filled_multi_color(
+            (x0 + width * positions[i], y0),
+            (x0 + width * positions[i + 1], y1),
+            col0, col1, col1, col0)
 
     # Draw outer frame of the gradient
     if border:
@@ -65,6 +63,7 @@ class ColorGradientEdit:
     """
 
     def __init__(self, identifier: str, gradient: ColorGradient, repeating: bool = False, alpha=False,
+                 interpolation: GradientInterpolations = GradientInterpolations.Linear,
                  color_edit_flags: int = imgui.ColorEditFlags_.uint8.value | imgui.ColorEditFlags_.display_rgb.value | imgui.ColorEditFlags_.input_rgb.value | imgui.ColorEditFlags_.picker_hue_bar.value):
         """:param gradient: the initial gradient, there must be at least one element in it, and there must be one at position 0. If not repeating, there must also be one at position 1."""
 
@@ -80,6 +79,7 @@ class ColorGradientEdit:
 
         self._id = identifier
         self._repeating = repeating
+        self.interpolation = interpolation
         self._color_edit_flags = color_edit_flags | imgui.ColorEditFlags_.no_side_preview
 
         self._marks: List[_ColorMark] = []
@@ -249,7 +249,7 @@ class ColorGradientEdit:
         modified = False
 
         gradient = self.gradient
-        drawGradient(gradient, self._repeating, *pos0, *pos1)
+        drawGradient(gradient, self._repeating, *pos0, *pos1, interpolation=self.interpolation)
 
         # To avoid deadlocks
         if imgui.is_mouse_released(imgui.MouseButton_.left):
@@ -282,7 +282,7 @@ class ColorGradientEdit:
         popup_id = f"{self._id}.gradient_popup"
         hovering_grad = imgui.is_mouse_hovering_rect((*pos0,), (*pos1,))
         hovering_pos = (imgui.get_mouse_pos().x - pos0.x) / width
-        hovering_color = getColorInGradient(gradient, hovering_pos, self._repeating)
+        hovering_color = getColorInGradient(gradient, hovering_pos, self._repeating, self.interpolation)
         if self._dragging_mark is None and self._editing_mark is None:
             if hovering_grad:
                 # Addd new mark
@@ -296,7 +296,7 @@ class ColorGradientEdit:
 
         if imgui.begin_popup(popup_id):
             if imgui.menu_item("Add Mark", None, False)[0]:
-                self._marks.append(_ColorMark(self._clicked_pos, getColorInGradient(gradient, self._clicked_pos, self._repeating)))
+                self._marks.append(_ColorMark(self._clicked_pos, getColorInGradient(gradient, self._clicked_pos, self._repeating, self.interpolation)))
                 modified = True
             if imgui.menu_item("Spread Evenly", None, False)[0]:
                 total = len(self._marks) + (0 if self._repeating else -1)
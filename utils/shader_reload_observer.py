@@ -5,6 +5,7 @@ import win32gui
 MONITORED_FILES = (
     "shaders\\main.vert",
     "shaders\\main.frag",
+    "shaders\\fractals.glsl",
     "shaders\\path.vert",
     "shaders\\path.frag",
 )
@@ -0,0 +1,295 @@
+"""
+Offline zoom video renderer (CPU).
+
+Camera keyframes are interpolated (exponentially in scale), the frames are rendered in parallel by worker processes
+and written in order as numbered PNGs, or piped into a video encoder as raw RGB frames.
+A job writing numbered frames that gets interrupted continues after the last frame that was written.
+
+Job files are JSON:
+    {
+        "size": [1920, 1080], "fps": 30, "supersample": 2, "fractal": "Mandelbrot",
+        "settings": {"iterations": 20000},
+        "keyframes": [
+            {"time": 0, "translation": [-0.5, 0], "scale": 1.5},
+            {"time": 20, "translation": ["-0.743643887037158704752191506114774", "0.131825904205311970493132056385139"],
+             "log_scale": -20}
+        ]
+    }
+
+Translations can be strings to give them at any precision, and scales can be given as log_scale (log10 of the scale).
+Every frame is rendered in the precision its scale needs (see cpu_render.viewPrecision), Mandelbrot zooms below
+double-double use perturbation (deep_zoom.py), the other fractals can't go deeper than double-double.
+The settings a job can set are the ones in JOB_SETTINGS, color_palette is a list of [position, [r, g, b]] marks and
+color_interpolation the name of a GradientInterpolations.
+
+    python zoom_video.py job.json frames/
+    python zoom_video.py job.json --pipe "ffmpeg -y -f rawvideo -pix_fmt rgb24 -s 1920x1080 -r 30 -i - zoom.mp4"
+"""
+import argparse
+import bisect
+import hashlib
+import json
+import math
+import multiprocessing as mp
+import os
+import shlex
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from typing import List, Tuple, Optional, Dict
+
+import numpy as np
+
+import cpu_render
+import fractals
+from fractal.transformation import Transformation
+from poster_render import PNGWriter
+from settings import Settings, Precisions
+from utils import color_utils
+
+FRAME_NAME_FORMAT = "frame_{:06d}.png"
+# Written next to the frames, a directory is only resumed by the job that wrote its frames
+JOB_HASH_NAME = "job.sha1"
+# Frames that may be rendered ahead of the next one to be written, per worker
+REORDER_WINDOW_PER_WORKER = 4
+
+
+def _loadBool(value: bool) -> bool:
+    if not isinstance(value, bool):
+        raise TypeError("not a boolean")
+    return value
+
+
+def _loadPalette(value: list) -> color_utils.ColorGradient:
+    return [(float(pos), tuple(float(c) for c in color)) for pos, color in value]
+
+# Settings used by the video renderer, with the conversions of their JSON values
+JOB_SETTINGS = {
+    "iterations": int,
+    "render_escape_threshold": float,
+    "interior_detection": _loadBool,
+    "color_palette": _loadPalette,
+    "color_interpolation": lambda name: color_utils.GradientInterpolations[name],
+    "color_change_speed": float,
+}
+
+
+@dataclass(frozen=True)
+class Keyframe:
+    time: float  # seconds
+    view: Transformation
+
+    @classmethod
+    def loadJson(cls, dat: dict):
+        return cls(dat["time"], Transformation.loadJson(dat))
+
+
+def interpolateView(keyframes: List[Keyframe], t: float) -> Transformation:
+    """
+    The camera at time t, keyframes must be sorted by time.
+    The scale is interpolated exponentially, and the translation moves so the zoom is centered on a fixed point of the
+    screen (between keyframes of the same scale it moves linearly instead).
+    """
+    if t <= keyframes[0].time:
+        return keyframes[0].view
+    if t >= keyframes[-1].time:
+        return keyframes[-1].view
+    i = bisect.bisect_right([k.time for k in keyframes], t)
+    a, b = keyframes[i - 1].view, keyframes[i].view
+    f = (t - keyframes[i - 1].time) / (keyframes[i].time - keyframes[i - 1].time)
+    log_scale = a.log_scale + (b.log_scale - a.log_scale) * f
+    if math.isclose(a.log_scale, b.log_scale):
+        remaining = 1 - f
+    else:
+        # Scales relative to a's, so it works for scales below what doubles can hold
+        scale, b_scale = 10 ** (log_scale - a.log_scale), 10 ** (b.log_scale - a.log_scale)
+        remaining = (scale - b_scale) / (1 - b_scale)
+    # The center is placed relative to b, the rounding error of the offset shrinks with the scale when zooming into b
+    dx, dy = b.offsetTo(a)
+    return Transformation(b.offsetCenter((dx * remaining, dy * remaining)), log_scale=log_scale)
+
+
+@dataclass
+class VideoJob:
+    keyframes: List[Keyframe]
+    size: Tuple[int, int]
+    fps: float
+    settings: Settings
+    supersample: int = 1
+
+    @property
+    def frame_count(self) -> int:
+        return math.floor((self.keyframes[-1].time - self.keyframes[0].time) * self.fps) + 1
+
+    def frameView(self, frame: int) -> Transformation:
+        return interpolateView(self.keyframes, self.keyframes[0].time + frame / self.fps)
+
+    @property
+    def hash(self) -> str:
+        """Of everything that affects the frames."""
+        settings = self.settings
+        dat = {
+            "keyframes": [(k.time, k.view.dumpJson()) for k in self.keyframes],
+            "size": self.size, "fps": self.fps, "supersample": self.supersample,
+            "fractal": (settings.fractal.name, settings.fractal.py_expression),
+            "settings": {name: getattr(settings, name) for name in JOB_SETTINGS},
+        }
+        dat["settings"]["color_interpolation"] = settings.color_interpolation.name
+        return hashlib.sha1(json.dumps(dat, sort_keys=True).encode()).hexdigest()
+
+    @classmethod
+    def loadJson(cls, dat: dict):
+        settings = Settings()
+        settings.fractal = fractals.byName(dat.get("fractal", "Mandelbrot"))
+        for name, value in dat.get("settings", {}).items():
+            if name not in JOB_SETTINGS:
+                raise ValueError(f"Unsupported setting '{name}', jobs can set {', '.join(JOB_SETTINGS)}")
+            try:
+                setattr(settings, name, JOB_SETTINGS[name](value))
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f"Invalid value of setting '{name}': {value!r}") from e
+        keyframes = sorted((Keyframe.loadJson(k) for k in dat["keyframes"]), key=lambda k: k.time)
+        deepest = Precisions.Perturbation if settings.fractal.perturbation else Precisions.DoubleDouble
+        if any(k.view.log_scale < math.log10(deepest.min_scale) for k in keyframes):
+            raise ValueError(f"{settings.fractal.name} can't be rendered at scales below {deepest.min_scale:g}")
+        return cls(keyframes, tuple(dat["size"]), dat.get("fps", 30), settings, dat.get("supersample", 1))
+
+
+_worker_job: Optional[VideoJob] = None
+_worker_palette: Optional[np.ndarray] = None
+
+
+def _workerInit(job: VideoJob):
+    global _worker_job, _worker_palette
+    _worker_job = job
+    _worker_palette = cpu_render.settingsPalette(job.settings)
+
+
+def _renderFrame(frame: int) -> Tuple[int, bytes]:
+    job, settings, ss = _worker_job, _worker_job.settings, _worker_job.supersample
+    width, height = job.size
+    view = job.frameView(frame)
+    result = cpu_render.render(
+        settings.fractal, view, (width * ss, height * ss), settings.iterations, settings.render_escape_threshold,
+        cpu_render.viewPrecision(settings, view, height * ss), cpu_render.canSubdivide(settings.fractal), settings.interior_detection
+    )
+    colors = cpu_render.colorize(result, _worker_palette, settings.color_change_speed)
+    colors = colors.reshape(height, ss, width, ss, 3).mean(axis=(1, 3))
+    return frame, cpu_render.toRGB8(colors).tobytes()
+
+
+def completedFrames(directory: str) -> int:
+    """Frames are written in order, so the frames before the first missing one are complete."""
+    frame = 0
+    while os.path.exists(os.path.join(directory, FRAME_NAME_FORMAT.format(frame))):
+        frame += 1
+    return frame
+
+
+def _writeFramePNG(directory: str, frame: int, data: bytes, size: Tuple[int, int]):
+    path = os.path.join(directory, FRAME_NAME_FORMAT.format(frame))
+    # Written under a temporary name first, so an interrupted write never looks like a complete frame
+    with open(path + ".tmp", "wb") as file:
+        writer = PNGWriter(file, size)
+        writer.writeRows(np.frombuffer(data, dtype=np.uint8).reshape(size[1], size[0], 3))
+        writer.close()
+    os.replace(path + ".tmp", path)
+
+
+def renderVideo(job: VideoJob, directory: str = None, pipe_command: str = None, workers: int = None, progress: bool = True):
+    """
+    Render all frames of a job, into numbered PNGs in a directory (resuming after the frames that already exist there),
+    or into the stdin of an encoder command as raw rgb24 frames.
+    """
+    assert (directory is None) != (pipe_command is None), "Either a directory or a pipe command is needed"
+    workers = workers or os.cpu_count() or 1
+    total = job.frame_count
+    first = 0
+    encoder: Optional[subprocess.Popen] = None
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+        first = completedFrames(directory)
+        hash_path = os.path.join(directory, JOB_HASH_NAME)
+        if first > 0:
+            written_hash = None
+            if os.path.exists(hash_path):
+                with open(hash_path) as file:
+                    written_hash = file.read().strip()
+            if written_hash != job.hash:
+                raise ValueError(f"The frames in {directory} weren't rendered by this job, use another directory")
+            if progress:
+                print(f"Resuming after {first} completed frames", file=sys.stderr)
+        else:
+            with open(hash_path, "w") as file:
+                file.write(job.hash)
+    else:
+        encoder = subprocess.Popen(shlex.split(pipe_command), stdin=subprocess.PIPE)
+
+    start = time.perf_counter()
+    next_submit = next_write = first
+    reorder_buffer: Dict[int, bytes] = {}
+    window = workers * REORDER_WINDOW_PER_WORKER
+    with mp.get_context().Pool(workers, _workerInit, (job,)) as pool:
+        pending = []
+
+        def submit():
+            nonlocal next_submit
+            # Only a limited number of frames ahead of the next one to write, so the reorder buffer stays small
+            while next_submit < total and next_submit < next_write + window:
+                pending.append(pool.apply_async(_renderFrame, (next_submit,)))
+                next_submit += 1
+
+        submit()
+        while next_write < total:
+            finished = [p for p in pending if p.ready()]
+            if not finished:
+                pending[0].wait(.05)
+                continue
+            for p in finished:
+                pending.remove(p)
+                frame, data = p.get()
+                reorder_buffer[frame] = data
+
+            while next_write in reorder_buffer:
+                data = reorder_buffer.pop(next_write)
+                if encoder is not None:
+                    encoder.stdin.write(data)
+                else:
+                    _writeFramePNG(directory, next_write, data, job.size)
+                next_write += 1
+            submit()
+
+            if progress:
+                elapsed = time.perf_counter() - start
+                rate = (next_write - first) / elapsed
+                print(f"\rFrame {next_write}/{total}  {rate:.2f} frames/s  {len(reorder_buffer)} buffered",
+                      end="", file=sys.stderr, flush=True)
+
+    if encoder is not None:
+        encoder.stdin.close()
+        encoder.wait()
+    if progress:
+        print(f"\rRendered {total - first} frames in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a keyframed zoom video (see the module docstring for the job format).")
+    parser.add_argument("job", help="job file (JSON)")
+    parser.add_argument("output", nargs="?", help="directory for the numbered frames")
+    parser.add_argument("--pipe", help="encoder command that reads raw rgb24 frames from stdin, instead of writing frames")
+    parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    args = parser.parse_args()
+    if (args.output is None) == (args.pipe is None):
+        parser.error("give either an output directory or --pipe")
+
+    try:
+        with open(args.job) as file:
+            job = VideoJob.loadJson(json.load(file))
+        renderVideo(job, args.output, args.pipe, args.workers)
+    except ValueError as e:
+        parser.exit(1, f"error: {e}\n")
+
+
+if __name__ == "__main__":
+    main()